@@ -7,8 +7,9 @@ use crate::entries::{
     calc_next_entry_short,
 };
 use crate::types::{
-    Analysis, BacktestParams, BotParams, BotParamsPair, EMABands, ExchangeParams, Fill, Order,
-    OrderBook, OrderType, Position, Positions, StateParams, TrailingPriceBundle,
+    hlcv, AbortThresholds, Analysis, BacktestParams, BotParams, BotParamsPair, CoinMap, CoinSet,
+    EMABands, EquityCurve, EquitySampling, ExchangeParams, Fill, HlcvsElement, Order, OrderBook,
+    OrderType, Position, Positions, StateParams, TrailingPriceBundle,
 };
 use crate::utils::{
     calc_auto_unstuck_allowance, calc_new_psize_pprice, calc_pnl_long, calc_pnl_short,
@@ -17,7 +18,7 @@ use crate::utils::{
 };
 use ndarray::{s, Array1, Array2, Array3, Array4, ArrayView3, Axis, Dim, ViewRepr};
 use std::cmp::Ordering;
-use std::collections::{HashMap, HashSet};
+use std::collections::HashMap;
 
 #[derive(Clone, Default, Copy, Debug)]
 pub struct EmaAlphas {
@@ -71,8 +72,17 @@ impl EMAs {
 
 #[derive(Debug, Default)]
 pub struct OpenOrdersNew {
-    pub long: HashMap<usize, OpenOrderBundleNew>,
-    pub short: HashMap<usize, OpenOrderBundleNew>,
+    pub long: CoinMap<OpenOrderBundleNew>,
+    pub short: CoinMap<OpenOrderBundleNew>,
+}
+
+impl OpenOrdersNew {
+    fn new(n_coins: usize) -> Self {
+        OpenOrdersNew {
+            long: CoinMap::new(n_coins),
+            short: CoinMap::new(n_coins),
+        }
+    }
 }
 
 #[derive(Debug, Default)]
@@ -83,20 +93,48 @@ pub struct OpenOrderBundleNew {
 
 #[derive(Default, Debug)]
 pub struct Actives {
-    long: HashSet<usize>,
-    short: HashSet<usize>,
+    long: CoinSet,
+    short: CoinSet,
+}
+
+impl Actives {
+    fn new(n_coins: usize) -> Self {
+        Actives {
+            long: CoinSet::new(n_coins),
+            short: CoinSet::new(n_coins),
+        }
+    }
 }
 
 #[derive(Default, Debug)]
 pub struct IsStuck {
-    long: HashSet<usize>,
-    short: HashSet<usize>,
+    long: CoinSet,
+    short: CoinSet,
+}
+
+impl IsStuck {
+    fn new(n_coins: usize) -> Self {
+        IsStuck {
+            long: CoinSet::new(n_coins),
+            short: CoinSet::new(n_coins),
+        }
+    }
 }
 
+/// Trailing price bundles indexed by coin. Every coin has one, reset to default when unused.
 #[derive(Default, Debug)]
 pub struct TrailingPrices {
-    pub long: HashMap<usize, TrailingPriceBundle>,
-    pub short: HashMap<usize, TrailingPriceBundle>,
+    pub long: Vec<TrailingPriceBundle>,
+    pub short: Vec<TrailingPriceBundle>,
+}
+
+impl TrailingPrices {
+    fn new(n_coins: usize) -> Self {
+        TrailingPrices {
+            long: vec![TrailingPriceBundle::default(); n_coins],
+            short: vec![TrailingPriceBundle::default(); n_coins],
+        }
+    }
 }
 
 pub struct TrailingEnabled {
@@ -109,15 +147,74 @@ pub struct TradingEnabled {
     short: bool,
 }
 
-pub struct RollingVolumeSum {
-    long: Vec<f64>,
-    short: Vec<f64>,
-    prev_k_long: usize,
-    prev_k_short: usize,
+/// Per coin sums of volume and noisiness ((high - low) / close) over the window
+/// [prev_k - window, prev_k). Updated by adding the rows entering the window and subtracting
+/// the rows leaving it. Recomputed from scratch each time the window has fully rolled over,
+/// which keeps floating point drift bounded at amortized O(n_coins) cost per minute.
+pub struct RollingSums {
+    volume: Vec<f64>,
+    noisiness: Vec<f64>,
+    prev_k: usize,
+    steps_since_recompute: usize,
 }
 
-pub struct Backtest<'a> {
-    hlcvs: &'a ArrayView3<'a, f64>,
+impl RollingSums {
+    fn new(n_coins: usize) -> Self {
+        RollingSums {
+            volume: vec![0.0; n_coins],
+            noisiness: vec![0.0; n_coins],
+            prev_k: 0,
+            steps_since_recompute: 0,
+        }
+    }
+
+    fn add_row<T: HlcvsElement>(&mut self, hlcvs: &ArrayView3<T>, i: usize, sign: f64) {
+        for idx in 0..self.volume.len() {
+            self.volume[idx] += sign * hlcv(hlcvs, i, idx, VOLUME);
+            self.noisiness[idx] += sign * (hlcv(hlcvs, i, idx, HIGH) - hlcv(hlcvs, i, idx, LOW))
+                / hlcv(hlcvs, i, idx, CLOSE);
+        }
+    }
+
+    fn update<T: HlcvsElement>(&mut self, hlcvs: &ArrayView3<T>, k: usize, window: usize) {
+        if k <= self.prev_k {
+            return;
+        }
+        let start_k = k.saturating_sub(window);
+        let n_steps = k - self.prev_k;
+        if self.steps_since_recompute + n_steps >= window {
+            self.volume.iter_mut().for_each(|x| *x = 0.0);
+            self.noisiness.iter_mut().for_each(|x| *x = 0.0);
+            for i in start_k..k {
+                self.add_row(hlcvs, i, 1.0);
+            }
+            self.steps_since_recompute = 0;
+        } else {
+            let prev_start_k = self.prev_k.saturating_sub(window);
+            for i in self.prev_k..k {
+                self.add_row(hlcvs, i, 1.0);
+            }
+            for i in prev_start_k..start_k {
+                self.add_row(hlcvs, i, -1.0);
+            }
+            self.steps_since_recompute += n_steps;
+        }
+        self.prev_k = k;
+    }
+}
+
+pub struct RollingSumsPair {
+    long: RollingSums,
+    short: RollingSums,
+}
+
+/// Orders (value, idx) pairs by descending value, ties broken by ascending idx.
+fn cmp_value_desc_idx_asc(a: &(f64, usize), b: &(f64, usize)) -> Ordering {
+    b.0.total_cmp(&a.0).then(a.1.cmp(&b.1))
+}
+
+pub struct Backtest<'a, T: HlcvsElement = f64> {
+    hlcvs: &'a ArrayView3<'a, T>,
     bot_params_pair: BotParamsPair,
     exchange_params_list: Vec<ExchangeParams>,
     backtest_params: BacktestParams,
@@ -131,23 +228,28 @@ pub struct Backtest<'a> {
     actives: Actives,
     pnl_cumsum_running: f64,
     pnl_cumsum_max: f64,
-    fills: Vec<Fill>,
+    fills: Option<Vec<Fill>>,
     is_stuck: IsStuck,
     trading_enabled: TradingEnabled,
     trailing_enabled: TrailingEnabled,
-    equities: Vec<f64>,
-    delist_timestamps: HashMap<usize, usize>,
-    did_fill_long: HashSet<usize>,
-    did_fill_short: HashSet<usize>,
+    equity_sampler: Option<EquitySampler>,
+    delist_timestamps: Vec<Option<usize>>,
+    did_fill_long: CoinSet,
+    did_fill_short: CoinSet,
     n_eligible_long: usize,
     n_eligible_short: usize,
-    rolling_volume_sum: RollingVolumeSum,
+    rolling_sums: RollingSumsPair,
     volume_indices_buffer: Option<Vec<(f64, usize)>>,
+    // (coin, highest buy price, lowest sell price) of the open orders, used by fast_forward
+    fill_thresholds_buffer: Vec<(usize, f64, f64)>,
+    analysis_accumulator: Option<AnalysisAccumulator>,
+    abort_tracker: Option<AbortTracker>,
+    aborted: bool,
 }
 
-impl<'a> Backtest<'a> {
+impl<'a, T: HlcvsElement> Backtest<'a, T> {
     pub fn new(
-        hlcvs: &'a ArrayView3<'a, f64>,
+        hlcvs: &'a ArrayView3<'a, T>,
         bot_params_pair: BotParamsPair,
         exchange_params_list: Vec<ExchangeParams>,
         backtest_params: &BacktestParams,
@@ -156,15 +258,13 @@ impl<'a> Backtest<'a> {
         let n_coins = hlcvs.shape()[1];
         let initial_emas = (0..n_coins)
             .map(|i| {
-                let close_price = hlcvs[[0, i, CLOSE]];
+                let close_price = hlcv(hlcvs, 0, i, CLOSE);
                 EMAs {
                     long: [close_price; 3],
                     short: [close_price; 3],
                 }
             })
             .collect();
-        let mut equities = Vec::<f64>::new();
-        equities.push(backtest_params.starting_balance);
         let mut bot_params_pair_cloned = bot_params_pair.clone();
         bot_params_pair_cloned.long.n_positions = n_coins.min(bot_params_pair.long.n_positions);
         bot_params_pair_cloned.short.n_positions = n_coins.min(bot_params_pair.short.n_positions);
@@ -185,14 +285,14 @@ impl<'a> Backtest<'a> {
             n_coins,
             ema_alphas: calc_ema_alphas(&bot_params_pair),
             emas: initial_emas,
-            positions: Positions::default(),
-            open_orders: OpenOrdersNew::default(),
-            trailing_prices: TrailingPrices::default(),
-            actives: Actives::default(),
+            positions: Positions::new(n_coins),
+            open_orders: OpenOrdersNew::new(n_coins),
+            trailing_prices: TrailingPrices::new(n_coins),
+            actives: Actives::new(n_coins),
             pnl_cumsum_running: 0.0,
             pnl_cumsum_max: 0.0,
-            fills: Vec::new(),
-            is_stuck: IsStuck::default(),
+            fills: None,
+            is_stuck: IsStuck::new(n_coins),
             trading_enabled: TradingEnabled {
                 long: bot_params_pair.long.wallet_exposure_limit != 0.0
                     && bot_params_pair.long.n_positions > 0,
@@ -205,19 +305,28 @@ impl<'a> Backtest<'a> {
                 short: bot_params_pair.short.close_trailing_grid_ratio != 0.0
                     || bot_params_pair.short.entry_trailing_grid_ratio != 0.0,
             },
-            equities: equities,
-            delist_timestamps: HashMap::new(),
-            did_fill_long: HashSet::new(),
-            did_fill_short: HashSet::new(),
+            equity_sampler: None,
+            delist_timestamps: vec![None; n_coins],
+            did_fill_long: CoinSet::new(n_coins),
+            did_fill_short: CoinSet::new(n_coins),
             n_eligible_long,
             n_eligible_short,
-            rolling_volume_sum: RollingVolumeSum {
-                long: vec![0.0; n_coins],
-                short: vec![0.0; n_coins],
-                prev_k_long: 0,
-                prev_k_short: 0,
+            rolling_sums: RollingSumsPair {
+                long: RollingSums::new(n_coins),
+                short: RollingSums::new(n_coins),
             },
             volume_indices_buffer: Some(vec![(0.0, 0); n_coins]), // Initialize here
+            fill_thresholds_buffer: Vec::with_capacity(n_coins),
+            analysis_accumulator: None,
+            abort_tracker: if backtest_params.abort_thresholds.is_enabled() {
+                Some(AbortTracker::new(
+                    backtest_params.abort_thresholds,
+                    backtest_params.starting_balance,
+                ))
+            } else {
+                None
+            },
+            aborted: false,
         }
     }
 
@@ -246,111 +355,253 @@ impl<'a> Backtest<'a> {
         };
 
         let window = bot_params.filter_rolling_window;
-        let start_k = k.saturating_sub(window);
-
-        let (rolling_volume_sum, prev_k) = match pside {
-            LONG => (
-                &mut self.rolling_volume_sum.long,
-                &mut self.rolling_volume_sum.prev_k_long,
-            ),
-            SHORT => (
-                &mut self.rolling_volume_sum.short,
-                &mut self.rolling_volume_sum.prev_k_short,
-            ),
+        let rolling_sums = match pside {
+            LONG => &mut self.rolling_sums.long,
+            SHORT => &mut self.rolling_sums.short,
             _ => panic!("Invalid pside"),
         };
+        rolling_sums.update(self.hlcvs, k, window);
 
         // Use the pre-allocated buffer for volume indices
         let volume_indices = self.volume_indices_buffer.as_mut().unwrap();
-
-        // Update rolling volume sums
-        if k > window && k - *prev_k < window {
-            // Rolling calculation
-            let safe_start = (*prev_k).saturating_sub(window);
-            for idx in 0..self.n_coins {
-                rolling_volume_sum[idx] -=
-                    self.hlcvs.slice(s![safe_start..start_k, idx, VOLUME]).sum();
-                rolling_volume_sum[idx] += self.hlcvs.slice(s![*prev_k..k, idx, VOLUME]).sum();
-                volume_indices[idx] = (rolling_volume_sum[idx], idx);
-            }
-        } else {
-            // Full calculation
-            for idx in 0..self.n_coins {
-                rolling_volume_sum[idx] = self.hlcvs.slice(s![start_k..k, idx, VOLUME]).sum();
-                volume_indices[idx] = (rolling_volume_sum[idx], idx);
-            }
+        for idx in 0..self.n_coins {
+            volume_indices[idx] = (rolling_sums.volume[idx], idx);
         }
-        *prev_k = k;
-
-        // Sort by volume in descending order
-        volume_indices.sort_unstable_by(|a, b| b.0.partial_cmp(&a.0).unwrap_or(Ordering::Equal));
 
-        // Calculate noisiness for top n_eligible coins
+        // Partition so that the first n_eligible entries are the highest volume coins
         let actual_n_eligible = n_eligible.min(self.n_coins);
-        let mut noisinesses = Vec::with_capacity(actual_n_eligible);
-
-        for &(_, idx) in volume_indices.iter().take(actual_n_eligible) {
-            let noisiness: f64 = self
-                .hlcvs
-                .slice(s![start_k..k, idx, ..])
-                .axis_iter(Axis(0))
-                .map(|row| (row[HIGH] - row[LOW]) / row[CLOSE])
-                .sum();
-            noisinesses.push((noisiness, idx));
+        if actual_n_eligible == 0 {
+            return Vec::new();
+        }
+        if actual_n_eligible < self.n_coins {
+            volume_indices.select_nth_unstable_by(actual_n_eligible - 1, cmp_value_desc_idx_asc);
         }
 
-        // Sort by noisiness in descending order
-        noisinesses.sort_unstable_by(|a, b| b.0.partial_cmp(&a.0).unwrap_or(Ordering::Equal));
+        // Sort eligible coins by noisiness in descending order
+        let mut noisinesses: Vec<(f64, usize)> = volume_indices[..actual_n_eligible]
+            .iter()
+            .map(|&(_, idx)| (rolling_sums.noisiness[idx], idx))
+            .collect();
+        noisinesses.sort_unstable_by(cmp_value_desc_idx_asc);
 
         // Return indices sorted by noisiness
         noisinesses.into_iter().map(|(_, idx)| idx).collect()
     }
-    pub fn run(&mut self) -> (Vec<Fill>, Vec<f64>) {
+    /// Runs the backtest and returns its fills, its equity curve sampled at
+    /// backtest_params.equity_sampling and its analysis.
+    /// The analysis is computed from every minute's equity whatever the sampling, giving the
+    /// same result as analyze_backtest on the fills and per-minute equities.
+    /// If one of backtest_params.abort_thresholds is breached, the backtest stops at that minute
+    /// and fills, equities and analysis cover the backtest up to it, with analysis.aborted set.
+    pub fn run(&mut self) -> (Vec<Fill>, EquityCurve, Analysis) {
+        let n_timesteps = self.hlcvs.shape()[0];
+        self.fills = Some(Vec::new());
+        self.equity_sampler = Some(EquitySampler::new(
+            self.backtest_params.equity_sampling,
+            n_timesteps.saturating_sub(1),
+        ));
+        self.analysis_accumulator = Some(AnalysisAccumulator::new(n_timesteps.saturating_sub(1)));
+        self.simulate();
+        let mut analysis = self.analysis_accumulator.take().unwrap().finalize();
+        analysis.aborted = self.aborted;
+        (
+            self.fills.take().unwrap(),
+            self.equity_sampler.take().unwrap().finalize(),
+            analysis,
+        )
+    }
+
+    /// Runs the backtest without keeping fills or equities in memory.
+    /// Both are fed to an AnalysisAccumulator as they are produced, giving the same
+    /// result as analyze_backtest on the full output.
+    pub fn run_analysis(&mut self) -> Analysis {
+        let n_timesteps = self.hlcvs.shape()[0];
+        self.analysis_accumulator = Some(AnalysisAccumulator::new(n_timesteps.saturating_sub(1)));
+        self.simulate();
+        let mut analysis = self.analysis_accumulator.take().unwrap().finalize();
+        analysis.aborted = self.aborted;
+        analysis
+    }
+
+    fn simulate(&mut self) {
         let check_points: Vec<usize> = (0..7).map(|i| i * 60 * 24).collect();
         let n_timesteps = self.hlcvs.shape()[0];
+        self.record_equity(0, self.backtest_params.starting_balance);
 
         for idx in 0..self.n_coins {
-            self.trailing_prices
-                .long
-                .insert(idx, TrailingPriceBundle::default());
-            self.trailing_prices
-                .short
-                .insert(idx, TrailingPriceBundle::default());
+            self.trailing_prices.long[idx] = TrailingPriceBundle::default();
+            self.trailing_prices.short[idx] = TrailingPriceBundle::default();
 
             // check if the coin was delisted at any point
             if n_timesteps > *check_points.last().unwrap() {
-                let last_hlc_close = self.hlcvs[[n_timesteps - 1, idx, CLOSE]];
+                let last_hlc_close = hlcv(self.hlcvs, n_timesteps - 1, idx, CLOSE);
                 if check_points.iter().all(|&point| {
-                    self.hlcvs[[n_timesteps - 1 - point, idx, HIGH]] == last_hlc_close
-                        && self.hlcvs[[n_timesteps - 1 - point, idx, LOW]] == last_hlc_close
-                        && self.hlcvs[[n_timesteps - 1 - point, idx, CLOSE]] == last_hlc_close
+                    hlcv(self.hlcvs, n_timesteps - 1 - point, idx, HIGH) == last_hlc_close
+                        && hlcv(self.hlcvs, n_timesteps - 1 - point, idx, LOW) == last_hlc_close
+                        && hlcv(self.hlcvs, n_timesteps - 1 - point, idx, CLOSE) == last_hlc_close
                 }) {
                     // was delisted. Find timestamp of delisting
                     let mut i = n_timesteps - check_points.last().unwrap();
                     while i > 0
-                        && self.hlcvs[[i, idx, HIGH]] == last_hlc_close
-                        && self.hlcvs[[i, idx, LOW]] == last_hlc_close
-                        && self.hlcvs[[i, idx, CLOSE]] == last_hlc_close
+                        && hlcv(self.hlcvs, i, idx, HIGH) == last_hlc_close
+                        && hlcv(self.hlcvs, i, idx, LOW) == last_hlc_close
+                        && hlcv(self.hlcvs, i, idx, CLOSE) == last_hlc_close
                     {
                         i -= 1;
                     }
                     if i > 1 {
-                        self.delist_timestamps.insert(idx, i);
+                        self.delist_timestamps[idx] = Some(i);
                     }
                 }
             }
         }
-        for k in 1..(n_timesteps - 1) {
+        let mut k = 1;
+        while k < n_timesteps - 1 && !self.aborted {
             self.check_for_fills(k);
             self.update_emas(k);
             self.update_open_orders(k);
             self.update_equities(k);
+            k = self.fast_forward(k, n_timesteps - 1);
+        }
+    }
+
+    /// Called after step k. Returns the next step to simulate in full.
+    ///
+    /// While no open order is trailing or unstucking, no position is stuck and every enabled
+    /// side has all its position slots filled, a step without fills leaves the open orders
+    /// untouched: only EMAs, trailing prices and equity change. Those steps are skipped up to
+    /// the next step at which any open order would fill, advancing EMAs, trailing prices and
+    /// equities for the skipped steps in tight per-step passes. The results are identical to
+    /// simulating every step.
+    fn fast_forward(&mut self, k: usize, end: usize) -> usize {
+        if !self.is_stuck.long.is_empty()
+            || !self.is_stuck.short.is_empty()
+            || (self.trading_enabled.long && !self.is_idle(LONG))
+            || (self.trading_enabled.short && !self.is_idle(SHORT))
+        {
+            return k + 1;
+        }
+        let next_k = self.find_next_fill_step(k + 1, end);
+        if next_k == k + 1 {
+            return next_k;
+        }
+        // no coin fills during the skipped steps
+        self.did_fill_long.clear();
+        self.did_fill_short.clear();
+        for i in (k + 1)..next_k {
+            self.update_emas(i);
+        }
+        if self.trading_enabled.long && self.trailing_enabled.long {
+            for i in (k + 1)..next_k {
+                self.update_trailing_prices_no_fill(i, LONG);
+            }
+        }
+        if self.trading_enabled.short && self.trailing_enabled.short {
+            for i in (k + 1)..next_k {
+                self.update_trailing_prices_no_fill(i, SHORT);
+            }
+        }
+        for i in (k + 1)..next_k {
+            self.update_equities(i);
+            if self.aborted {
+                return i + 1;
+            }
+        }
+        next_k
+    }
+
+    /// True if update_open_orders_no_fill would neither update actives nor recompute any
+    /// open order on pside.
+    fn is_idle(&self, pside: usize) -> bool {
+        let (positions, open_orders, n_positions) = match pside {
+            LONG => (
+                &self.positions.long,
+                &self.open_orders.long,
+                self.bot_params_pair.long.n_positions,
+            ),
+            SHORT => (
+                &self.positions.short,
+                &self.open_orders.short,
+                self.bot_params_pair.short.n_positions,
+            ),
+            _ => panic!("Invalid pside"),
+        };
+        if positions.len() < n_positions {
+            return false;
+        }
+        let actives = match pside {
+            LONG => &self.actives.long,
+            _ => &self.actives.short,
+        };
+        !actives.iter().any(|idx| {
+            open_orders.get(idx).map_or(false, |orders| {
+                has_trailing_or_unstuck_orders(orders, pside)
+            })
+        })
+    }
+
+    /// First step in [start, end) at which any open order of an enabled side would fill,
+    /// or end if there is none.
+    fn find_next_fill_step(&mut self, start: usize, end: usize) -> usize {
+        let mut thresholds = std::mem::take(&mut self.fill_thresholds_buffer);
+        thresholds.clear();
+        for idx in 0..self.n_coins {
+            let mut highest_buy = f64::NEG_INFINITY;
+            let mut lowest_sell = f64::INFINITY;
+            for (enabled, open_orders) in [
+                (self.trading_enabled.long, &self.open_orders.long),
+                (self.trading_enabled.short, &self.open_orders.short),
+            ] {
+                if let (true, Some(orders)) = (enabled, open_orders.get(idx)) {
+                    for order in orders.entries.iter().chain(orders.closes.iter()) {
+                        if order.qty > 0.0 && order.price > highest_buy {
+                            highest_buy = order.price;
+                        } else if order.qty < 0.0 && order.price < lowest_sell {
+                            lowest_sell = order.price;
+                        }
+                    }
+                }
+            }
+            if highest_buy > f64::NEG_INFINITY || lowest_sell < f64::INFINITY {
+                thresholds.push((idx, highest_buy, lowest_sell));
+            }
+        }
+        let mut next_k = end;
+        'steps: for i in start..end {
+            for &(idx, highest_buy, lowest_sell) in &thresholds {
+                // same comparisons as order_filled
+                if hlcv(self.hlcvs, i, idx, LOW) < highest_buy
+                    || hlcv(self.hlcvs, i, idx, HIGH) > lowest_sell
+                {
+                    next_k = i;
+                    break 'steps;
+                }
+            }
+        }
+        self.fill_thresholds_buffer = thresholds;
+        next_k
+    }
+
+    fn record_fill(&mut self, fill: Fill) {
+        if let Some(accumulator) = self.analysis_accumulator.as_mut() {
+            accumulator.add_fill(&fill);
+        }
+        if let Some(fills) = self.fills.as_mut() {
+            fills.push(fill);
+        }
+    }
+
+    fn record_equity(&mut self, k: usize, equity: f64) {
+        if let Some(accumulator) = self.analysis_accumulator.as_mut() {
+            accumulator.add_equity(k, equity);
+        }
+        if let Some(equity_sampler) = self.equity_sampler.as_mut() {
+            equity_sampler.add(k, equity);
         }
-        (self.fills.clone(), self.equities.clone())
     }
 
     fn create_state_params(&self, k: usize, idx: usize, pside: usize) -> StateParams {
-        let close_price = self.hlcvs[[k, idx, CLOSE]];
+        let close_price = hlcv(self.hlcvs, k, idx, CLOSE);
         StateParams {
             balance: self.balance,
             order_book: OrderBook {
@@ -363,8 +614,8 @@ impl<'a> Backtest<'a> {
 
     fn get_position(&self, idx: usize, pside: usize) -> Position {
         match pside {
-            LONG => self.positions.long.get(&idx).cloned().unwrap_or_default(),
-            SHORT => self.positions.short.get(&idx).cloned().unwrap_or_default(),
+            LONG => self.positions.long.get(idx).cloned().unwrap_or_default(),
+            SHORT => self.positions.short.get(idx).cloned().unwrap_or_default(),
             _ => panic!("Invalid pside"),
         }
     }
@@ -372,13 +623,10 @@ impl<'a> Backtest<'a> {
     fn update_equities(&mut self, k: usize) {
         let mut equity = self.balance;
 
-        // Sort long keys
-        let mut long_keys: Vec<usize> = self.positions.long.keys().cloned().collect();
-        long_keys.sort();
-        // Calculate unrealized PnL for each long position in sorted order
-        for idx in long_keys {
-            let position = &self.positions.long[&idx];
-            let current_price = self.hlcvs[[k, idx, CLOSE]];
+        // Calculate unrealized PnL for each long position in ascending coin order
+        for idx in self.positions.long.keys().iter() {
+            let position = &self.positions.long[idx];
+            let current_price = hlcv(self.hlcvs, k, idx, CLOSE);
             let upnl = calc_pnl_long(
                 position.price,
                 current_price,
@@ -388,13 +636,10 @@ impl<'a> Backtest<'a> {
             equity += upnl;
         }
 
-        // Sort short keys
-        let mut short_keys: Vec<usize> = self.positions.short.keys().cloned().collect();
-        short_keys.sort();
-        // Calculate unrealized PnL for each short position in sorted order
-        for idx in short_keys {
-            let position = &self.positions.short[&idx];
-            let current_price = self.hlcvs[[k, idx, CLOSE]];
+        // Calculate unrealized PnL for each short position in ascending coin order
+        for idx in self.positions.short.keys().iter() {
+            let position = &self.positions.short[idx];
+            let current_price = hlcv(self.hlcvs, k, idx, CLOSE);
             let upnl = calc_pnl_short(
                 position.price,
                 current_price,
@@ -404,7 +649,10 @@ impl<'a> Backtest<'a> {
             equity += upnl;
         }
 
-        self.equities.push(equity);
+        self.record_equity(k, equity);
+        if let Some(abort_tracker) = self.abort_tracker.as_mut() {
+            self.aborted = abort_tracker.is_breached(k, equity, self.balance);
+        }
     }
 
     fn update_actives(&mut self, k: usize, pside: usize) -> Vec<usize> {
@@ -418,29 +666,20 @@ impl<'a> Backtest<'a> {
             _ => panic!("Invalid pside"),
         };
 
-        // Sort positions to ensure stable iteration
-        let mut current_positions: Vec<usize> = positions.keys().cloned().collect();
-        current_positions.sort();
         let mut preferred_coins = Vec::new();
 
         // Only calculate preferred coins if there are open slots
-        if current_positions.len() < n_positions {
+        if positions.len() < n_positions {
             preferred_coins = self.calc_preferred_coins(k, pside);
         }
 
-        // Now we can mutably borrow self.actives
-        let actives = match pside {
-            LONG => &mut self.actives.long,
-            SHORT => &mut self.actives.short,
+        // Add all markets with existing positions
+        let (actives, positions) = match pside {
+            LONG => (&mut self.actives.long, &self.positions.long),
+            SHORT => (&mut self.actives.short, &self.positions.short),
             _ => unreachable!(),
         };
-
-        actives.clear();
-
-        // Add all markets with existing positions
-        for &market_idx in &current_positions {
-            actives.insert(market_idx);
-        }
+        actives.copy_from(positions.keys());
 
         let mut actives_without_pos = Vec::new();
 
@@ -462,24 +701,23 @@ impl<'a> Backtest<'a> {
         self.did_fill_long.clear();
         self.did_fill_short.clear();
         if self.trading_enabled.long {
-            let mut open_orders_keys_long: Vec<usize> =
-                self.open_orders.long.keys().cloned().collect();
-            open_orders_keys_long.sort();
-            for idx in open_orders_keys_long {
+            // fills never add or remove open order keys, so the cursor stays valid
+            let mut cursor = self.open_orders.long.keys().first();
+            while let Some(idx) = cursor {
                 // Process close fills long
-                if !self.open_orders.long[&idx].closes.is_empty() {
+                if !self.open_orders.long[idx].closes.is_empty() {
                     let mut closes_to_process = Vec::new();
                     {
-                        for close_order in &self.open_orders.long[&idx].closes {
+                        for close_order in &self.open_orders.long[idx].closes {
                             if self.order_filled(k, idx, close_order) {
                                 closes_to_process.push(close_order.clone());
                             }
                         }
                     }
                     for order in closes_to_process {
-                        //if order.qty != 0.0 && self.positions.long.contains_key(&idx) && self.positions.long.contains_key(&idx)
+                        //if order.qty != 0.0 && self.positions.long.contains_key(idx) && self.positions.long.contains_key(idx)
                         //if order.qty != 0.0 && self.get_position
-                        if self.positions.long.contains_key(&idx) {
+                        if self.positions.long.contains_key(idx) {
                             self.did_fill_long.insert(idx);
                             self.reset_trailing_prices(idx, LONG);
                             self.process_close_fill_long(k, idx, &order);
@@ -487,10 +725,10 @@ impl<'a> Backtest<'a> {
                     }
                 }
                 // Process entry fills long
-                if !self.open_orders.long[&idx].entries.is_empty() {
+                if !self.open_orders.long[idx].entries.is_empty() {
                     let mut entries_to_process = Vec::new();
                     {
-                        for entry_order in &self.open_orders.long[&idx].entries {
+                        for entry_order in &self.open_orders.long[idx].entries {
                             if self.order_filled(k, idx, entry_order) {
                                 entries_to_process.push(entry_order.clone());
                             }
@@ -502,25 +740,25 @@ impl<'a> Backtest<'a> {
                         self.process_entry_fill_long(k, idx, &order);
                     }
                 }
+                cursor = self.open_orders.long.keys().next_from(idx + 1);
             }
         }
         if self.trading_enabled.short {
-            let mut open_orders_keys_short: Vec<usize> =
-                self.open_orders.short.keys().cloned().collect();
-            open_orders_keys_short.sort();
-            for idx in open_orders_keys_short {
+            // fills never add or remove open order keys, so the cursor stays valid
+            let mut cursor = self.open_orders.short.keys().first();
+            while let Some(idx) = cursor {
                 // Process close fills short
-                if !self.open_orders.short[&idx].closes.is_empty() {
+                if !self.open_orders.short[idx].closes.is_empty() {
                     let mut closes_to_process = Vec::new();
                     {
-                        for close_order in &self.open_orders.short[&idx].closes {
+                        for close_order in &self.open_orders.short[idx].closes {
                             if self.order_filled(k, idx, close_order) {
                                 closes_to_process.push(close_order.clone());
                             }
                         }
                     }
                     for order in closes_to_process {
-                        if self.positions.short.contains_key(&idx) {
+                        if self.positions.short.contains_key(idx) {
                             self.did_fill_short.insert(idx);
                             self.reset_trailing_prices(idx, SHORT);
                             self.process_close_fill_short(k, idx, &order);
@@ -528,10 +766,10 @@ impl<'a> Backtest<'a> {
                     }
                 }
                 // Process entry fills short
-                if !self.open_orders.short[&idx].entries.is_empty() {
+                if !self.open_orders.short[idx].entries.is_empty() {
                     let mut entries_to_process = Vec::new();
                     {
-                        for entry_order in &self.open_orders.short[&idx].entries {
+                        for entry_order in &self.open_orders.short[idx].entries {
                             if self.order_filled(k, idx, entry_order) {
                                 entries_to_process.push(entry_order.clone());
                             }
@@ -543,6 +781,7 @@ impl<'a> Backtest<'a> {
                         self.process_entry_fill_short(k, idx, &order);
                     }
                 }
+                cursor = self.open_orders.short.keys().next_from(idx + 1);
             }
         }
     }
@@ -550,41 +789,41 @@ impl<'a> Backtest<'a> {
     fn update_stuck_status(&mut self, idx: usize, pside: usize) {
         match pside {
             LONG => {
-                if self.positions.long.contains_key(&idx) {
+                if self.positions.long.contains_key(idx) {
                     let wallet_exposure = calc_wallet_exposure(
                         self.exchange_params_list[idx].c_mult,
                         self.balance,
-                        self.positions.long[&idx].size,
-                        self.positions.long[&idx].price,
+                        self.positions.long[idx].size,
+                        self.positions.long[idx].price,
                     );
                     if wallet_exposure / self.bot_params_pair.long.wallet_exposure_limit
                         > self.bot_params_pair.long.unstuck_threshold
                     {
                         self.is_stuck.long.insert(idx);
                     } else {
-                        self.is_stuck.long.remove(&idx);
+                        self.is_stuck.long.remove(idx);
                     }
                 } else {
-                    self.is_stuck.long.remove(&idx);
+                    self.is_stuck.long.remove(idx);
                 }
             }
             SHORT => {
-                if self.positions.short.contains_key(&idx) {
+                if self.positions.short.contains_key(idx) {
                     let wallet_exposure = calc_wallet_exposure(
                         self.exchange_params_list[idx].c_mult,
                         self.balance,
-                        self.positions.short[&idx].size.abs(),
-                        self.positions.short[&idx].price,
+                        self.positions.short[idx].size.abs(),
+                        self.positions.short[idx].price,
                     );
                     if wallet_exposure / self.bot_params_pair.short.wallet_exposure_limit
                         > self.bot_params_pair.short.unstuck_threshold
                     {
                         self.is_stuck.short.insert(idx);
                     } else {
-                        self.is_stuck.short.remove(&idx);
+                        self.is_stuck.short.remove(idx);
                     }
                 } else {
-                    self.is_stuck.short.remove(&idx);
+                    self.is_stuck.short.remove(idx);
                 }
             }
             _ => panic!("Invalid pside in update_stuck_status"),
@@ -593,7 +832,7 @@ impl<'a> Backtest<'a> {
 
     fn process_close_fill_long(&mut self, k: usize, idx: usize, close_fill: &Order) {
         let mut new_psize = round_(
-            self.positions.long[&idx].size + close_fill.qty,
+            self.positions.long[idx].size + close_fill.qty,
             self.exchange_params_list[idx].qty_step,
         );
         let mut adjusted_close_qty = close_fill.qty;
@@ -603,7 +842,7 @@ impl<'a> Backtest<'a> {
             println!("new_psize: {}", new_psize);
             println!("close order: {:?}", close_fill);
             new_psize = 0.0;
-            adjusted_close_qty = -self.positions.long[&idx].size;
+            adjusted_close_qty = -self.positions.long[idx].size;
         }
         let fee_paid = -qty_to_cost(
             adjusted_close_qty,
@@ -611,7 +850,7 @@ impl<'a> Backtest<'a> {
             self.exchange_params_list[idx].c_mult,
         ) * self.backtest_params.maker_fee;
         let pnl = calc_pnl_long(
-            self.positions.long[&idx].price,
+            self.positions.long[idx].price,
             close_fill.price,
             adjusted_close_qty,
             self.exchange_params_list[idx].c_mult,
@@ -620,29 +859,29 @@ impl<'a> Backtest<'a> {
         self.pnl_cumsum_max = self.pnl_cumsum_max.max(self.pnl_cumsum_running);
         self.balance += pnl + fee_paid;
 
-        let current_pprice = self.positions.long[&idx].price;
+        let current_pprice = self.positions.long[idx].price;
         if new_psize == 0.0 {
-            self.positions.long.remove(&idx);
+            self.positions.long.remove(idx);
         } else {
-            self.positions.long.get_mut(&idx).unwrap().size = new_psize;
-        }
-        self.fills.push(Fill {
-            index: k,                                      // index minute
-            coin: self.backtest_params.coins[idx].clone(), // coin
-            pnl,                                           // realized pnl
-            fee_paid,                                      // fee paid
-            balance: self.balance,                         // balance after fill
-            fill_qty: adjusted_close_qty,                  // fill qty
-            fill_price: close_fill.price,                  // fill price
-            position_size: new_psize,                      // psize after fill
-            position_price: current_pprice,                // pprice after fill
-            order_type: close_fill.order_type.clone(),     // fill type
+            self.positions.long.get_mut(idx).unwrap().size = new_psize;
+        }
+        self.record_fill(Fill {
+            index: k,                                  // index minute
+            coin: idx,                                 // coin
+            pnl,                                       // realized pnl
+            fee_paid,                                  // fee paid
+            balance: self.balance,                     // balance after fill
+            fill_qty: adjusted_close_qty,              // fill qty
+            fill_price: close_fill.price,              // fill price
+            position_size: new_psize,                  // psize after fill
+            position_price: current_pprice,            // pprice after fill
+            order_type: close_fill.order_type.clone(), // fill type
         });
     }
 
     fn process_close_fill_short(&mut self, k: usize, idx: usize, order: &Order) {
         let mut new_psize = round_(
-            self.positions.short[&idx].size + order.qty,
+            self.positions.short[idx].size + order.qty,
             self.exchange_params_list[idx].qty_step,
         );
         let mut adjusted_close_qty = order.qty;
@@ -652,7 +891,7 @@ impl<'a> Backtest<'a> {
             println!("new_psize: {}", new_psize);
             println!("close order: {:?}", order);
             new_psize = 0.0;
-            adjusted_close_qty = self.positions.short[&idx].size.abs();
+            adjusted_close_qty = self.positions.short[idx].size.abs();
         }
         let fee_paid = -qty_to_cost(
             adjusted_close_qty,
@@ -660,7 +899,7 @@ impl<'a> Backtest<'a> {
             self.exchange_params_list[idx].c_mult,
         ) * self.backtest_params.maker_fee;
         let pnl = calc_pnl_short(
-            self.positions.short[&idx].price,
+            self.positions.short[idx].price,
             order.price,
             adjusted_close_qty,
             self.exchange_params_list[idx].c_mult,
@@ -669,23 +908,23 @@ impl<'a> Backtest<'a> {
         self.pnl_cumsum_max = self.pnl_cumsum_max.max(self.pnl_cumsum_running);
         self.balance += pnl + fee_paid;
 
-        let current_pprice = self.positions.short[&idx].price;
+        let current_pprice = self.positions.short[idx].price;
         if new_psize == 0.0 {
-            self.positions.short.remove(&idx);
+            self.positions.short.remove(idx);
         } else {
-            self.positions.short.get_mut(&idx).unwrap().size = new_psize;
-        }
-        self.fills.push(Fill {
-            index: k,                                      // index minute
-            coin: self.backtest_params.coins[idx].clone(), // coin
-            pnl,                                           // realized pnl
-            fee_paid,                                      // fee paid
-            balance: self.balance,                         // balance after fill
-            fill_qty: adjusted_close_qty,                  // fill qty
-            fill_price: order.price,                       // fill price
-            position_size: new_psize,                      // psize after fill
-            position_price: current_pprice,                // pprice after fill
-            order_type: order.order_type.clone(),          // fill type
+            self.positions.short.get_mut(idx).unwrap().size = new_psize;
+        }
+        self.record_fill(Fill {
+            index: k,                             // index minute
+            coin: idx,                            // coin
+            pnl,                                  // realized pnl
+            fee_paid,                             // fee paid
+            balance: self.balance,                // balance after fill
+            fill_qty: adjusted_close_qty,         // fill qty
+            fill_price: order.price,              // fill price
+            position_size: new_psize,             // psize after fill
+            position_price: current_pprice,       // pprice after fill
+            order_type: order.order_type.clone(), // fill type
         });
     }
 
@@ -697,11 +936,7 @@ impl<'a> Backtest<'a> {
             self.exchange_params_list[idx].c_mult,
         ) * self.backtest_params.maker_fee;
         self.balance += fee_paid;
-        let position_entry = self
-            .positions
-            .long
-            .entry(idx)
-            .or_insert(Position::default());
+        let position_entry = self.positions.long.get_or_insert_default(idx);
         let (new_psize, new_pprice) = calc_new_psize_pprice(
             position_entry.size,
             position_entry.price,
@@ -709,19 +944,19 @@ impl<'a> Backtest<'a> {
             order.price,
             self.exchange_params_list[idx].qty_step,
         );
-        self.positions.long.get_mut(&idx).unwrap().size = new_psize;
-        self.positions.long.get_mut(&idx).unwrap().price = new_pprice;
-        self.fills.push(Fill {
-            index: k,                                        // index minute
-            coin: self.backtest_params.coins[idx].clone(),   // coin
-            pnl: 0.0,                                        // realized pnl
-            fee_paid,                                        // fee paid
-            balance: self.balance,                           // balance after fill
-            fill_qty: order.qty,                             // fill qty
-            fill_price: order.price,                         // fill price
-            position_size: self.positions.long[&idx].size,   // psize after fill
-            position_price: self.positions.long[&idx].price, // pprice after fill
-            order_type: order.order_type.clone(),            // fill type
+        self.positions.long.get_mut(idx).unwrap().size = new_psize;
+        self.positions.long.get_mut(idx).unwrap().price = new_pprice;
+        self.record_fill(Fill {
+            index: k,                                       // index minute
+            coin: idx,                                      // coin
+            pnl: 0.0,                                       // realized pnl
+            fee_paid,                                       // fee paid
+            balance: self.balance,                          // balance after fill
+            fill_qty: order.qty,                            // fill qty
+            fill_price: order.price,                        // fill price
+            position_size: self.positions.long[idx].size,   // psize after fill
+            position_price: self.positions.long[idx].price, // pprice after fill
+            order_type: order.order_type.clone(),           // fill type
         });
     }
 
@@ -733,11 +968,7 @@ impl<'a> Backtest<'a> {
             self.exchange_params_list[idx].c_mult,
         ) * self.backtest_params.maker_fee;
         self.balance += fee_paid;
-        let position_entry = self
-            .positions
-            .short
-            .entry(idx)
-            .or_insert(Position::default());
+        let position_entry = self.positions.short.get_or_insert_default(idx);
         let (new_psize, new_pprice) = calc_new_psize_pprice(
             position_entry.size,
             position_entry.price,
@@ -745,104 +976,129 @@ impl<'a> Backtest<'a> {
             order.price,
             self.exchange_params_list[idx].qty_step,
         );
-        self.positions.short.get_mut(&idx).unwrap().size = new_psize;
-        self.positions.short.get_mut(&idx).unwrap().price = new_pprice;
-        self.fills.push(Fill {
-            index: k,                                         // index minute
-            coin: self.backtest_params.coins[idx].clone(),    // coin
-            pnl: 0.0,                                         // realized pnl
-            fee_paid,                                         // fee paid
-            balance: self.balance,                            // balance after fill
-            fill_qty: order.qty,                              // fill qty
-            fill_price: order.price,                          // fill price
-            position_size: self.positions.short[&idx].size,   // psize after fill
-            position_price: self.positions.short[&idx].price, // pprice after fill
-            order_type: order.order_type.clone(),             // fill type
+        self.positions.short.get_mut(idx).unwrap().size = new_psize;
+        self.positions.short.get_mut(idx).unwrap().price = new_pprice;
+        self.record_fill(Fill {
+            index: k,                                        // index minute
+            coin: idx,                                       // coin
+            pnl: 0.0,                                        // realized pnl
+            fee_paid,                                        // fee paid
+            balance: self.balance,                           // balance after fill
+            fill_qty: order.qty,                             // fill qty
+            fill_price: order.price,                         // fill price
+            position_size: self.positions.short[idx].size,   // psize after fill
+            position_price: self.positions.short[idx].price, // pprice after fill
+            order_type: order.order_type.clone(),            // fill type
         });
     }
 
     fn calc_next_grid_entry_long(&self, k: usize, idx: usize) -> Order {
         let state_params = self.create_state_params(k, idx, LONG);
         let binding = Position::default();
-        let position = self.positions.long.get(&idx).unwrap_or(&binding);
+        let position = self.positions.long.get(idx).unwrap_or(&binding);
         calc_next_entry_long(
             &self.exchange_params_list[idx],
             &state_params,
             &self.bot_params_pair.long,
             position,
-            &self.trailing_prices.long[&idx],
+            &self.trailing_prices.long[idx],
         )
     }
 
     fn calc_next_grid_entry_short(&self, k: usize, idx: usize) -> Order {
         let state_params = self.create_state_params(k, idx, SHORT);
         let binding = Position::default();
-        let position = self.positions.short.get(&idx).unwrap_or(&binding);
+        let position = self.positions.short.get(idx).unwrap_or(&binding);
         calc_next_entry_short(
             &self.exchange_params_list[idx],
             &state_params,
             &self.bot_params_pair.short,
             position,
-            &self.trailing_prices.short[&idx],
+            &self.trailing_prices.short[idx],
         )
     }
 
     fn calc_grid_close_long(&self, k: usize, idx: usize) -> Order {
         let state_params = self.create_state_params(k, idx, LONG);
         let binding = Position::default();
-        let position = self.positions.long.get(&idx).unwrap_or(&binding);
+        let position = self.positions.long.get(idx).unwrap_or(&binding);
         calc_next_close_long(
             &self.exchange_params_list[idx],
             &state_params,
             &self.bot_params_pair.long,
             &position,
-            &self.trailing_prices.long[&idx],
+            &self.trailing_prices.long[idx],
         )
     }
 
     fn calc_grid_close_short(&self, k: usize, idx: usize) -> Order {
         let state_params = self.create_state_params(k, idx, SHORT);
         let binding = Position::default();
-        let position = self.positions.short.get(&idx).unwrap_or(&binding);
+        let position = self.positions.short.get(idx).unwrap_or(&binding);
         calc_next_close_short(
             &self.exchange_params_list[idx],
             &state_params,
             &self.bot_params_pair.short,
             &position,
-            &self.trailing_prices.short[&idx],
+            &self.trailing_prices.short[idx],
         )
     }
 
     fn reset_trailing_prices(&mut self, idx: usize, pside: usize) {
         let trailing_price_bundle = if pside == LONG {
-            self.trailing_prices.long.entry(idx).or_default()
+            &mut self.trailing_prices.long[idx]
         } else {
-            self.trailing_prices.short.entry(idx).or_default()
+            &mut self.trailing_prices.short[idx]
         };
         *trailing_price_bundle = TrailingPriceBundle::default();
     }
 
     fn update_trailing_prices(&mut self, k: usize, idx: usize, pside: usize) {
         let trailing_price_bundle = if pside == LONG {
-            self.trailing_prices.long.entry(idx).or_default()
+            &mut self.trailing_prices.long[idx]
         } else {
-            self.trailing_prices.short.entry(idx).or_default()
+            &mut self.trailing_prices.short[idx]
         };
-        if self.hlcvs[[k, idx, LOW]] < trailing_price_bundle.min_since_open {
-            trailing_price_bundle.min_since_open = self.hlcvs[[k, idx, LOW]];
-            trailing_price_bundle.max_since_min = self.hlcvs[[k, idx, CLOSE]];
+        if hlcv(self.hlcvs, k, idx, LOW) < trailing_price_bundle.min_since_open {
+            trailing_price_bundle.min_since_open = hlcv(self.hlcvs, k, idx, LOW);
+            trailing_price_bundle.max_since_min = hlcv(self.hlcvs, k, idx, CLOSE);
         } else {
             trailing_price_bundle.max_since_min = trailing_price_bundle
                 .max_since_min
-                .max(self.hlcvs[[k, idx, HIGH]]);
+                .max(hlcv(self.hlcvs, k, idx, HIGH));
         }
-        if self.hlcvs[[k, idx, HIGH]] > trailing_price_bundle.max_since_open {
-            trailing_price_bundle.max_since_open = self.hlcvs[[k, idx, HIGH]];
-            trailing_price_bundle.min_since_max = self.hlcvs[[k, idx, CLOSE]];
+        if hlcv(self.hlcvs, k, idx, HIGH) > trailing_price_bundle.max_since_open {
+            trailing_price_bundle.max_since_open = hlcv(self.hlcvs, k, idx, HIGH);
+            trailing_price_bundle.min_since_max = hlcv(self.hlcvs, k, idx, CLOSE);
         } else {
             trailing_price_bundle.min_since_max = trailing_price_bundle
                 .min_since_max
-                .min(self.hlcvs[[k, idx, LOW]]);
+                .min(hlcv(self.hlcvs, k, idx, LOW));
+        }
+    }
+
+    /// Updates trailing prices of all positions on pside which did not fill at this step.
+    fn update_trailing_prices_no_fill(&mut self, k: usize, pside: usize) {
+        match pside {
+            LONG => {
+                let mut cursor = self.positions.long.keys().first();
+                while let Some(idx) = cursor {
+                    if !self.did_fill_long.contains(idx) {
+                        self.update_trailing_prices(k, idx, LONG);
+                    }
+                    cursor = self.positions.long.keys().next_from(idx + 1);
+                }
+            }
+            SHORT => {
+                let mut cursor = self.positions.short.keys().first();
+                while let Some(idx) = cursor {
+                    if !self.did_fill_short.contains(idx) {
+                        self.update_trailing_prices(k, idx, SHORT);
+                    }
+                    cursor = self.positions.short.keys().next_from(idx + 1);
+                }
+            }
+            _ => panic!("Invalid pside"),
         }
     }
 
@@ -879,26 +1135,27 @@ impl<'a> Backtest<'a> {
         let position = self
             .positions
             .long
-            .get(&idx)
+            .get(idx)
             .cloned()
             .unwrap_or(Position::default());
 
         // check if coin is delisted; if so, close pos as unstuck close
-        if let Some(&delist_timestamp) = self.delist_timestamps.get(&idx) {
-            if k >= delist_timestamp && self.positions.long.contains_key(&idx) {
-                self.open_orders.long.get_mut(&idx).unwrap().closes = [Order {
-                    qty: -self.positions.long[&idx].size,
+        if let Some(delist_timestamp) = self.delist_timestamps[idx] {
+            if k >= delist_timestamp && self.positions.long.contains_key(idx) {
+                self.open_orders.long.get_mut(idx).unwrap().closes = [Order {
+                    qty: -self.positions.long[idx].size,
                     price: round_(
                         f64::min(
-                            self.hlcvs[[k, idx, HIGH]] - self.exchange_params_list[idx].price_step,
-                            self.positions.long[&idx].price,
+                            hlcv(self.hlcvs, k, idx, HIGH)
+                                - self.exchange_params_list[idx].price_step,
+                            self.positions.long[idx].price,
                         ),
                         self.exchange_params_list[idx].price_step,
                     ),
                     order_type: OrderType::CloseUnstuckLong,
                 }]
                 .to_vec();
-                self.open_orders.long.entry(idx).or_default().entries = Vec::new();
+                self.open_orders.long.get_or_insert_default(idx).entries = Vec::new();
                 return;
             }
         }
@@ -907,42 +1164,42 @@ impl<'a> Backtest<'a> {
             &state_params,
             &self.bot_params_pair.long,
             &position,
-            &self.trailing_prices.long[&idx],
+            &self.trailing_prices.long[idx],
         );
         // if initial entry or grid, peek next candle to see if order will fill
         if self.order_filled(k + 1, idx, &next_entry_order)
             && self.has_next_grid_order(&next_entry_order, LONG)
         {
-            self.open_orders.long.entry(idx).or_default().entries = calc_entries_long(
+            self.open_orders.long.get_or_insert_default(idx).entries = calc_entries_long(
                 &self.exchange_params_list[idx],
                 &state_params,
                 &self.bot_params_pair.long,
                 &position,
-                &self.trailing_prices.long[&idx],
+                &self.trailing_prices.long[idx],
             );
         } else {
-            self.open_orders.long.entry(idx).or_default().entries = [next_entry_order].to_vec();
+            self.open_orders.long.get_or_insert_default(idx).entries = [next_entry_order].to_vec();
         }
         let next_close_order = calc_next_close_long(
             &self.exchange_params_list[idx],
             &state_params,
             &self.bot_params_pair.long,
             &position,
-            &self.trailing_prices.long[&idx],
+            &self.trailing_prices.long[idx],
         );
         // if initial entry or grid, peek next candle to see if order will fill
         if self.order_filled(k + 1, idx, &next_close_order)
             && self.has_next_grid_order(&next_close_order, LONG)
         {
-            self.open_orders.long.entry(idx).or_default().closes = calc_closes_long(
+            self.open_orders.long.get_or_insert_default(idx).closes = calc_closes_long(
                 &self.exchange_params_list[idx],
                 &state_params,
                 &self.bot_params_pair.long,
                 &position,
-                &self.trailing_prices.long[&idx],
+                &self.trailing_prices.long[idx],
             );
         } else {
-            self.open_orders.long.entry(idx).or_default().closes = [next_close_order].to_vec();
+            self.open_orders.long.get_or_insert_default(idx).closes = [next_close_order].to_vec();
         }
     }
 
@@ -951,26 +1208,27 @@ impl<'a> Backtest<'a> {
         let position = self
             .positions
             .short
-            .get(&idx)
+            .get(idx)
             .cloned()
             .unwrap_or(Position::default());
 
         // check if coin is delisted; if so, close pos as unstuck close
-        if let Some(&delist_timestamp) = self.delist_timestamps.get(&idx) {
-            if k >= delist_timestamp && self.positions.short.contains_key(&idx) {
-                self.open_orders.short.get_mut(&idx).unwrap().closes = [Order {
-                    qty: self.positions.short[&idx].size.abs(),
+        if let Some(delist_timestamp) = self.delist_timestamps[idx] {
+            if k >= delist_timestamp && self.positions.short.contains_key(idx) {
+                self.open_orders.short.get_mut(idx).unwrap().closes = [Order {
+                    qty: self.positions.short[idx].size.abs(),
                     price: round_(
                         f64::max(
-                            self.hlcvs[[k, idx, LOW]] + self.exchange_params_list[idx].price_step,
-                            self.positions.short[&idx].price,
+                            hlcv(self.hlcvs, k, idx, LOW)
+                                + self.exchange_params_list[idx].price_step,
+                            self.positions.short[idx].price,
                         ),
                         self.exchange_params_list[idx].price_step,
                     ),
                     order_type: OrderType::CloseUnstuckLong,
                 }]
                 .to_vec();
-                self.open_orders.short.entry(idx).or_default().entries = Vec::new();
+                self.open_orders.short.get_or_insert_default(idx).entries = Vec::new();
                 return;
             }
         }
@@ -979,21 +1237,21 @@ impl<'a> Backtest<'a> {
             &state_params,
             &self.bot_params_pair.short,
             &position,
-            &self.trailing_prices.short[&idx],
+            &self.trailing_prices.short[idx],
         );
         // if initial entry or grid, peek next candle to see if order will fill
         if self.order_filled(k + 1, idx, &next_entry_order)
             && self.has_next_grid_order(&next_entry_order, SHORT)
         {
-            self.open_orders.short.entry(idx).or_default().entries = calc_entries_short(
+            self.open_orders.short.get_or_insert_default(idx).entries = calc_entries_short(
                 &self.exchange_params_list[idx],
                 &state_params,
                 &self.bot_params_pair.short,
                 &position,
-                &self.trailing_prices.short[&idx],
+                &self.trailing_prices.short[idx],
             );
         } else {
-            self.open_orders.short.entry(idx).or_default().entries = [next_entry_order].to_vec();
+            self.open_orders.short.get_or_insert_default(idx).entries = [next_entry_order].to_vec();
         }
 
         let next_close_order = calc_next_close_short(
@@ -1001,30 +1259,30 @@ impl<'a> Backtest<'a> {
             &state_params,
             &self.bot_params_pair.short,
             &position,
-            &self.trailing_prices.short[&idx],
+            &self.trailing_prices.short[idx],
         );
         // if initial entry or grid, peek next candle to see if order will fill
         if self.order_filled(k + 1, idx, &next_close_order)
             && self.has_next_grid_order(&next_close_order, SHORT)
         {
-            self.open_orders.short.entry(idx).or_default().closes = calc_closes_short(
+            self.open_orders.short.get_or_insert_default(idx).closes = calc_closes_short(
                 &self.exchange_params_list[idx],
                 &state_params,
                 &self.bot_params_pair.short,
                 &position,
-                &self.trailing_prices.short[&idx],
+                &self.trailing_prices.short[idx],
             );
         } else {
-            self.open_orders.short.entry(idx).or_default().closes = [next_close_order].to_vec()
+            self.open_orders.short.get_or_insert_default(idx).closes = [next_close_order].to_vec()
         }
     }
 
     fn order_filled(&self, k: usize, idx: usize, order: &Order) -> bool {
         // check if will fill in next candle
         if order.qty > 0.0 {
-            self.hlcvs[[k, idx, LOW]] < order.price
+            hlcv(self.hlcvs, k, idx, LOW) < order.price
         } else if order.qty < 0.0 {
-            self.hlcvs[[k, idx, HIGH]] > order.price
+            hlcv(self.hlcvs, k, idx, HIGH) > order.price
         } else {
             false
         }
@@ -1044,11 +1302,8 @@ impl<'a> Backtest<'a> {
             );
             if unstuck_allowances.0 > 0.0 {
                 // Check long positions
-                // Sort the keys for long
-                let mut long_keys: Vec<usize> = self.positions.long.keys().cloned().collect();
-                long_keys.sort();
-                for idx in long_keys {
-                    let position = &self.positions.long[&idx];
+                for idx in self.positions.long.keys().iter() {
+                    let position = &self.positions.long[idx];
                     let wallet_exposure = calc_wallet_exposure(
                         self.exchange_params_list[idx].c_mult,
                         self.balance,
@@ -1058,8 +1313,11 @@ impl<'a> Backtest<'a> {
                     if wallet_exposure / self.bot_params_pair.long.wallet_exposure_limit
                         > self.bot_params_pair.long.unstuck_threshold
                     {
-                        let pprice_diff =
-                            calc_pprice_diff_int(LONG, position.price, self.hlcvs[[k, idx, CLOSE]]);
+                        let pprice_diff = calc_pprice_diff_int(
+                            LONG,
+                            position.price,
+                            hlcv(self.hlcvs, k, idx, CLOSE),
+                        );
                         stuck_positions.push((idx, LONG, pprice_diff));
                     }
                 }
@@ -1076,12 +1334,8 @@ impl<'a> Backtest<'a> {
             );
             if unstuck_allowances.1 > 0.0 {
                 // Check short positions
-                // Sort the keys for short
-                let mut short_keys: Vec<usize> = self.positions.short.keys().cloned().collect();
-                short_keys.sort();
-
-                for idx in short_keys {
-                    let position = &self.positions.short[&idx];
+                for idx in self.positions.short.keys().iter() {
+                    let position = &self.positions.short[idx];
                     let wallet_exposure = calc_wallet_exposure(
                         self.exchange_params_list[idx].c_mult,
                         self.balance,
@@ -1094,7 +1348,7 @@ impl<'a> Backtest<'a> {
                         let pprice_diff = calc_pprice_diff_int(
                             SHORT,
                             position.price,
-                            self.hlcvs[[k, idx, CLOSE]],
+                            hlcv(self.hlcvs, k, idx, CLOSE),
                         );
                         stuck_positions.push((idx, SHORT, pprice_diff));
                     }
@@ -1115,21 +1369,21 @@ impl<'a> Backtest<'a> {
             match pside {
                 LONG => {
                     let close_price = f64::max(
-                        self.hlcvs[[k, idx, CLOSE]],
+                        hlcv(self.hlcvs, k, idx, CLOSE),
                         round_up(
                             self.emas[idx].compute_bands(LONG).upper
                                 * (1.0 + self.bot_params_pair.long.unstuck_ema_dist),
                             self.exchange_params_list[idx].price_step,
                         ),
                     );
-                    if self.open_orders.long[&idx].closes.is_empty()
-                        || self.open_orders.long[&idx].closes[0].qty == 0.0
-                        || close_price < self.open_orders.long[&idx].closes[0].price
+                    if self.open_orders.long[idx].closes.is_empty()
+                        || self.open_orders.long[idx].closes[0].qty == 0.0
+                        || close_price < self.open_orders.long[idx].closes[0].price
                     {
                         let min_entry_qty =
                             calc_min_entry_qty(close_price, &self.exchange_params_list[idx]);
                         let mut close_qty = -f64::min(
-                            self.positions.long[&idx].size,
+                            self.positions.long[idx].size,
                             f64::max(
                                 min_entry_qty,
                                 round_dn(
@@ -1146,7 +1400,7 @@ impl<'a> Backtest<'a> {
                         );
                         if close_qty != 0.0 {
                             let pnl_if_closed = calc_pnl_long(
-                                self.positions.long[&idx].price,
+                                self.positions.long[idx].price,
                                 close_price,
                                 close_qty,
                                 self.exchange_params_list[idx].c_mult,
@@ -1156,7 +1410,7 @@ impl<'a> Backtest<'a> {
                                 // means unstuck allowance would be exceeded
                                 // reduce qty
                                 close_qty = -f64::min(
-                                    self.positions.long[&idx].size,
+                                    self.positions.long[idx].size,
                                     f64::max(
                                         min_entry_qty,
                                         round_dn(
@@ -1181,21 +1435,21 @@ impl<'a> Backtest<'a> {
                 }
                 SHORT => {
                     let close_price = f64::min(
-                        self.hlcvs[[k, idx, CLOSE]],
+                        hlcv(self.hlcvs, k, idx, CLOSE),
                         round_dn(
                             self.emas[idx].compute_bands(SHORT).lower
                                 * (1.0 - self.bot_params_pair.short.unstuck_ema_dist),
                             self.exchange_params_list[idx].price_step,
                         ),
                     );
-                    if self.open_orders.short[&idx].closes.is_empty()
-                        || self.open_orders.short[&idx].closes[0].qty == 0.0
-                        || close_price > self.open_orders.short[&idx].closes[0].price
+                    if self.open_orders.short[idx].closes.is_empty()
+                        || self.open_orders.short[idx].closes[0].qty == 0.0
+                        || close_price > self.open_orders.short[idx].closes[0].price
                     {
                         let min_entry_qty =
                             calc_min_entry_qty(close_price, &self.exchange_params_list[idx]);
                         let mut close_qty = f64::min(
-                            self.positions.short[&idx].size.abs(),
+                            self.positions.short[idx].size.abs(),
                             f64::max(
                                 min_entry_qty,
                                 round_dn(
@@ -1212,7 +1466,7 @@ impl<'a> Backtest<'a> {
                         );
                         if close_qty != 0.0 {
                             let pnl_if_closed = calc_pnl_short(
-                                self.positions.short[&idx].price,
+                                self.positions.short[idx].price,
                                 close_price,
                                 close_qty,
                                 self.exchange_params_list[idx].c_mult,
@@ -1222,7 +1476,7 @@ impl<'a> Backtest<'a> {
                                 // means unstuck allowance would be exceeded
                                 // reduce qty
                                 close_qty = f64::min(
-                                    self.positions.short[&idx].size.abs(),
+                                    self.positions.short[idx].size.abs(),
                                     f64::max(
                                         min_entry_qty,
                                         round_dn(
@@ -1254,46 +1508,34 @@ impl<'a> Backtest<'a> {
     fn update_open_orders_any_fill(&mut self, k: usize) {
         if self.trading_enabled.long {
             if self.trailing_enabled.long {
-                let mut positions_long_indices: Vec<usize> =
-                    self.positions.long.keys().cloned().collect();
-                positions_long_indices.sort();
-                for idx in &positions_long_indices {
-                    if !self.did_fill_long.contains(&idx) {
-                        self.update_trailing_prices(k, *idx, LONG);
-                    }
-                }
+                self.update_trailing_prices_no_fill(k, LONG);
             }
             self.update_actives(k, LONG);
             self.open_orders
                 .long
-                .retain(|&idx, _| self.actives.long.contains(&idx));
-            let mut active_long_indices: Vec<usize> = self.actives.long.iter().cloned().collect();
-            active_long_indices.sort(); // Ensure deterministic order
-            for &idx in &active_long_indices {
+                .retain(|idx| self.actives.long.contains(idx));
+            // actives are iterated in ascending coin order
+            let mut cursor = self.actives.long.first();
+            while let Some(idx) = cursor {
                 self.update_stuck_status(idx, LONG);
                 self.update_open_orders_long_single(k, idx);
+                cursor = self.actives.long.next_from(idx + 1);
             }
         }
         if self.trading_enabled.short {
             if self.trailing_enabled.short {
-                let mut positions_short_indices: Vec<usize> =
-                    self.positions.short.keys().cloned().collect();
-                positions_short_indices.sort();
-                for idx in &positions_short_indices {
-                    if !self.did_fill_short.contains(&idx) {
-                        self.update_trailing_prices(k, *idx, SHORT);
-                    }
-                }
+                self.update_trailing_prices_no_fill(k, SHORT);
             }
             self.update_actives(k, SHORT);
             self.open_orders
                 .short
-                .retain(|&idx, _| self.actives.short.contains(&idx));
-            let mut active_short_indices: Vec<usize> = self.actives.short.iter().cloned().collect();
-            active_short_indices.sort(); // Ensure deterministic order
-            for &idx in &active_short_indices {
+                .retain(|idx| self.actives.short.contains(idx));
+            // actives are iterated in ascending coin order
+            let mut cursor = self.actives.short.first();
+            while let Some(idx) = cursor {
                 self.update_stuck_status(idx, SHORT);
                 self.update_open_orders_short_single(k, idx);
+                cursor = self.actives.short.next_from(idx + 1);
             }
         }
         let (unstucking_idx, unstucking_pside, unstucking_close) = self.calc_unstucking_close(k);
@@ -1302,14 +1544,14 @@ impl<'a> Backtest<'a> {
                 LONG => {
                     self.open_orders
                         .long
-                        .get_mut(&unstucking_idx)
+                        .get_mut(unstucking_idx)
                         .unwrap()
                         .closes = [unstucking_close].to_vec();
                 }
                 SHORT => {
                     self.open_orders
                         .short
-                        .get_mut(&unstucking_idx)
+                        .get_mut(unstucking_idx)
                         .unwrap()
                         .closes = [unstucking_close].to_vec();
                 }
@@ -1325,77 +1567,52 @@ impl<'a> Backtest<'a> {
         // - entries for coins with open trailing entries
         // - closes for coins with open trailing closes
         if self.trading_enabled.long {
-            let mut positions_long_indices: Vec<usize> =
-                self.positions.long.keys().cloned().collect();
-            positions_long_indices.sort();
             if self.trailing_enabled.long {
-                for idx in &positions_long_indices {
-                    if !self.did_fill_long.contains(idx) {
-                        self.update_trailing_prices(k, *idx, LONG);
-                    }
-                }
+                self.update_trailing_prices_no_fill(k, LONG);
             }
             let mut actives_without_pos = Vec::<usize>::new();
-            if positions_long_indices.len() < self.bot_params_pair.long.n_positions {
+            if self.positions.long.len() < self.bot_params_pair.long.n_positions {
                 actives_without_pos = self.update_actives(k, LONG);
                 self.open_orders
                     .long
-                    .retain(|&idx, _| self.actives.long.contains(&idx));
+                    .retain(|idx| self.actives.long.contains(idx));
             }
-            let mut active_long_indices: Vec<usize> = self.actives.long.iter().cloned().collect();
-            active_long_indices.sort();
-
-            for idx in active_long_indices {
+            let mut cursor = self.actives.long.first();
+            while let Some(idx) = cursor {
                 if actives_without_pos.contains(&idx)
-                    || self.open_orders.long.get(&idx).map_or(false, |orders| {
-                        orders.closes.iter().any(|order| {
-                            order.order_type == OrderType::CloseUnstuckLong
-                                || order.order_type == OrderType::CloseTrailingLong
-                        }) || orders.entries.iter().any(|order| {
-                            order.order_type == OrderType::EntryTrailingNormalLong
-                                || order.order_type == OrderType::EntryTrailingCroppedLong
-                        })
-                    })
+                    || self
+                        .open_orders
+                        .long
+                        .get(idx)
+                        .map_or(false, |orders| has_trailing_or_unstuck_orders(orders, LONG))
                 {
                     self.update_open_orders_long_single(k, idx);
                 }
+                cursor = self.actives.long.next_from(idx + 1);
             }
         }
 
         if self.trading_enabled.short {
-            let mut positions_short_indices: Vec<usize> =
-                self.positions.short.keys().cloned().collect();
-            positions_short_indices.sort();
             if self.trailing_enabled.short {
-                for idx in &positions_short_indices {
-                    if !self.did_fill_short.contains(idx) {
-                        self.update_trailing_prices(k, *idx, SHORT);
-                    }
-                }
+                self.update_trailing_prices_no_fill(k, SHORT);
             }
             let mut actives_without_pos = Vec::<usize>::new();
-            if positions_short_indices.len() < self.bot_params_pair.short.n_positions {
+            if self.positions.short.len() < self.bot_params_pair.short.n_positions {
                 actives_without_pos = self.update_actives(k, SHORT);
                 self.open_orders
                     .short
-                    .retain(|&idx, _| self.actives.short.contains(&idx));
+                    .retain(|idx| self.actives.short.contains(idx));
             }
-            let mut active_short_indices: Vec<usize> = self.actives.short.iter().cloned().collect();
-            active_short_indices.sort();
-            for idx in active_short_indices {
+            let mut cursor = self.actives.short.first();
+            while let Some(idx) = cursor {
                 if actives_without_pos.contains(&idx)
-                    || self.open_orders.short.get(&idx).map_or(false, |orders| {
-                        orders.closes.iter().any(|order| {
-                            order.order_type == OrderType::CloseUnstuckShort
-                                || order.order_type == OrderType::CloseTrailingShort
-                        }) || orders.entries.iter().any(|order| {
-                            order.order_type == OrderType::EntryTrailingNormalShort
-                                || order.order_type == OrderType::EntryTrailingCroppedShort
-                        })
+                    || self.open_orders.short.get(idx).map_or(false, |orders| {
+                        has_trailing_or_unstuck_orders(orders, SHORT)
                     })
                 {
                     self.update_open_orders_short_single(k, idx);
                 }
+                cursor = self.actives.short.next_from(idx + 1);
             }
         }
 
@@ -1405,12 +1622,12 @@ impl<'a> Backtest<'a> {
             if unstucking_pside != NO_POS {
                 match unstucking_pside {
                     LONG => {
-                        if let Some(orders) = self.open_orders.long.get_mut(&unstucking_idx) {
+                        if let Some(orders) = self.open_orders.long.get_mut(unstucking_idx) {
                             orders.closes = vec![unstucking_close];
                         }
                     }
                     SHORT => {
-                        if let Some(orders) = self.open_orders.short.get_mut(&unstucking_idx) {
+                        if let Some(orders) = self.open_orders.short.get_mut(unstucking_idx) {
                             orders.closes = vec![unstucking_close];
                         }
                     }
@@ -1431,7 +1648,7 @@ impl<'a> Backtest<'a> {
     #[inline]
     fn update_emas(&mut self, k: usize) {
         for i in 0..self.n_coins {
-            let close_price = self.hlcvs[[k, i, CLOSE]];
+            let close_price = hlcv(self.hlcvs, k, i, CLOSE);
 
             let long_alphas = &self.ema_alphas.long.alphas;
             let long_alphas_inv = &self.ema_alphas.long.alphas_inv;
@@ -1448,6 +1665,126 @@ impl<'a> Backtest<'a> {
     }
 }
 
+/// True if any of the orders is a trailing order or an unstucking close, which need to be
+/// recomputed every step.
+fn has_trailing_or_unstuck_orders(orders: &OpenOrderBundleNew, pside: usize) -> bool {
+    match pside {
+        LONG => {
+            orders.closes.iter().any(|order| {
+                order.order_type == OrderType::CloseUnstuckLong
+                    || order.order_type == OrderType::CloseTrailingLong
+            }) || orders.entries.iter().any(|order| {
+                order.order_type == OrderType::EntryTrailingNormalLong
+                    || order.order_type == OrderType::EntryTrailingCroppedLong
+            })
+        }
+        SHORT => {
+            orders.closes.iter().any(|order| {
+                order.order_type == OrderType::CloseUnstuckShort
+                    || order.order_type == OrderType::CloseTrailingShort
+            }) || orders.entries.iter().any(|order| {
+                order.order_type == OrderType::EntryTrailingNormalShort
+                    || order.order_type == OrderType::EntryTrailingCroppedShort
+            })
+        }
+        _ => panic!("Invalid pside"),
+    }
+}
+
+/// Checks the equity of every minute against AbortThresholds.
+struct AbortTracker {
+    thresholds: AbortThresholds,
+    starting_balance: f64,
+    // greatest daily equity minimum of the days before current_day
+    daily_min_peak: f64,
+    current_day: usize,
+    current_min: f64,
+}
+
+impl AbortTracker {
+    fn new(thresholds: AbortThresholds, starting_balance: f64) -> Self {
+        AbortTracker {
+            thresholds,
+            starting_balance,
+            daily_min_peak: f64::NEG_INFINITY,
+            current_day: 0,
+            // the equity at minute 0
+            current_min: starting_balance,
+        }
+    }
+
+    /// True if the equity at minute k breaches a threshold. Must be called with k = 1, 2, ...
+    ///
+    /// The drawdown is measured like drawdown_worst, from the peak of the daily equity
+    /// minimums. As the current day's minimum is at most the current equity, the day's
+    /// drawdown in the analysis is at least the drawdown checked here.
+    fn is_breached(&mut self, k: usize, equity: f64, balance: f64) -> bool {
+        let day = k / 1440;
+        if day > self.current_day {
+            self.daily_min_peak = self.daily_min_peak.max(self.current_min);
+            self.current_day = day;
+            self.current_min = equity;
+        } else {
+            self.current_min = self.current_min.min(equity);
+        }
+        let thresholds = &self.thresholds;
+        (thresholds.drawdown_worst != 0.0
+            && self.daily_min_peak > 0.0
+            && 1.0 - equity / self.daily_min_peak > thresholds.drawdown_worst)
+            || (thresholds.equity_balance_diff_neg_max != 0.0
+                && (balance - equity) / balance > thresholds.equity_balance_diff_neg_max)
+            || (thresholds.equity_floor != 0.0
+                && equity < thresholds.equity_floor * self.starting_balance)
+    }
+}
+
+/// Folds per-minute equities into an EquityCurve at the resolution of an EquitySampling.
+/// Samples start at minutes which are multiples of the bucket length.
+struct EquitySampler {
+    bucket_len: usize,
+    curve: EquityCurve,
+}
+
+impl EquitySampler {
+    fn new(equity_sampling: EquitySampling, n_equities: usize) -> Self {
+        let bucket_len = equity_sampling.bucket_len();
+        let n_samples = (n_equities + bucket_len - 1) / bucket_len;
+        let mut curve = EquityCurve {
+            minutes: Vec::with_capacity(n_samples),
+            equity: Vec::with_capacity(n_samples),
+            min: Vec::new(),
+            max: Vec::new(),
+        };
+        if bucket_len > 1 {
+            curve.min.reserve_exact(n_samples);
+            curve.max.reserve_exact(n_samples);
+        }
+        EquitySampler { bucket_len, curve }
+    }
+
+    /// Adds the equity at minute k. Must be called with k = 0, 1, 2, ...
+    fn add(&mut self, k: usize, equity: f64) {
+        if self.bucket_len == 1 {
+            self.curve.minutes.push(k);
+            self.curve.equity.push(equity);
+        } else if k % self.bucket_len == 0 {
+            self.curve.minutes.push(k);
+            self.curve.equity.push(equity);
+            self.curve.min.push(equity);
+            self.curve.max.push(equity);
+        } else {
+            let last_min = self.curve.min.last_mut().unwrap();
+            *last_min = last_min.min(equity);
+            let last_max = self.curve.max.last_mut().unwrap();
+            *last_max = last_max.max(equity);
+        }
+    }
+
+    fn finalize(self) -> EquityCurve {
+        self.curve
+    }
+}
+
 fn calc_ema_alphas(bot_params_pair: &BotParamsPair) -> EmaAlphas {
     let mut ema_spans_long = [
         bot_params_pair.long.ema_span_0,
@@ -1481,44 +1818,98 @@ fn calc_ema_alphas(bot_params_pair: &BotParamsPair) -> EmaAlphas {
     }
 }
 
-fn analyze_backtest_basic(fills: &[Fill], equities: &Vec<f64>) -> Analysis {
-    if fills.len() <= 1 {
-        return Analysis::default();
+/// Running sums and extremes of (equity - balance) / balance, tracked separately for
+/// positive and negative differences.
+#[derive(Clone, Default, Debug)]
+struct EquityBalanceDiffs {
+    pos_sum: f64,
+    pos_count: usize,
+    pos_max: f64,
+    neg_sum: f64,
+    neg_count: usize,
+    neg_max: f64,
+}
+
+impl EquityBalanceDiffs {
+    fn add(&mut self, balance: f64, equity: f64) {
+        let ebd = (equity - balance) / balance;
+        if ebd > 0.0 {
+            self.pos_sum += ebd;
+            self.pos_count += 1;
+            self.pos_max = f64::max(self.pos_max, ebd);
+        } else if ebd < 0.0 {
+            self.neg_sum += ebd.abs();
+            self.neg_count += 1;
+            self.neg_max = f64::max(self.neg_max, ebd.abs());
+        }
     }
-    // Calculate daily equities
-    let mut daily_eqs = Vec::new();
-    let mut current_day = 0;
-    let mut current_min = equities[0];
 
-    for (i, &equity) in equities.iter().enumerate() {
-        let day = i / 1440;
-        if day > current_day {
-            daily_eqs.push(current_min);
-            current_day = day;
-            current_min = equity;
+    fn pos_mean(&self) -> f64 {
+        if self.pos_count > 0 {
+            self.pos_sum / self.pos_count as f64
         } else {
-            current_min = current_min.min(equity);
+            0.0
         }
     }
-    if current_min != f64::INFINITY {
-        daily_eqs.push(current_min);
+
+    fn neg_mean(&self) -> f64 {
+        if self.neg_count > 0 {
+            self.neg_sum / self.neg_count as f64
+        } else {
+            0.0
+        }
     }
+}
 
+fn is_long_fill(fill: &Fill) -> bool {
+    matches!(
+        fill.order_type,
+        OrderType::EntryInitialNormalLong
+            | OrderType::EntryInitialPartialLong
+            | OrderType::EntryTrailingNormalLong
+            | OrderType::EntryTrailingCroppedLong
+            | OrderType::EntryGridNormalLong
+            | OrderType::EntryGridCroppedLong
+            | OrderType::EntryGridInflatedLong
+            | OrderType::CloseGridLong
+            | OrderType::CloseTrailingLong
+            | OrderType::CloseUnstuckLong
+            | OrderType::CloseAutoReduceLong
+    )
+}
+
+fn cmp_f64(a: &f64, b: &f64) -> Ordering {
+    a.partial_cmp(b).unwrap_or(Ordering::Equal)
+}
+
+/// Computes the metrics of a single (sub)period from its daily equity minimums,
+/// equity/balance differences, realized pnl sums and position durations (in minutes).
+fn analysis_from_components(
+    daily_eqs: &[f64],
+    ebds: &EquityBalanceDiffs,
+    gain: f64,
+    total_profit: f64,
+    total_loss: f64,
+    durations: &[usize],
+    n_equities: usize,
+) -> Analysis {
     // Calculate daily percentage changes
     let daily_eqs_pct_change: Vec<f64> =
         daily_eqs.windows(2).map(|w| (w[1] - w[0]) / w[0]).collect();
 
     // Calculate ADG and standard metrics
     let adg = daily_eqs_pct_change.iter().sum::<f64>() / daily_eqs_pct_change.len() as f64;
+    // Order statistics only need partial sorts; scratch is reordered by each of them
+    let mut scratch = daily_eqs_pct_change.clone();
     let mdg = {
-        let mut sorted_pct_change = daily_eqs_pct_change.clone();
-        sorted_pct_change.sort_by(|a, b| a.partial_cmp(b).unwrap_or(Ordering::Equal));
-        if sorted_pct_change.len() % 2 == 0 {
-            (sorted_pct_change[sorted_pct_change.len() / 2 - 1]
-                + sorted_pct_change[sorted_pct_change.len() / 2])
-                / 2.0
+        let n = scratch.len();
+        let (lower, median, _) = scratch.select_nth_unstable_by(n / 2, cmp_f64);
+        if n % 2 == 0 {
+            // the largest of the lower half is the other middle value
+            let lower_max = lower.iter().copied().fold(f64::NEG_INFINITY, f64::max);
+            (lower_max + *median) / 2.0
         } else {
-            sorted_pct_change[sorted_pct_change.len() / 2]
+            *median
         }
     };
 
@@ -1534,14 +1925,12 @@ fn analyze_backtest_basic(fills: &[Fill], equities: &Vec<f64>) -> Analysis {
     let sharpe_ratio = if std_dev != 0.0 { adg / std_dev } else { 0.0 };
 
     // Calculate Sortino Ratio (using downside deviation)
-    let downside_returns: Vec<f64> = daily_eqs_pct_change
+    let (downside_sum_sq, n_downside) = daily_eqs_pct_change
         .iter()
         .filter(|&&x| x < 0.0)
-        .cloned()
-        .collect();
-    let downside_deviation = if !downside_returns.is_empty() {
-        (downside_returns.iter().map(|x| x.powi(2)).sum::<f64>() / downside_returns.len() as f64)
-            .sqrt()
+        .fold((0.0, 0usize), |(sum_sq, n), &x| (sum_sq + x.powi(2), n + 1));
+    let downside_deviation = if n_downside > 0 {
+        (downside_sum_sq / n_downside as f64).sqrt()
     } else {
         0.0
     };
@@ -1570,32 +1959,28 @@ fn analyze_backtest_basic(fills: &[Fill], equities: &Vec<f64>) -> Analysis {
 
     // Calculate Expected Shortfall (99%)
     let expected_shortfall_1pct = {
-        let mut sorted_returns = daily_eqs_pct_change.clone();
-        sorted_returns.sort_by(|a, b| a.partial_cmp(b).unwrap_or(Ordering::Equal));
         let cutoff_index = (daily_eqs_pct_change.len() as f64 * 0.01) as usize;
         if cutoff_index > 0 {
-            sorted_returns[..cutoff_index]
-                .iter()
-                .map(|x| x.abs())
-                .sum::<f64>()
-                / cutoff_index as f64
+            // the worst cutoff_index returns, summed in ascending order
+            let (worst, nth, _) = scratch.select_nth_unstable_by(cutoff_index - 1, cmp_f64);
+            worst.sort_by(cmp_f64);
+            (worst.iter().map(|x| x.abs()).sum::<f64>() + nth.abs()) / cutoff_index as f64
         } else {
-            sorted_returns[0].abs()
+            scratch.iter().copied().fold(f64::INFINITY, f64::min).abs()
         }
     };
 
     // Calculate drawdowns
-    let drawdowns = calc_drawdowns(&daily_eqs);
+    let drawdowns = calc_drawdowns(daily_eqs);
     let drawdown_worst_mean_1pct = {
-        let mut sorted_drawdowns = drawdowns.clone();
-        sorted_drawdowns.sort_by(|a, b| b.abs().partial_cmp(&a.abs()).unwrap_or(Ordering::Equal));
-        let cutoff_index = std::cmp::max(1, (sorted_drawdowns.len() as f64 * 0.01) as usize);
-        let worst_n = std::cmp::min(cutoff_index, sorted_drawdowns.len());
-        sorted_drawdowns[..worst_n]
-            .iter()
-            .map(|x| x.abs())
-            .sum::<f64>()
-            / worst_n as f64
+        let mut drawdowns = drawdowns.clone();
+        let cmp_abs_desc = |a: &f64, b: &f64| cmp_f64(&b.abs(), &a.abs());
+        let cutoff_index = std::cmp::max(1, (drawdowns.len() as f64 * 0.01) as usize);
+        let worst_n = std::cmp::min(cutoff_index, drawdowns.len());
+        // the worst_n largest drawdowns, summed in descending order
+        let (worst, nth, _) = drawdowns.select_nth_unstable_by(worst_n - 1, cmp_abs_desc);
+        worst.sort_by(cmp_abs_desc);
+        (worst.iter().map(|x| x.abs()).sum::<f64>() + nth.abs()) / worst_n as f64
     };
     let drawdown_worst = drawdowns
         .iter()
@@ -1616,101 +2001,14 @@ fn analyze_backtest_basic(fills: &[Fill], equities: &Vec<f64>) -> Analysis {
         0.0
     };
 
-    // Calculate equity-balance differences
-    let mut bal_eq = Vec::with_capacity(equities.len());
-    let mut fill_iter = fills.iter().peekable();
-    let mut last_balance = fills[0].balance;
-
-    for (i, &equity) in equities.iter().enumerate() {
-        while let Some(fill) = fill_iter.peek() {
-            if fill.index <= i {
-                last_balance = fill.balance;
-                fill_iter.next();
-            } else {
-                break;
-            }
-        }
-        bal_eq.push((last_balance, equity));
-    }
-
-    // Calculate equity-balance differences with separate positive and negative tracking
-    let mut ebds_pos = Vec::new();
-    let mut ebds_neg = Vec::new();
-
-    for &(balance, equity) in bal_eq.iter() {
-        let ebd = (equity - balance) / balance;
-        if ebd > 0.0 {
-            ebds_pos.push(ebd);
-        } else if ebd < 0.0 {
-            ebds_neg.push(ebd);
-        }
-    }
-
-    let equity_balance_diff_pos_max = ebds_pos.iter().fold(0.0, |max, &x| f64::max(max, x));
-    let equity_balance_diff_pos_mean = if !ebds_pos.is_empty() {
-        ebds_pos.iter().sum::<f64>() / ebds_pos.len() as f64
-    } else {
-        0.0
-    };
-
-    let equity_balance_diff_neg_max = ebds_neg.iter().fold(0.0, |max, &x| f64::max(max, x.abs()));
-    let equity_balance_diff_neg_mean = if !ebds_neg.is_empty() {
-        ebds_neg.iter().map(|x| x.abs()).sum::<f64>() / ebds_neg.len() as f64
-    } else {
-        0.0
-    };
-
-    let gain = fills[fills.len() - 1].balance / fills[0].balance;
-
-    // Calculate profit factor
-    let (total_profit, total_loss) = fills.iter().fold((0.0, 0.0), |(profit, loss), fill| {
-        if fill.pnl > 0.0 {
-            (profit + fill.pnl, loss)
-        } else {
-            (profit, loss + fill.pnl.abs())
-        }
-    });
     let loss_profit_ratio = if total_profit == 0.0 {
         f64::INFINITY
     } else {
         total_loss / total_profit
     };
 
-    // Calculate position durations
-    let mut positions_opened: HashMap<String, usize> = HashMap::new();
-    let mut durations: Vec<usize> = Vec::new();
-
-    for fill in fills {
-        let key = format!(
-            "{}_{}",
-            fill.coin,
-            if fill.order_type.to_string().contains("long") {
-                "long"
-            } else {
-                "short"
-            }
-        );
-
-        if !positions_opened.contains_key(&key) {
-            positions_opened.insert(key.clone(), fill.index);
-        }
-
-        if fill.position_size == 0.0 {
-            if let Some(&start_idx) = positions_opened.get(&key) {
-                durations.push(fill.index - start_idx);
-                positions_opened.remove(&key);
-            }
-        }
-    }
-
-    // Add remaining open positions
-    let last_index = fills.last().map_or(0, |f| f.index);
-    for (_key, &start_idx) in positions_opened.iter() {
-        durations.push(last_index - start_idx);
-    }
-
     // Calculate duration statistics
-    let n_days = (equities.len() as f64) / 1440.0; // Convert minutes to days
+    let n_days = (n_equities as f64) / 1440.0; // Convert minutes to days
     let positions_held_per_day = durations.len() as f64 / n_days;
 
     let position_held_hours_mean = if !durations.is_empty() {
@@ -1726,7 +2024,7 @@ fn analyze_backtest_basic(fills: &[Fill], equities: &Vec<f64>) -> Analysis {
     };
 
     let position_held_hours_median = if !durations.is_empty() {
-        let mut sorted_durations = durations.clone();
+        let mut sorted_durations = durations.to_vec();
         sorted_durations.sort_unstable();
         let mid = sorted_durations.len() / 2;
         if sorted_durations.len() % 2 == 0 {
@@ -1750,10 +2048,10 @@ fn analyze_backtest_basic(fills: &[Fill], equities: &Vec<f64>) -> Analysis {
     analysis.sterling_ratio = sterling_ratio;
     analysis.drawdown_worst = drawdown_worst;
     analysis.drawdown_worst_mean_1pct = drawdown_worst_mean_1pct;
-    analysis.equity_balance_diff_neg_max = equity_balance_diff_neg_max;
-    analysis.equity_balance_diff_neg_mean = equity_balance_diff_neg_mean;
-    analysis.equity_balance_diff_pos_max = equity_balance_diff_pos_max;
-    analysis.equity_balance_diff_pos_mean = equity_balance_diff_pos_mean;
+    analysis.equity_balance_diff_neg_max = ebds.neg_max;
+    analysis.equity_balance_diff_neg_mean = ebds.neg_mean();
+    analysis.equity_balance_diff_pos_max = ebds.pos_max;
+    analysis.equity_balance_diff_pos_mean = ebds.pos_mean();
     analysis.loss_profit_ratio = loss_profit_ratio;
     analysis.positions_held_per_day = positions_held_per_day;
     analysis.position_held_hours_mean = position_held_hours_mean;
@@ -1763,49 +2061,16 @@ fn analyze_backtest_basic(fills: &[Fill], equities: &Vec<f64>) -> Analysis {
     analysis
 }
 
-pub fn analyze_backtest(fills: &[Fill], equities: &Vec<f64>) -> Analysis {
-    let mut analysis = analyze_backtest_basic(fills, equities);
-
-    if fills.len() <= 1 {
-        return analysis;
-    }
-
-    let n = equities.len();
-    let mut subset_analyses = Vec::with_capacity(10);
-    subset_analyses.push(analysis.clone());
-
-    for i in 1..10 {
-        // fraction of the data we want to keep:
-        //  i=1 => fraction = 0.5       => last half
-        //  i=2 => fraction = 0.3333    => last third
-        //  i=3 => fraction = 0.25      => last quarter
-        //  etc.
-        let fraction = 1.0 / (1.0 + i as f64);
-
-        // start index for slicing the 'last' fraction
-        let start_idx = (n as f64 - fraction * (n as f64)).round() as usize;
-
-        // slice from start_idx to the end
-        let subset_equities = &equities[start_idx..];
-        if subset_equities.len() == 0 {
-            break;
-        }
-
-        // filter fills that happened after or at start_idx
-        let subset_fills: Vec<Fill> = fills
-            .iter()
-            .filter(|fill| fill.index >= start_idx)
-            .cloned()
-            .collect();
-        if subset_fills.len() == 0 {
-            break;
-        }
-
-        let subset_analysis = analyze_backtest_basic(&subset_fills, &subset_equities.to_vec());
-        subset_analyses.push(subset_analysis);
-    }
+/// Start index of the i-th subset used for the weighted metrics.
+/// i=0 is the full period, i=1 the last half, i=2 the last third, etc.
+fn subset_start_idx(n: usize, i: usize) -> usize {
+    let fraction = 1.0 / (1.0 + i as f64);
+    (n as f64 - fraction * (n as f64)).round() as usize
+}
 
-    // Compute weighted metrics as the mean of subset analyses
+/// Sets the weighted metrics as the mean of the subset analyses.
+/// Missing subsets (no equities or no fills) count as zero.
+fn apply_weighted_metrics(analysis: &mut Analysis, subset_analyses: &[Analysis]) {
     analysis.adg_w = subset_analyses.iter().map(|a| a.adg).sum::<f64>() / 10.0;
     analysis.mdg_w = subset_analyses.iter().map(|a| a.mdg).sum::<f64>() / 10.0;
     analysis.sharpe_ratio_w = subset_analyses.iter().map(|a| a.sharpe_ratio).sum::<f64>() / 10.0;
@@ -1822,8 +2087,240 @@ pub fn analyze_backtest(fills: &[Fill], equities: &Vec<f64>) -> Analysis {
         .map(|a| a.loss_profit_ratio)
         .sum::<f64>()
         / 10.0;
+}
 
-    analysis
+/// Analysis of the fills and per-minute equities of a finished backtest.
+/// Both are scanned once and fed to an AnalysisAccumulator, which computes the full period and
+/// the subsets for the weighted metrics side by side.
+pub fn analyze_backtest(fills: &[Fill], equities: &[f64]) -> Analysis {
+    let mut accumulator = AnalysisAccumulator::new(equities.len());
+    let mut fill_iter = fills.iter().peekable();
+    for (i, &equity) in equities.iter().enumerate() {
+        while let Some(fill) = fill_iter.next_if(|fill| fill.index <= i) {
+            accumulator.add_fill(fill);
+        }
+        accumulator.add_equity(i, equity);
+    }
+    for fill in fill_iter {
+        accumulator.add_fill(fill);
+    }
+    accumulator.finalize()
+}
+
+fn position_key(coin: usize, is_long: bool) -> usize {
+    2 * coin + is_long as usize
+}
+
+/// Accumulates the analysis of one subset of the backtest: the minutes from start_idx onwards
+/// and the fills among them.
+/// Keeps only the daily equity minimums, running sums and position durations.
+struct SubsetAccumulator {
+    start_idx: usize,
+    n_equities: usize,
+    daily_eqs: Vec<f64>,
+    current_day: usize,
+    current_min: f64,
+    ebds: EquityBalanceDiffs,
+    // equities seen before the subset's first fill; their balance is the first fill's balance
+    pending_equities: Vec<f64>,
+    fill_cursor: usize,
+    ebd_balance: f64,
+    n_fills: usize,
+    first_balance: f64,
+    last_balance: f64,
+    last_fill_index: usize,
+    total_profit: f64,
+    total_loss: f64,
+    // opening fill index per position, indexed by position_key
+    positions_opened: Vec<Option<usize>>,
+    durations: Vec<usize>,
+}
+
+impl SubsetAccumulator {
+    fn new(start_idx: usize) -> Self {
+        SubsetAccumulator {
+            start_idx,
+            n_equities: 0,
+            daily_eqs: Vec::new(),
+            current_day: 0,
+            current_min: f64::INFINITY,
+            ebds: EquityBalanceDiffs::default(),
+            pending_equities: Vec::new(),
+            fill_cursor: 0,
+            ebd_balance: 0.0,
+            n_fills: 0,
+            first_balance: 0.0,
+            last_balance: 0.0,
+            last_fill_index: 0,
+            total_profit: 0.0,
+            total_loss: 0.0,
+            positions_opened: Vec::new(),
+            durations: Vec::new(),
+        }
+    }
+
+    fn add_equity(&mut self, equity: f64, fill_log: &[(usize, f64)]) {
+        let i = self.n_equities;
+        if i == 0 {
+            self.current_min = equity;
+        }
+        let day = i / 1440;
+        if day > self.current_day {
+            self.daily_eqs.push(self.current_min);
+            self.current_day = day;
+            self.current_min = equity;
+        } else {
+            self.current_min = self.current_min.min(equity);
+        }
+        self.n_equities += 1;
+
+        if self.n_fills == 0 {
+            self.pending_equities.push(equity);
+        } else {
+            self.add_equity_balance_diff(i, equity, fill_log);
+        }
+    }
+
+    fn add_equity_balance_diff(&mut self, i: usize, equity: f64, fill_log: &[(usize, f64)]) {
+        // Fill indices are global but are compared with the subset-local equity index,
+        // as the per-subset analysis always has.
+        while let Some(&(index, balance)) = fill_log.get(self.fill_cursor) {
+            if index <= i {
+                self.ebd_balance = balance;
+                self.fill_cursor += 1;
+            } else {
+                break;
+            }
+        }
+        self.ebds.add(self.ebd_balance, equity);
+    }
+
+    fn add_fill(&mut self, fill: &Fill, is_long: bool, fill_log: &[(usize, f64)]) {
+        if self.n_fills == 0 {
+            self.first_balance = fill.balance;
+            self.ebd_balance = fill.balance;
+            // the fill has already been appended to the log
+            self.fill_cursor = fill_log.len() - 1;
+            for (i, equity) in std::mem::take(&mut self.pending_equities)
+                .into_iter()
+                .enumerate()
+            {
+                self.add_equity_balance_diff(i, equity, fill_log);
+            }
+        }
+        self.n_fills += 1;
+        self.last_balance = fill.balance;
+        self.last_fill_index = fill.index;
+
+        if fill.pnl > 0.0 {
+            self.total_profit += fill.pnl;
+        } else {
+            self.total_loss += fill.pnl.abs();
+        }
+
+        let key = position_key(fill.coin, is_long);
+        if key >= self.positions_opened.len() {
+            self.positions_opened.resize(key + 1, None);
+        }
+        self.positions_opened[key].get_or_insert(fill.index);
+        if fill.position_size == 0.0 {
+            if let Some(start_idx) = self.positions_opened[key].take() {
+                self.durations.push(fill.index - start_idx);
+            }
+        }
+    }
+
+    fn finalize(&self) -> Analysis {
+        if self.n_fills <= 1 {
+            return Analysis::default();
+        }
+        let mut daily_eqs = self.daily_eqs.clone();
+        if self.n_equities > 0 && self.current_min != f64::INFINITY {
+            daily_eqs.push(self.current_min);
+        }
+        if daily_eqs.len() < 2 {
+            // no daily returns, e.g. if the backtest was aborted on its first day
+            return Analysis::default();
+        }
+        let mut durations = self.durations.clone();
+        for &start_idx in self.positions_opened.iter().flatten() {
+            durations.push(self.last_fill_index - start_idx);
+        }
+        analysis_from_components(
+            &daily_eqs,
+            &self.ebds,
+            self.last_balance / self.first_balance,
+            self.total_profit,
+            self.total_loss,
+            &durations,
+            self.n_equities,
+        )
+    }
+}
+
+/// Computes the same Analysis as analyze_backtest, but from equities and fills fed one at a
+/// time while the backtest runs, so neither needs to be kept in memory.
+/// Memory use is proportional to the number of days and fills, not the number of minutes.
+pub struct AnalysisAccumulator {
+    // index and balance after fill of every fill so far
+    fill_log: Vec<(usize, f64)>,
+    subsets: Vec<SubsetAccumulator>,
+}
+
+impl AnalysisAccumulator {
+    pub fn new(n_equities: usize) -> Self {
+        let subsets = (0..10)
+            .map(|i| subset_start_idx(n_equities, i))
+            .enumerate()
+            .filter(|&(i, start_idx)| i == 0 || start_idx < n_equities)
+            .map(|(_, start_idx)| SubsetAccumulator::new(start_idx))
+            .collect();
+        AnalysisAccumulator {
+            fill_log: Vec::new(),
+            subsets,
+        }
+    }
+
+    /// Adds the equity at index i. Must be called with i = 0, 1, 2, ...
+    pub fn add_equity(&mut self, i: usize, equity: f64) {
+        for subset in self.subsets.iter_mut() {
+            if i >= subset.start_idx {
+                subset.add_equity(equity, &self.fill_log);
+            }
+        }
+    }
+
+    /// Adds a fill. Fills at index i must be added before the equity at index i.
+    pub fn add_fill(&mut self, fill: &Fill) {
+        self.fill_log.push((fill.index, fill.balance));
+        let is_long = is_long_fill(fill);
+        for subset in self.subsets.iter_mut() {
+            if fill.index >= subset.start_idx {
+                subset.add_fill(fill, is_long, &self.fill_log);
+            }
+        }
+    }
+
+    pub fn finalize(&self) -> Analysis {
+        let mut analysis = self.subsets[0].finalize();
+
+        if self.subsets[0].n_fills <= 1 {
+            return analysis;
+        }
+
+        let mut subset_analyses = Vec::with_capacity(10);
+        subset_analyses.push(analysis.clone());
+        for subset in self.subsets[1..].iter() {
+            if subset.n_equities == 0 || subset.n_fills == 0 {
+                break;
+            }
+            subset_analyses.push(subset.finalize());
+        }
+
+        apply_weighted_metrics(&mut analysis, &subset_analyses);
+
+        analysis
+    }
 }
 
 fn calc_drawdowns(equity_series: &[f64]) -> Vec<f64> {
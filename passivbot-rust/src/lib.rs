@@ -43,6 +43,9 @@ fn passivbot_rust(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(calc_closes_long_py, m)?)?;
     m.add_function(wrap_pyfunction!(calc_closes_short_py, m)?)?;
     m.add_function(wrap_pyfunction!(run_backtest, m)?)?;
+    m.add_function(wrap_pyfunction!(run_backtest_analysis, m)?)?;
+    m.add_function(wrap_pyfunction!(run_backtests_batch, m)?)?;
+    m.add_function(wrap_pyfunction!(run_backtest_analyses_parallel, m)?)?;
     m.add_function(wrap_pyfunction!(calc_auto_unstuck_allowance, m)?)?;
     Ok(())
 }
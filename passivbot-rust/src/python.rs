@@ -1,4 +1,4 @@
-use crate::backtest::{analyze_backtest, Backtest};
+use crate::backtest::Backtest;
 use crate::closes::{
     calc_closes_long, calc_closes_short, calc_grid_close_long, calc_next_close_long,
     calc_next_close_short, calc_trailing_close_long,
@@ -8,11 +8,14 @@ use crate::entries::{
     calc_next_entry_short, calc_trailing_entry_long,
 };
 use crate::types::{
-    Analysis, BacktestParams, BotParams, BotParamsPair, EMABands, ExchangeParams, Order, OrderBook,
-    Position, StateParams, TrailingPriceBundle,
+    AbortThresholds, Analysis, BacktestParams, BotParams, BotParamsPair, EMABands, EquityCurve,
+    EquitySampling, ExchangeParams, Fill, HlcvsElement, Order, OrderBook, Position, StateParams,
+    TrailingPriceBundle, ORDER_TYPES,
+};
+use memmap::{Mmap, MmapOptions};
+use ndarray::{
+    Array1, Array2, Array3, Array4, ArrayBase, ArrayD, ArrayView, ArrayView3, ShapeBuilder,
 };
-use memmap::MmapOptions;
-use ndarray::{Array1, Array2, Array3, Array4, ArrayBase, ArrayD, ArrayView, ShapeBuilder};
 use numpy::{
     IntoPyArray, PyArray1, PyArray2, PyArray3, PyArray4, PyReadonlyArray2, PyReadonlyArray3,
     PyReadonlyArray4,
@@ -21,144 +24,493 @@ use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
 use pyo3::types::{PyDict, PyList};
 use pyo3::wrap_pyfunction;
+use rayon::prelude::*;
 use std::{fs::File, slice};
 
+/// Runs a backtest and returns its fills, equities and analysis.
+/// The GIL is released while the backtest runs and only reacquired to build the results, so
+/// several threads of one process can run backtests concurrently.
 #[pyfunction]
+#[pyo3(signature = (
+    shared_memory_file,
+    hlcvs_shape,
+    hlcvs_dtype,
+    bot_params_pair_dict,
+    exchange_params_list,
+    backtest_params_dict,
+    hlcvs_offset=0,
+))]
 pub fn run_backtest(
+    py: Python<'_>,
     shared_memory_file: &str,
     hlcvs_shape: (usize, usize, usize),
     hlcvs_dtype: &str,
     bot_params_pair_dict: &PyDict,
     exchange_params_list: &PyAny,
     backtest_params_dict: &PyDict,
-) -> PyResult<(Py<PyArray2<PyObject>>, Py<PyArray1<f64>>, Py<PyDict>)> {
-    // Open the memory-mapped file
-    let file = File::open(shared_memory_file)
-        .map_err(|e| PyValueError::new_err(format!("Unable to open shared memory file: {}", e)))?;
+    hlcvs_offset: usize,
+) -> PyResult<(Py<PyDict>, Py<PyDict>, Py<PyDict>)> {
+    let backtest_params = backtest_params_from_dict(backtest_params_dict)?;
+    let mmap = open_shared_memory_file(shared_memory_file)?;
+    let hlcvs_rust = hlcvs_view_from_mmap(&mmap, hlcvs_offset, hlcvs_shape, hlcvs_dtype)?;
 
-    let mmap = unsafe {
-        MmapOptions::new()
-            .map(&file)
-            .map_err(|e| PyValueError::new_err(format!("Unable to map file: {}", e)))?
-    };
+    let bot_params_pair = bot_params_pair_from_dict(bot_params_pair_dict)?;
+    let exchange_params = exchange_params_list_from_pyany(exchange_params_list)?;
 
-    let hlcvs_rust = unsafe {
-        match hlcvs_dtype {
-            "<f8" => ArrayView::from_shape_ptr(hlcvs_shape, mmap.as_ptr() as *const f64),
-            _ => return Err(PyValueError::new_err("Unsupported dtype for HLCV data")),
-        }
-    };
+    // Run the backtest and get fills, equities and analysis
+    let (fills, equity_curve, analysis) =
+        py.allow_threads(|| hlcvs_rust.run(bot_params_pair, exchange_params, &backtest_params));
+
+    let py_analysis = analysis_to_pydict(py, &analysis)?;
+    let py_fills = fills_to_pydict(py, &fills, &backtest_params.coins)?;
+    let py_equities = equity_curve_to_pydict(py, equity_curve)?;
+
+    Ok((py_fills.into(), py_equities.into(), py_analysis.into()))
+}
+
+/// Like run_backtest, but returns only the analysis. Fills and equities are reduced to the
+/// analysis while the backtest runs instead of being collected, keeping memory use independent
+/// of the backtest length. The GIL is released while the backtest runs.
+#[pyfunction]
+#[pyo3(signature = (
+    shared_memory_file,
+    hlcvs_shape,
+    hlcvs_dtype,
+    bot_params_pair_dict,
+    exchange_params_list,
+    backtest_params_dict,
+    hlcvs_offset=0,
+))]
+pub fn run_backtest_analysis(
+    py: Python<'_>,
+    shared_memory_file: &str,
+    hlcvs_shape: (usize, usize, usize),
+    hlcvs_dtype: &str,
+    bot_params_pair_dict: &PyDict,
+    exchange_params_list: &PyAny,
+    backtest_params_dict: &PyDict,
+    hlcvs_offset: usize,
+) -> PyResult<Py<PyDict>> {
+    let backtest_params = backtest_params_from_dict(backtest_params_dict)?;
+    let mmap = open_shared_memory_file(shared_memory_file)?;
+    let hlcvs_rust = hlcvs_view_from_mmap(&mmap, hlcvs_offset, hlcvs_shape, hlcvs_dtype)?;
 
     let bot_params_pair = bot_params_pair_from_dict(bot_params_pair_dict)?;
-    let exchange_params = {
-        let mut params_vec = Vec::new();
-        if let Ok(py_list) = exchange_params_list.downcast::<PyList>() {
-            for py_dict in py_list.iter() {
-                if let Ok(dict) = py_dict.downcast::<PyDict>() {
-                    let params = exchange_params_from_dict(dict)?;
-                    params_vec.push(params);
-                } else {
-                    return Err(PyValueError::new_err(
-                        "Unsupported data type in exchange_params_list",
-                    ));
-                }
-            }
+    let exchange_params = exchange_params_list_from_pyany(exchange_params_list)?;
+    let analysis = py.allow_threads(|| {
+        hlcvs_rust.run_analysis(bot_params_pair, exchange_params, &backtest_params)
+    });
+    Ok(analysis_to_pydict(py, &analysis)?.into())
+}
+
+/// Runs one backtest per bot params pair against the same HLCV data and returns only the
+/// analyses. The shared memory file is mapped once and exchange/backtest params are parsed once,
+/// so the per-config overhead is just the simulation itself.
+#[pyfunction]
+#[pyo3(signature = (
+    shared_memory_file,
+    hlcvs_shape,
+    hlcvs_dtype,
+    bot_params_pair_dicts,
+    exchange_params_list,
+    backtest_params_dict,
+    parallel=true,
+    hlcvs_offset=0,
+))]
+pub fn run_backtests_batch(
+    py: Python<'_>,
+    shared_memory_file: &str,
+    hlcvs_shape: (usize, usize, usize),
+    hlcvs_dtype: &str,
+    bot_params_pair_dicts: &PyList,
+    exchange_params_list: &PyAny,
+    backtest_params_dict: &PyDict,
+    parallel: bool,
+    hlcvs_offset: usize,
+) -> PyResult<Vec<Py<PyDict>>> {
+    let backtest_params = backtest_params_from_dict(backtest_params_dict)?;
+    let mmap = open_shared_memory_file(shared_memory_file)?;
+    let hlcvs_rust = hlcvs_view_from_mmap(&mmap, hlcvs_offset, hlcvs_shape, hlcvs_dtype)?;
+
+    let mut bot_params_pairs = Vec::with_capacity(bot_params_pair_dicts.len());
+    for item in bot_params_pair_dicts.iter() {
+        if let Ok(dict) = item.downcast::<PyDict>() {
+            bot_params_pairs.push(bot_params_pair_from_dict(dict)?);
         } else {
             return Err(PyValueError::new_err(
-                "Unsupported data type for exchange_params_list",
+                "Unsupported data type in bot_params_pair_dicts",
             ));
         }
-        params_vec
-    };
+    }
+    let exchange_params = exchange_params_list_from_pyany(exchange_params_list)?;
 
-    let backtest_params = backtest_params_from_dict(backtest_params_dict)?;
-    let mut backtest = Backtest::new(
-        &hlcvs_rust,
-        bot_params_pair,
-        exchange_params,
-        &backtest_params,
-    );
+    // The simulations don't touch Python objects, so let other threads run meanwhile
+    let analyses: Vec<Analysis> = py.allow_threads(|| {
+        let run_single = |bot_params_pair: &BotParamsPair| -> Analysis {
+            hlcvs_rust.run_analysis(
+                bot_params_pair.clone(),
+                exchange_params.clone(),
+                &backtest_params,
+            )
+        };
+        if parallel {
+            bot_params_pairs.par_iter().map(run_single).collect()
+        } else {
+            bot_params_pairs.iter().map(run_single).collect()
+        }
+    });
 
-    // Run the backtest and get fills and equities
-    Python::with_gil(|py| {
-        let (fills, equities) = backtest.run();
-        let analysis = analyze_backtest(&fills, &equities);
-        let py_analysis = PyDict::new(py);
-        py_analysis.set_item("adg", analysis.adg)?;
-        py_analysis.set_item("mdg", analysis.mdg)?;
-        py_analysis.set_item("gain", analysis.gain)?;
-        py_analysis.set_item("sharpe_ratio", analysis.sharpe_ratio)?;
-        py_analysis.set_item("sortino_ratio", analysis.sortino_ratio)?;
-        py_analysis.set_item("omega_ratio", analysis.omega_ratio)?;
-        py_analysis.set_item("expected_shortfall_1pct", analysis.expected_shortfall_1pct)?;
-        py_analysis.set_item("calmar_ratio", analysis.calmar_ratio)?;
-        py_analysis.set_item("sterling_ratio", analysis.sterling_ratio)?;
-        py_analysis.set_item("drawdown_worst", analysis.drawdown_worst)?;
-        py_analysis.set_item(
-            "drawdown_worst_mean_1pct",
-            analysis.drawdown_worst_mean_1pct,
-        )?;
-        py_analysis.set_item(
-            "equity_balance_diff_neg_max",
-            analysis.equity_balance_diff_neg_max,
-        )?;
-        py_analysis.set_item(
-            "equity_balance_diff_neg_mean",
-            analysis.equity_balance_diff_neg_mean,
-        )?;
-        py_analysis.set_item(
-            "equity_balance_diff_pos_max",
-            analysis.equity_balance_diff_pos_max,
-        )?;
-        py_analysis.set_item(
-            "equity_balance_diff_pos_mean",
-            analysis.equity_balance_diff_pos_mean,
-        )?;
-        py_analysis.set_item("loss_profit_ratio", analysis.loss_profit_ratio)?;
-        py_analysis.set_item("positions_held_per_day", analysis.positions_held_per_day)?;
-        py_analysis.set_item(
-            "position_held_hours_mean",
-            analysis.position_held_hours_mean,
-        )?;
-        py_analysis.set_item("position_held_hours_max", analysis.position_held_hours_max)?;
-        py_analysis.set_item(
-            "position_held_hours_median",
-            analysis.position_held_hours_median,
-        )?;
+    analyses
+        .iter()
+        .map(|analysis| Ok(analysis_to_pydict(py, analysis)?.into()))
+        .collect()
+}
 
-        py_analysis.set_item("adg_w", analysis.adg_w)?;
-        py_analysis.set_item("mdg_w", analysis.mdg_w)?;
-        py_analysis.set_item("sharpe_ratio_w", analysis.sharpe_ratio_w)?;
-        py_analysis.set_item("sortino_ratio_w", analysis.sortino_ratio_w)?;
-        py_analysis.set_item("omega_ratio_w", analysis.omega_ratio_w)?;
-        py_analysis.set_item("calmar_ratio_w", analysis.calmar_ratio_w)?;
-        py_analysis.set_item("sterling_ratio_w", analysis.sterling_ratio_w)?;
-        py_analysis.set_item("loss_profit_ratio_w", analysis.loss_profit_ratio_w)?;
+/// Runs one analysis-only backtest per dataset, e.g. one per exchange, concurrently on the
+/// rayon thread pool with the GIL released. Item i of each list belongs to backtest i.
+/// Returns the analyses in input order. hlcvs_offsets defaults to 0 for every file.
+#[pyfunction]
+#[pyo3(signature = (
+    shared_memory_files,
+    hlcvs_shapes,
+    hlcvs_dtypes,
+    bot_params_pair_dicts,
+    exchange_params_lists,
+    backtest_params_dicts,
+    hlcvs_offsets=None,
+))]
+pub fn run_backtest_analyses_parallel(
+    py: Python<'_>,
+    shared_memory_files: Vec<String>,
+    hlcvs_shapes: Vec<(usize, usize, usize)>,
+    hlcvs_dtypes: Vec<String>,
+    bot_params_pair_dicts: &PyList,
+    exchange_params_lists: &PyList,
+    backtest_params_dicts: &PyList,
+    hlcvs_offsets: Option<Vec<usize>>,
+) -> PyResult<Vec<Py<PyDict>>> {
+    let n_backtests = shared_memory_files.len();
+    let hlcvs_offsets = hlcvs_offsets.unwrap_or_else(|| vec![0; n_backtests]);
+    if hlcvs_offsets.len() != n_backtests
+        || hlcvs_shapes.len() != n_backtests
+        || hlcvs_dtypes.len() != n_backtests
+        || bot_params_pair_dicts.len() != n_backtests
+        || exchange_params_lists.len() != n_backtests
+        || backtest_params_dicts.len() != n_backtests
+    {
+        return Err(PyValueError::new_err(
+            "All arguments of run_backtest_analyses_parallel must have the same length",
+        ));
+    }
 
-        // Convert fills to a 2D array with mixed types
-        let mut py_fills = Array2::from_elem((fills.len(), 10), py.None());
-        for (i, fill) in fills.iter().enumerate() {
-            py_fills[(i, 0)] = fill.index.into_py(py);
-            py_fills[(i, 1)] = <String as Clone>::clone(&fill.coin).into_py(py);
-            py_fills[(i, 2)] = fill.pnl.into_py(py);
-            py_fills[(i, 3)] = fill.fee_paid.into_py(py);
-            py_fills[(i, 4)] = fill.balance.into_py(py);
-            py_fills[(i, 5)] = fill.fill_qty.into_py(py);
-            py_fills[(i, 6)] = fill.fill_price.into_py(py);
-            py_fills[(i, 7)] = fill.position_size.into_py(py);
-            py_fills[(i, 8)] = fill.position_price.into_py(py);
-            py_fills[(i, 9)] = fill.order_type.to_string().into_py(py);
+    let mut backtest_params_list = Vec::with_capacity(n_backtests);
+    let mut bot_params_pairs = Vec::with_capacity(n_backtests);
+    let mut exchange_params = Vec::with_capacity(n_backtests);
+    let mut mmaps = Vec::with_capacity(n_backtests);
+    for i in 0..n_backtests {
+        let backtest_params_dict = backtest_params_dicts.get_item(i)?;
+        let bot_params_pair_dict = bot_params_pair_dicts.get_item(i)?;
+        match (
+            backtest_params_dict.downcast::<PyDict>(),
+            bot_params_pair_dict.downcast::<PyDict>(),
+        ) {
+            (Ok(backtest_params_dict), Ok(bot_params_pair_dict)) => {
+                backtest_params_list.push(backtest_params_from_dict(backtest_params_dict)?);
+                bot_params_pairs.push(bot_params_pair_from_dict(bot_params_pair_dict)?);
+            }
+            _ => {
+                return Err(PyValueError::new_err(
+                    "Unsupported data type in bot_params_pair_dicts or backtest_params_dicts",
+                ))
+            }
         }
+        exchange_params.push(exchange_params_list_from_pyany(
+            exchange_params_lists.get_item(i)?,
+        )?);
+        mmaps.push(open_shared_memory_file(&shared_memory_files[i])?);
+    }
+    let mut hlcvs_views = Vec::with_capacity(n_backtests);
+    for i in 0..n_backtests {
+        hlcvs_views.push(hlcvs_view_from_mmap(
+            &mmaps[i],
+            hlcvs_offsets[i],
+            hlcvs_shapes[i],
+            &hlcvs_dtypes[i],
+        )?);
+    }
 
-        // Convert equities to a 1D array
-        let py_equities = Array1::from_vec(equities);
+    let analyses: Vec<Analysis> = py.allow_threads(|| {
+        (0..n_backtests)
+            .into_par_iter()
+            .map(|i| {
+                hlcvs_views[i].run_analysis(
+                    bot_params_pairs[i].clone(),
+                    exchange_params[i].clone(),
+                    &backtest_params_list[i],
+                )
+            })
+            .collect()
+    });
 
-        Ok((
-            py_fills.into_pyarray(py).to_owned(),
-            py_equities.into_pyarray(py).to_owned(),
-            py_analysis.into(),
-        ))
-    })
+    analyses
+        .iter()
+        .map(|analysis| Ok(analysis_to_pydict(py, analysis)?.into()))
+        .collect()
+}
+
+fn open_shared_memory_file(shared_memory_file: &str) -> PyResult<Mmap> {
+    let file = File::open(shared_memory_file)
+        .map_err(|e| PyValueError::new_err(format!("Unable to open shared memory file: {}", e)))?;
+    unsafe {
+        MmapOptions::new()
+            .map(&file)
+            .map_err(|e| PyValueError::new_err(format!("Unable to map file: {}", e)))
+    }
+}
+
+/// HLCV data mapped from a shared memory file, in the precision it was stored with.
+enum HlcvsView<'a> {
+    F64(ArrayView3<'a, f64>),
+    F32(ArrayView3<'a, f32>),
+}
+
+impl<'a> HlcvsView<'a> {
+    fn run(
+        &self,
+        bot_params_pair: BotParamsPair,
+        exchange_params: Vec<ExchangeParams>,
+        backtest_params: &BacktestParams,
+    ) -> (Vec<Fill>, EquityCurve, Analysis) {
+        match self {
+            HlcvsView::F64(hlcvs) => {
+                Backtest::new(hlcvs, bot_params_pair, exchange_params, backtest_params).run()
+            }
+            HlcvsView::F32(hlcvs) => {
+                Backtest::new(hlcvs, bot_params_pair, exchange_params, backtest_params).run()
+            }
+        }
+    }
+
+    fn run_analysis(
+        &self,
+        bot_params_pair: BotParamsPair,
+        exchange_params: Vec<ExchangeParams>,
+        backtest_params: &BacktestParams,
+    ) -> Analysis {
+        match self {
+            HlcvsView::F64(hlcvs) => {
+                Backtest::new(hlcvs, bot_params_pair, exchange_params, backtest_params)
+                    .run_analysis()
+            }
+            HlcvsView::F32(hlcvs) => {
+                Backtest::new(hlcvs, bot_params_pair, exchange_params, backtest_params)
+                    .run_analysis()
+            }
+        }
+    }
+}
+
+/// Returns a view of the HLCV data starting hlcvs_offset bytes into the mmap, with logical
+/// shape (timesteps, coins, 4). A nonzero offset allows mapping e.g. the data of a .npy file
+/// past its header. hlcvs_dtype is the numpy dtype string of the data, "<f8" or "<f4".
+fn hlcvs_view_from_mmap<'a>(
+    mmap: &'a Mmap,
+    hlcvs_offset: usize,
+    hlcvs_shape: (usize, usize, usize),
+    hlcvs_dtype: &str,
+) -> PyResult<HlcvsView<'a>> {
+    match hlcvs_dtype {
+        "<f8" => Ok(HlcvsView::F64(typed_hlcvs_view_from_mmap(
+            mmap,
+            hlcvs_offset,
+            hlcvs_shape,
+        )?)),
+        "<f4" => Ok(HlcvsView::F32(typed_hlcvs_view_from_mmap(
+            mmap,
+            hlcvs_offset,
+            hlcvs_shape,
+        )?)),
+        _ => Err(PyValueError::new_err("Unsupported dtype for HLCV data")),
+    }
+}
+
+fn typed_hlcvs_view_from_mmap<'a, T: HlcvsElement>(
+    mmap: &'a Mmap,
+    hlcvs_offset: usize,
+    hlcvs_shape: (usize, usize, usize),
+) -> PyResult<ArrayView3<'a, T>> {
+    let (n_timesteps, n_coins, n_fields) = hlcvs_shape;
+    let n_elements = n_timesteps * n_coins * n_fields;
+    if mmap.len() < hlcvs_offset + n_elements * std::mem::size_of::<T>() {
+        return Err(PyValueError::new_err(
+            "Shared memory file is smaller than HLCV shape",
+        ));
+    }
+    if hlcvs_offset % std::mem::align_of::<T>() != 0 {
+        return Err(PyValueError::new_err(
+            "HLCV offset is not aligned to the HLCV dtype",
+        ));
+    }
+    let ptr = mmap[hlcvs_offset..].as_ptr() as *const T;
+    Ok(unsafe { ArrayView::from_shape_ptr(hlcvs_shape, ptr) })
+}
+
+fn exchange_params_list_from_pyany(exchange_params_list: &PyAny) -> PyResult<Vec<ExchangeParams>> {
+    let mut params_vec = Vec::new();
+    if let Ok(py_list) = exchange_params_list.downcast::<PyList>() {
+        for py_dict in py_list.iter() {
+            if let Ok(dict) = py_dict.downcast::<PyDict>() {
+                let params = exchange_params_from_dict(dict)?;
+                params_vec.push(params);
+            } else {
+                return Err(PyValueError::new_err(
+                    "Unsupported data type in exchange_params_list",
+                ));
+            }
+        }
+    } else {
+        return Err(PyValueError::new_err(
+            "Unsupported data type for exchange_params_list",
+        ));
+    }
+    Ok(params_vec)
+}
+
+/// Converts fills to a dict of typed numpy columns.
+/// "coin" holds indices into "coins" and "type" holds indices into "order_types".
+fn fills_to_pydict<'py>(
+    py: Python<'py>,
+    fills: &[Fill],
+    coins: &[String],
+) -> PyResult<&'py PyDict> {
+    let f64_column = |value: fn(&Fill) -> f64| -> &'py PyArray1<f64> {
+        fills
+            .iter()
+            .map(value)
+            .collect::<Vec<f64>>()
+            .into_pyarray(py)
+    };
+    let py_fills = PyDict::new(py);
+    py_fills.set_item(
+        "minute",
+        fills
+            .iter()
+            .map(|fill| fill.index as i64)
+            .collect::<Vec<i64>>()
+            .into_pyarray(py),
+    )?;
+    py_fills.set_item(
+        "coin",
+        fills
+            .iter()
+            .map(|fill| fill.coin as u16)
+            .collect::<Vec<u16>>()
+            .into_pyarray(py),
+    )?;
+    py_fills.set_item("pnl", f64_column(|fill| fill.pnl))?;
+    py_fills.set_item("fee_paid", f64_column(|fill| fill.fee_paid))?;
+    py_fills.set_item("balance", f64_column(|fill| fill.balance))?;
+    py_fills.set_item("qty", f64_column(|fill| fill.fill_qty))?;
+    py_fills.set_item("price", f64_column(|fill| fill.fill_price))?;
+    py_fills.set_item("psize", f64_column(|fill| fill.position_size))?;
+    py_fills.set_item("pprice", f64_column(|fill| fill.position_price))?;
+    py_fills.set_item(
+        "type",
+        fills
+            .iter()
+            .map(|fill| fill.order_type as u8)
+            .collect::<Vec<u8>>()
+            .into_pyarray(py),
+    )?;
+    py_fills.set_item("coins", coins.to_vec())?;
+    py_fills.set_item(
+        "order_types",
+        ORDER_TYPES
+            .iter()
+            .map(|order_type| order_type.to_string())
+            .collect::<Vec<String>>(),
+    )?;
+    Ok(py_fills)
+}
+
+/// Converts the equity curve to a dict of numpy columns: "minute" and "equity", plus "min" and
+/// "max" unless sampled per minute.
+fn equity_curve_to_pydict<'py>(
+    py: Python<'py>,
+    equity_curve: EquityCurve,
+) -> PyResult<&'py PyDict> {
+    let py_equities = PyDict::new(py);
+    py_equities.set_item(
+        "minute",
+        equity_curve
+            .minutes
+            .iter()
+            .map(|&minute| minute as i64)
+            .collect::<Vec<i64>>()
+            .into_pyarray(py),
+    )?;
+    py_equities.set_item("equity", equity_curve.equity.into_pyarray(py))?;
+    if !equity_curve.min.is_empty() {
+        py_equities.set_item("min", equity_curve.min.into_pyarray(py))?;
+        py_equities.set_item("max", equity_curve.max.into_pyarray(py))?;
+    }
+    Ok(py_equities)
+}
+
+fn analysis_to_pydict<'py>(py: Python<'py>, analysis: &Analysis) -> PyResult<&'py PyDict> {
+    let py_analysis = PyDict::new(py);
+    py_analysis.set_item("adg", analysis.adg)?;
+    py_analysis.set_item("mdg", analysis.mdg)?;
+    py_analysis.set_item("gain", analysis.gain)?;
+    py_analysis.set_item("sharpe_ratio", analysis.sharpe_ratio)?;
+    py_analysis.set_item("sortino_ratio", analysis.sortino_ratio)?;
+    py_analysis.set_item("omega_ratio", analysis.omega_ratio)?;
+    py_analysis.set_item("expected_shortfall_1pct", analysis.expected_shortfall_1pct)?;
+    py_analysis.set_item("calmar_ratio", analysis.calmar_ratio)?;
+    py_analysis.set_item("sterling_ratio", analysis.sterling_ratio)?;
+    py_analysis.set_item("drawdown_worst", analysis.drawdown_worst)?;
+    py_analysis.set_item(
+        "drawdown_worst_mean_1pct",
+        analysis.drawdown_worst_mean_1pct,
+    )?;
+    py_analysis.set_item(
+        "equity_balance_diff_neg_max",
+        analysis.equity_balance_diff_neg_max,
+    )?;
+    py_analysis.set_item(
+        "equity_balance_diff_neg_mean",
+        analysis.equity_balance_diff_neg_mean,
+    )?;
+    py_analysis.set_item(
+        "equity_balance_diff_pos_max",
+        analysis.equity_balance_diff_pos_max,
+    )?;
+    py_analysis.set_item(
+        "equity_balance_diff_pos_mean",
+        analysis.equity_balance_diff_pos_mean,
+    )?;
+    py_analysis.set_item("loss_profit_ratio", analysis.loss_profit_ratio)?;
+    py_analysis.set_item("positions_held_per_day", analysis.positions_held_per_day)?;
+    py_analysis.set_item(
+        "position_held_hours_mean",
+        analysis.position_held_hours_mean,
+    )?;
+    py_analysis.set_item("position_held_hours_max", analysis.position_held_hours_max)?;
+    py_analysis.set_item(
+        "position_held_hours_median",
+        analysis.position_held_hours_median,
+    )?;
+
+    py_analysis.set_item("adg_w", analysis.adg_w)?;
+    py_analysis.set_item("mdg_w", analysis.mdg_w)?;
+    py_analysis.set_item("sharpe_ratio_w", analysis.sharpe_ratio_w)?;
+    py_analysis.set_item("sortino_ratio_w", analysis.sortino_ratio_w)?;
+    py_analysis.set_item("omega_ratio_w", analysis.omega_ratio_w)?;
+    py_analysis.set_item("calmar_ratio_w", analysis.calmar_ratio_w)?;
+    py_analysis.set_item("sterling_ratio_w", analysis.sterling_ratio_w)?;
+    py_analysis.set_item("loss_profit_ratio_w", analysis.loss_profit_ratio_w)?;
+    py_analysis.set_item("aborted", analysis.aborted)?;
+    Ok(py_analysis)
 }
 
 fn backtest_params_from_dict(dict: &PyDict) -> PyResult<BacktestParams> {
@@ -166,6 +518,26 @@ fn backtest_params_from_dict(dict: &PyDict) -> PyResult<BacktestParams> {
         starting_balance: extract_value(dict, "starting_balance").unwrap_or_default(),
         maker_fee: extract_value(dict, "maker_fee").unwrap_or_default(),
         coins: extract_value(dict, "coins").unwrap_or_default(),
+        equity_sampling: match extract_value::<String>(dict, "equity_sampling") {
+            Ok(sampling) => match sampling.as_str() {
+                "minute" => EquitySampling::Minute,
+                "hourly" => EquitySampling::Hourly,
+                "daily" => EquitySampling::Daily,
+                _ => {
+                    return Err(PyValueError::new_err(format!(
+                        "Unsupported equity_sampling: {}",
+                        sampling
+                    )))
+                }
+            },
+            Err(_) => EquitySampling::default(),
+        },
+        abort_thresholds: AbortThresholds {
+            drawdown_worst: extract_value(dict, "abort_drawdown_worst").unwrap_or_default(),
+            equity_balance_diff_neg_max: extract_value(dict, "abort_equity_balance_diff_neg_max")
+                .unwrap_or_default(),
+            equity_floor: extract_value(dict, "abort_equity_floor").unwrap_or_default(),
+        },
     })
 }
 
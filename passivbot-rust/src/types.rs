@@ -1,7 +1,7 @@
-use std::collections::HashMap;
+use ndarray::ArrayView3;
 use std::fmt;
 
-#[derive(Debug)]
+#[derive(Debug, Clone)]
 pub struct ExchangeParams {
     pub qty_step: f64,
     pub price_step: f64,
@@ -22,11 +22,80 @@ impl Default for ExchangeParams {
     }
 }
 
+/// Element type of the HLCV data: f64, or f32 to halve its memory footprint.
+/// Values are widened to f64 when read, so all simulation arithmetic is done in f64.
+pub trait HlcvsElement: Copy + Into<f64> + Send + Sync + 'static {}
+
+impl HlcvsElement for f64 {}
+impl HlcvsElement for f32 {}
+
+/// Reads hlcvs[[k, idx, field]] as f64.
+#[inline(always)]
+pub fn hlcv<T: HlcvsElement>(hlcvs: &ArrayView3<T>, k: usize, idx: usize, field: usize) -> f64 {
+    hlcvs[[k, idx, field]].into()
+}
+
+/// Resolution of the equity curve returned by a backtest.
+/// The analysis is always computed from the equity of every minute.
+#[derive(Clone, Copy, Debug, Default, PartialEq)]
+pub enum EquitySampling {
+    /// One equity per minute.
+    #[default]
+    Minute,
+    /// One sample per hour: equity at its first minute and min/max over the hour.
+    Hourly,
+    /// One sample per day: equity at its first minute and min/max over the day.
+    Daily,
+}
+
+impl EquitySampling {
+    /// Number of minutes per sample.
+    pub fn bucket_len(&self) -> usize {
+        match self {
+            EquitySampling::Minute => 1,
+            EquitySampling::Hourly => 60,
+            EquitySampling::Daily => 60 * 24,
+        }
+    }
+}
+
+/// Equity curve at EquitySampling resolution.
+/// Sample i covers the minutes from minutes[i] up to, not including, minutes[i + 1].
+/// min and max are left empty with EquitySampling::Minute.
+#[derive(Debug, Default, Clone)]
+pub struct EquityCurve {
+    pub minutes: Vec<usize>,
+    pub equity: Vec<f64>,
+    pub min: Vec<f64>,
+    pub max: Vec<f64>,
+}
+
 #[derive(Clone)]
 pub struct BacktestParams {
     pub starting_balance: f64,
     pub maker_fee: f64,
     pub coins: Vec<String>,
+    pub equity_sampling: EquitySampling,
+    pub abort_thresholds: AbortThresholds,
+}
+
+/// Thresholds at which a backtest is stopped early, each disabled if 0.0.
+/// drawdown_worst and equity_balance_diff_neg_max are checked on the same basis as the
+/// analysis metrics of the same names, so that an aborted backtest's full analysis would
+/// have exceeded the threshold too. equity_floor is a fraction of the starting balance.
+#[derive(Default, Debug, Clone, Copy)]
+pub struct AbortThresholds {
+    pub drawdown_worst: f64,
+    pub equity_balance_diff_neg_max: f64,
+    pub equity_floor: f64,
+}
+
+impl AbortThresholds {
+    pub fn is_enabled(&self) -> bool {
+        self.drawdown_worst != 0.0
+            || self.equity_balance_diff_neg_max != 0.0
+            || self.equity_floor != 0.0
+    }
 }
 
 #[derive(Default, Debug, Clone, Copy)]
@@ -35,10 +104,212 @@ pub struct Position {
     pub price: f64,
 }
 
+/// Set of coin indices in 0..n_coins, stored as a bitset.
+/// Iteration is in ascending index order.
+#[derive(Debug, Default, Clone)]
+pub struct CoinSet {
+    words: Vec<u64>,
+    len: usize,
+}
+
+impl CoinSet {
+    pub fn new(n_coins: usize) -> Self {
+        CoinSet {
+            words: vec![0; (n_coins + 63) / 64],
+            len: 0,
+        }
+    }
+
+    #[inline]
+    pub fn contains(&self, idx: usize) -> bool {
+        self.words[idx / 64] & (1 << (idx % 64)) != 0
+    }
+
+    /// Returns true if idx was not already in the set.
+    #[inline]
+    pub fn insert(&mut self, idx: usize) -> bool {
+        let word = &mut self.words[idx / 64];
+        let mask = 1 << (idx % 64);
+        if *word & mask != 0 {
+            return false;
+        }
+        *word |= mask;
+        self.len += 1;
+        true
+    }
+
+    /// Returns true if idx was in the set.
+    #[inline]
+    pub fn remove(&mut self, idx: usize) -> bool {
+        let word = &mut self.words[idx / 64];
+        let mask = 1 << (idx % 64);
+        if *word & mask == 0 {
+            return false;
+        }
+        *word &= !mask;
+        self.len -= 1;
+        true
+    }
+
+    pub fn clear(&mut self) {
+        if self.len > 0 {
+            self.words.iter_mut().for_each(|word| *word = 0);
+            self.len = 0;
+        }
+    }
+
+    /// Makes self equal to other without reallocating. Both must have the same capacity.
+    pub fn copy_from(&mut self, other: &CoinSet) {
+        self.words.copy_from_slice(&other.words);
+        self.len = other.len;
+    }
+
+    #[inline]
+    pub fn len(&self) -> usize {
+        self.len
+    }
+
+    #[inline]
+    pub fn is_empty(&self) -> bool {
+        self.len == 0
+    }
+
+    /// Smallest index in the set which is >= start.
+    /// Use with first() to iterate while mutating other state:
+    /// `let mut cursor = set.first(); while let Some(idx) = cursor { ...; cursor = set.next_from(idx + 1); }`
+    pub fn next_from(&self, start: usize) -> Option<usize> {
+        let mut word_idx = start / 64;
+        if word_idx >= self.words.len() {
+            return None;
+        }
+        let mut word = self.words[word_idx] & (u64::MAX << (start % 64));
+        loop {
+            if word != 0 {
+                return Some(word_idx * 64 + word.trailing_zeros() as usize);
+            }
+            word_idx += 1;
+            if word_idx >= self.words.len() {
+                return None;
+            }
+            word = self.words[word_idx];
+        }
+    }
+
+    #[inline]
+    pub fn first(&self) -> Option<usize> {
+        self.next_from(0)
+    }
+
+    pub fn iter(&self) -> impl Iterator<Item = usize> + '_ {
+        std::iter::successors(self.first(), move |&idx| self.next_from(idx + 1))
+    }
+}
+
+/// Map from coin index in 0..n_coins to T, stored densely with a CoinSet of present keys.
+/// Removing a key resets its slot to T::default().
+#[derive(Debug, Default, Clone)]
+pub struct CoinMap<T> {
+    values: Vec<T>,
+    keys: CoinSet,
+}
+
+impl<T: Default> CoinMap<T> {
+    pub fn new(n_coins: usize) -> Self {
+        CoinMap {
+            values: (0..n_coins).map(|_| T::default()).collect(),
+            keys: CoinSet::new(n_coins),
+        }
+    }
+
+    #[inline]
+    pub fn contains_key(&self, idx: usize) -> bool {
+        self.keys.contains(idx)
+    }
+
+    #[inline]
+    pub fn get(&self, idx: usize) -> Option<&T> {
+        if self.keys.contains(idx) {
+            Some(&self.values[idx])
+        } else {
+            None
+        }
+    }
+
+    #[inline]
+    pub fn get_mut(&mut self, idx: usize) -> Option<&mut T> {
+        if self.keys.contains(idx) {
+            Some(&mut self.values[idx])
+        } else {
+            None
+        }
+    }
+
+    /// Returns the value at idx, inserting T::default() if absent.
+    #[inline]
+    pub fn get_or_insert_default(&mut self, idx: usize) -> &mut T {
+        self.keys.insert(idx);
+        &mut self.values[idx]
+    }
+
+    #[inline]
+    pub fn remove(&mut self, idx: usize) -> Option<T> {
+        if self.keys.remove(idx) {
+            Some(std::mem::take(&mut self.values[idx]))
+        } else {
+            None
+        }
+    }
+
+    /// Removes all keys for which keep returns false.
+    pub fn retain(&mut self, mut keep: impl FnMut(usize) -> bool) {
+        let mut cursor = self.keys.first();
+        while let Some(idx) = cursor {
+            if !keep(idx) {
+                self.remove(idx);
+            }
+            cursor = self.keys.next_from(idx + 1);
+        }
+    }
+
+    #[inline]
+    pub fn keys(&self) -> &CoinSet {
+        &self.keys
+    }
+
+    #[inline]
+    pub fn len(&self) -> usize {
+        self.keys.len()
+    }
+
+    #[inline]
+    pub fn is_empty(&self) -> bool {
+        self.keys.is_empty()
+    }
+}
+
+impl<T> std::ops::Index<usize> for CoinMap<T> {
+    type Output = T;
+
+    #[inline]
+    fn index(&self, idx: usize) -> &T {
+        debug_assert!(self.keys.contains(idx), "coin {} not in map", idx);
+        &self.values[idx]
+    }
+}
+
 #[derive(Debug, Default)]
 pub struct Positions {
-    pub long: HashMap<usize, Position>,
-    pub short: HashMap<usize, Position>,
+    pub long: CoinMap<Position>,
+    pub short: CoinMap<Position>,
+}
+
+impl Positions {
+    pub fn new(n_coins: usize) -> Self {
+        Positions {
+            long: CoinMap::new(n_coins),
+            short: CoinMap::new(n_coins),
+        }
+    }
 }
 
 #[derive(Debug, Default, Clone)]
@@ -124,7 +395,7 @@ pub struct BotParams {
     pub unstuck_threshold: f64,
 }
 
-#[derive(Debug)]
+#[derive(Debug, Clone)]
 pub struct TrailingPriceBundle {
     pub min_since_open: f64,
     pub max_since_min: f64,
@@ -203,10 +474,39 @@ impl fmt::Display for OrderType {
     }
 }
 
+/// All order types, in declaration order, so that ORDER_TYPES[order_type as usize] == order_type.
+/// Used as lookup table for the order type codes of backtest fills.
+pub const ORDER_TYPES: [OrderType; 23] = [
+    OrderType::EntryInitialNormalLong,
+    OrderType::EntryInitialPartialLong,
+    OrderType::EntryTrailingNormalLong,
+    OrderType::EntryTrailingCroppedLong,
+    OrderType::EntryGridNormalLong,
+    OrderType::EntryGridCroppedLong,
+    OrderType::EntryGridInflatedLong,
+    OrderType::CloseGridLong,
+    OrderType::CloseTrailingLong,
+    OrderType::CloseUnstuckLong,
+    OrderType::CloseAutoReduceLong,
+    OrderType::EntryInitialNormalShort,
+    OrderType::EntryInitialPartialShort,
+    OrderType::EntryTrailingNormalShort,
+    OrderType::EntryTrailingCroppedShort,
+    OrderType::EntryGridNormalShort,
+    OrderType::EntryGridCroppedShort,
+    OrderType::EntryGridInflatedShort,
+    OrderType::CloseGridShort,
+    OrderType::CloseTrailingShort,
+    OrderType::CloseUnstuckShort,
+    OrderType::CloseAutoReduceShort,
+    OrderType::Empty,
+];
+
 #[derive(Debug, Clone)]
 pub struct Fill {
     pub index: usize,
-    pub coin: String,
+    pub coin: usize, // index into BacktestParams.coins
+
     pub pnl: f64,
     pub fee_paid: f64,
     pub balance: f64,
@@ -249,6 +549,9 @@ pub struct Analysis {
     pub calmar_ratio_w: f64,
     pub sterling_ratio_w: f64,
     pub loss_profit_ratio_w: f64,
+
+    // true if the backtest was stopped early at one of its AbortThresholds
+    pub aborted: bool,
 }
 
 impl Default for Analysis {
@@ -283,6 +586,8 @@ impl Default for Analysis {
             calmar_ratio_w: 0.0,
             sterling_ratio_w: 0.0,
             loss_profit_ratio_w: 1.0,
+
+            aborted: false,
         }
     }
 }
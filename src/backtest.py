@@ -22,19 +22,39 @@ from pure_funcs import (
     ts_to_date,
     sort_dict_keys,
     calc_hash,
+    date_to_ts,
+    symbol_to_coin,
 )
 import pprint
 from copy import deepcopy
-from downloader import prepare_hlcvs, prepare_hlcvs_combined, add_all_eligible_coins_to_config
+from downloader import (
+    prepare_hlcvs,
+    prepare_hlcvs_combined,
+    prepare_hlcvs_appended,
+    add_all_eligible_coins_to_config,
+)
 from pathlib import Path
 from plotting import plot_fills_forager
 from collections import defaultdict
 import matplotlib.pyplot as plt
 import logging
 from main import manage_rust_compilation
+from hlcvs_cache import (
+    BLOCKS_FNAME,
+    hlcvs_blocks_exist,
+    load_hlcvs_blocks,
+    save_hlcvs_blocks,
+    save_cache_meta,
+    find_covering_cache,
+    find_appendable_cache,
+    remove_superseded_caches,
+    slice_coin_ranges,
+    refill_hlcvs,
+)
 import gzip
 import traceback
 
+import shutil
 import tempfile
 from contextlib import contextmanager
 
@@ -45,18 +65,77 @@ logging.basicConfig(
 )
 
 
+def get_shared_memory_dir(required_space=0):
+    """
+    Returns the directory for shared memory files: /dev/shm if it is available and has room,
+    so the data lives in RAM and is never written to disk, otherwise the temp directory.
+    """
+    shm_dir = "/dev/shm"
+    if os.path.isdir(shm_dir) and os.access(shm_dir, os.W_OK):
+        if shutil.disk_usage(shm_dir).free >= required_space:
+            return shm_dir
+    return tempfile.gettempdir()
+
+
+def write_shared_memory_file(hlcvs, shared_memory_file, n_rows_per_chunk=2**16):
+    """
+    Writes hlcvs to shared_memory_file. The data is copied straight into a memory map of the
+    file, chunk by chunk, instead of through an in-memory bytes copy.
+    """
+    mmap = np.memmap(shared_memory_file, dtype=hlcvs.dtype, mode="w+", shape=hlcvs.shape)
+    try:
+        for i in range(0, len(hlcvs), n_rows_per_chunk):
+            mmap[i : i + n_rows_per_chunk] = hlcvs[i : i + n_rows_per_chunk]
+        mmap.flush()
+    finally:
+        del mmap
+
+
+def get_mapped_hlcvs_file(hlcvs):
+    """
+    If hlcvs is a memory map of all the data of a .npy file, as loaded from the cache with
+    backtest.mmap_cache, returns the file path and the byte offset of the data past the .npy
+    header. The Rust backtester can then map the file directly. Otherwise returns None.
+    """
+    if (
+        isinstance(hlcvs, np.memmap)
+        and hlcvs.filename is not None
+        and hlcvs.flags.c_contiguous
+        # slices of a memmap keep the offset of the whole map
+        and hlcvs.offset + hlcvs.nbytes == os.path.getsize(hlcvs.filename)
+    ):
+        return hlcvs.filename, hlcvs.offset
+    return None
+
+
 @contextmanager
 def create_shared_memory_file(hlcvs):
-    temp_file = tempfile.NamedTemporaryFile(delete=False)
+    temp_file = tempfile.NamedTemporaryFile(
+        delete=False, dir=get_shared_memory_dir(hlcvs.nbytes), prefix="hlcvs_"
+    )
     shared_memory_file = temp_file.name
+    temp_file.close()
     try:
-        with open(shared_memory_file, "wb") as f:
-            f.write(hlcvs.tobytes())
+        write_shared_memory_file(hlcvs, shared_memory_file)
         yield shared_memory_file
     finally:
         os.unlink(shared_memory_file)
 
 
+@contextmanager
+def hlcvs_file(hlcvs):
+    """
+    Yields the path and byte offset of hlcvs for the Rust backtester: the mapped cache file
+    itself if there is one (see get_mapped_hlcvs_file), else a temporary shared memory file.
+    """
+    mapped = get_mapped_hlcvs_file(hlcvs)
+    if mapped is not None:
+        yield mapped
+    else:
+        with create_shared_memory_file(hlcvs) as shared_memory_file:
+            yield shared_memory_file, 0
+
+
 plt.rcParams["figure.figsize"] = [29, 18]
 
 
@@ -65,24 +144,35 @@ def oj(*x):
 
 
 def process_forager_fills(fills):
+    """
+    Builds the fills dataframe from the typed columns returned by pbr.run_backtest.
+    Coin and order type columns arrive as integer codes and are kept as categoricals.
+    """
     fdf = pd.DataFrame(
-        fills,
-        columns=[
-            "minute",
-            "coin",
-            "pnl",
-            "fee_paid",
-            "balance",
-            "qty",
-            "price",
-            "psize",
-            "pprice",
-            "type",
-        ],
+        {
+            "minute": fills["minute"],
+            "coin": pd.Categorical.from_codes(fills["coin"], categories=fills["coins"]),
+            "pnl": fills["pnl"],
+            "fee_paid": fills["fee_paid"],
+            "balance": fills["balance"],
+            "qty": fills["qty"],
+            "price": fills["price"],
+            "psize": fills["psize"],
+            "pprice": fills["pprice"],
+            "type": pd.Categorical.from_codes(fills["type"], categories=fills["order_types"]),
+        }
     )
     return fdf
 
 
+def process_equities(equities):
+    """
+    Builds the equity series from the columns returned by pbr.run_backtest.
+    The series is indexed by minute, at the resolution of backtest.equity_sampling.
+    """
+    return pd.Series(equities["equity"], index=equities["minute"])
+
+
 def analyze_fills_forager(coins, hlcvs, fdf, equities):
     analysis = {}
     pnls = {}
@@ -100,7 +190,7 @@ def analyze_fills_forager(coins, hlcvs, fdf, equities):
     div_by = 60  # save some disk space. Set to 1 to dump uncropped
     analysis["pnl_ratio_long_short"] = pnls["long"] / (pnls["long"] + pnls["short"])
     bdf = fdf.groupby((fdf.minute // div_by) * div_by).balance.last()
-    edf = equities.iloc[::div_by]
+    edf = equities.groupby((equities.index // div_by) * div_by).first()
     nidx = np.arange(min(bdf.index[0], edf.index[0]), max(bdf.index[-1], edf.index[-1]), div_by)
     bal_eq = pd.DataFrame({"balance": bdf, "equity": edf}, index=nidx).astype(float).ffill().bfill()
     return sort_dict_keys(analysis), bal_eq
@@ -153,9 +243,100 @@ def get_cache_hash(config, exchange):
         "minimum_coin_age_days": config["live"]["minimum_coin_age_days"],
         "gap_tolerance_ohlcvs_minutes": config["backtest"]["gap_tolerance_ohlcvs_minutes"],
     }
+    if config["backtest"]["hlcvs_dtype"] != "float64":
+        # float64 caches keep their original hash
+        to_hash["hlcvs_dtype"] = config["backtest"]["hlcvs_dtype"]
     return calc_hash(to_hash)
 
 
+def get_cache_meta_request(config, exchange):
+    """
+    The inputs of the hlcvs cache for config, in the form stored in cache meta files.
+    """
+    approved_coins = config["live"]["approved_coins"]
+    return {
+        "exchange": config["backtest"]["exchanges"] if exchange == "combined" else exchange,
+        "start_ts": date_to_ts(config["backtest"]["start_date"]),
+        "end_ts": date_to_ts(format_end_date(config["backtest"]["end_date"])),
+        "approved_coins": sorted(
+            set([symbol_to_coin(c) for pside in approved_coins for c in approved_coins[pside]])
+        ),
+        "minimum_coin_age_days": config["live"]["minimum_coin_age_days"],
+        "gap_tolerance_ohlcvs_minutes": config["backtest"]["gap_tolerance_ohlcvs_minutes"],
+        "hlcvs_dtype": config["backtest"]["hlcvs_dtype"],
+    }
+
+
+def load_coins_hlcvs_from_covering_cache(config, exchange):
+    """
+    Serves config from a cache built for a superset of its coins and date range, sliced to its
+    coins and dates, with front and back fills recomputed for the slice.
+    """
+    if exchange == "combined":
+        # combined data picks each coin's exchange and volume ratio over the whole date range,
+        # so a slice may differ from data prepared for the sliced range
+        return None
+    request = get_cache_meta_request(config, exchange)
+    found = find_covering_cache(Path("caches") / "hlcvs_data", request)
+    if found is None:
+        return None
+    cache_dir, meta = found
+    cached_coins = json.load(open(cache_dir / "coins.json"))
+    mss = json.load(open(cache_dir / "market_specific_settings.json"))
+    approved_coins = set(request["approved_coins"])
+    coin_ranges = slice_coin_ranges(
+        meta["coin_ranges"],
+        [coin for coin in cached_coins if coin in approved_coins],
+        request["start_ts"],
+        request["end_ts"],
+        strict=request["minimum_coin_age_days"] > 0.0,
+    )
+    if not coin_ranges:
+        return None
+    coins = sorted(coin_ranges)
+    start_ts = min(first_ts for first_ts, _ in coin_ranges.values())
+    end_ts = max(last_ts for _, last_ts in coin_ranges.values())
+    logging.info(f"{exchange} Slicing {len(coins)} coins from hlcvs cache {cache_dir}...")
+    if hlcvs_blocks_exist(cache_dir):
+        _, timestamps, hlcvs = load_hlcvs_blocks(cache_dir, coins, start_ts, end_ts)
+    elif os.path.exists(cache_dir / "hlcvs.npy"):
+        start_idx = (start_ts - meta["first_timestamp"]) // 60000
+        end_idx = (end_ts - meta["first_timestamp"]) // 60000 + 1
+        coin_idxs = {coin: i for i, coin in enumerate(cached_coins)}
+        hlcvs = np.load(cache_dir / "hlcvs.npy", mmap_mode="r")[start_idx:end_idx]
+        hlcvs = hlcvs[:, [coin_idxs[coin] for coin in coins]]
+        timestamps = meta["first_timestamp"] + np.arange(start_idx, end_idx) * 60000
+    else:
+        return None
+    refill_hlcvs(hlcvs, timestamps, coins, coin_ranges)
+    return cache_dir, coins, hlcvs, {coin: mss[coin] for coin in coins}
+
+
+def load_appendable_cache(config, exchange):
+    """
+    Loads the most recent cache for config's coins and start date with an earlier end date.
+    Returns (cache_dir, coins, timestamps, hlcvs, coin_ranges) or None.
+    """
+    if exchange == "combined":
+        return None
+    found = find_appendable_cache(
+        Path("caches") / "hlcvs_data", get_cache_meta_request(config, exchange)
+    )
+    if found is None:
+        return None
+    cache_dir, meta = found
+    coins = json.load(open(cache_dir / "coins.json"))
+    logging.info(f"{exchange} Attempting to load hlcvs data to append to from {cache_dir}...")
+    if hlcvs_blocks_exist(cache_dir):
+        coins, timestamps, hlcvs = load_hlcvs_blocks(cache_dir, coins)
+    elif os.path.exists(cache_dir / "hlcvs.npy"):
+        hlcvs = np.load(cache_dir / "hlcvs.npy")
+        timestamps = meta["first_timestamp"] + np.arange(len(hlcvs)) * 60000
+    else:
+        return None
+    return cache_dir, coins, timestamps, hlcvs, meta["coin_ranges"]
+
+
 def load_coins_hlcvs_from_cache(config, exchange):
     cache_hash = get_cache_hash(config, exchange)
     cache_dir = Path("caches") / "hlcvs_data" / cache_hash[:16]
@@ -163,22 +344,32 @@ def load_coins_hlcvs_from_cache(config, exchange):
         coins = json.load(open(cache_dir / "coins.json"))
         mss = json.load(open(cache_dir / "market_specific_settings.json"))
         if config["backtest"]["compress_cache"]:
-            fname = cache_dir / "hlcvs.npy.gz"
-            logging.info(f"{exchange} Attempting to load hlcvs data from cache {fname}...")
-            with gzip.open(fname, "rb") as f:
-                hlcvs = np.load(f)
+            if hlcvs_blocks_exist(cache_dir):
+                logging.info(f"{exchange} Attempting to load hlcvs data from cache {cache_dir}...")
+                coins, _, hlcvs = load_hlcvs_blocks(cache_dir, coins)
+            else:
+                # caches written before the block format
+                fname = cache_dir / "hlcvs.npy.gz"
+                logging.info(f"{exchange} Attempting to load hlcvs data from cache {fname}...")
+                with gzip.open(fname, "rb") as f:
+                    hlcvs = np.load(f)
         else:
             fname = cache_dir / "hlcvs.npy"
             logging.info(f"{exchange} Attempting to load hlcvs data from cache {fname}...")
-            hlcvs = np.load(fname)
+            # with mmap_cache, pages are only read from disk when accessed
+            hlcvs = np.load(fname, mmap_mode="r" if config["backtest"]["mmap_cache"] else None)
         return cache_dir, coins, hlcvs, mss
 
 
-def save_coins_hlcvs_to_cache(config, coins, hlcvs, exchange, mss):
+def save_coins_hlcvs_to_cache(config, coins, hlcvs, exchange, mss, timestamps, coin_ranges):
     cache_hash = get_cache_hash(config, exchange)
     cache_dir = Path("caches") / "hlcvs_data" / cache_hash[:16]
     cache_dir.mkdir(parents=True, exist_ok=True)
-    if all([os.path.exists(cache_dir / x) for x in ["coins.json", "hlcvs.npy"]]):
+    if os.path.exists(cache_dir / "coins.json") and (
+        hlcvs_blocks_exist(cache_dir)
+        if config["backtest"]["compress_cache"]
+        else os.path.exists(cache_dir / "hlcvs.npy")
+    ):
         return
     logging.info(f"Dumping cache...")
     json.dump(coins, open(cache_dir / "coins.json", "w"))
@@ -186,11 +377,9 @@ def save_coins_hlcvs_to_cache(config, coins, hlcvs, exchange, mss):
     uncompressed_size = hlcvs.nbytes
     sts = utc_ms()
     if config["backtest"]["compress_cache"]:
-        fpath = cache_dir / "hlcvs.npy.gz"
+        fpath = cache_dir / BLOCKS_FNAME
         logging.info(f"Attempting to save hlcvs data to cache {fpath}...")
-        with gzip.open(fpath, "wb", compresslevel=1) as f:
-            np.save(f, hlcvs)
-        compressed_size = (cache_dir / "hlcvs.npy.gz").stat().st_size
+        compressed_size = save_hlcvs_blocks(cache_dir, hlcvs, coins, int(timestamps[0]))
         line = (
             f"{compressed_size/(1024**3):.2f} GB compressed "
             f"({compressed_size/uncompressed_size*100:.1f}%)"
@@ -200,6 +389,17 @@ def save_coins_hlcvs_to_cache(config, coins, hlcvs, exchange, mss):
         logging.info(f"Attempting to save hlcvs data to cache {fpath}...")
         np.save(fpath, hlcvs)
         line = ""
+    # written last, so only complete caches are found to serve other requests
+    meta = {
+        **get_cache_meta_request(config, exchange),
+        "first_timestamp": int(timestamps[0]),
+        "n_timesteps": len(timestamps),
+        "coin_ranges": {coin: [int(x) for x in coin_ranges[coin]] for coin in coins},
+    }
+    save_cache_meta(cache_dir, meta)
+    if exchange != "combined":
+        for removed_dir in remove_superseded_caches(Path("caches") / "hlcvs_data", cache_dir, meta):
+            logging.info(f"Removed hlcvs cache {removed_dir}, superseded by {cache_dir}")
     logging.info(
         f"Successfully dumped hlcvs cache {fpath}: "
         f"{uncompressed_size/(1024**3):.2f} GB uncompressed, "
@@ -226,14 +426,36 @@ async def prepare_hlcvs_mss(config, exchange):
             return coins, hlcvs, mss, results_path, cache_dir
     except:
         logging.info(f"Unable to load hlcvs data from cache. Fetching...")
-    if exchange == "combined":
-        mss, timestamps, hlcvs = await prepare_hlcvs_combined(config)
+    try:
+        sts = utc_ms()
+        result = load_coins_hlcvs_from_covering_cache(config, exchange)
+        if result:
+            logging.info(f"Seconds to slice cache: {(utc_ms() - sts) / 1000:.4f}")
+            cache_dir, coins, hlcvs, mss = result
+            logging.info(f"Successfully sliced hlcvs data from cache. Shape: {hlcvs.shape}")
+            return coins, hlcvs, mss, results_path, cache_dir
+    except Exception as e:
+        logging.info(f"Unable to slice hlcvs data from a covering cache: {e}")
+    appended = None
+    try:
+        appendable = load_appendable_cache(config, exchange)
+        if appendable:
+            _, *cached = appendable
+            appended = await prepare_hlcvs_appended(config, exchange, *cached)
+    except Exception as e:
+        logging.info(f"Unable to append to hlcvs cache: {e}")
+    if appended:
+        mss, timestamps, hlcvs, coin_ranges = appended
+    elif exchange == "combined":
+        mss, timestamps, hlcvs, coin_ranges = await prepare_hlcvs_combined(config)
     else:
-        mss, timestamps, hlcvs = await prepare_hlcvs(config, exchange)
+        mss, timestamps, hlcvs, coin_ranges = await prepare_hlcvs(config, exchange)
     coins = sorted(mss)
     logging.info(f"Finished preparing hlcvs data for {exchange}. Shape: {hlcvs.shape}")
     try:
-        cache_dir = save_coins_hlcvs_to_cache(config, coins, hlcvs, exchange, mss)
+        cache_dir = save_coins_hlcvs_to_cache(
+            config, coins, hlcvs, exchange, mss, timestamps, coin_ranges
+        )
     except Exception as e:
         logging.error(f"failed to save hlcvs to cache {e}")
         traceback.print_exc()
@@ -260,6 +482,7 @@ def prep_backtest_args(config, mss, exchange, exchange_params=None, backtest_par
             "starting_balance": config["backtest"]["starting_balance"],
             "maker_fee": mss[coins[0]]["maker"],
             "coins": coins,
+            "equity_sampling": config["backtest"]["equity_sampling"],
         }
     return bot_params, exchange_params, backtest_params
 
@@ -273,14 +496,15 @@ def run_backtest(hlcvs, mss, config: dict, exchange: str):
     logging.info(f"Backtesting {exchange}...")
     sts = utc_ms()
 
-    with create_shared_memory_file(hlcvs) as shared_memory_file:
+    with hlcvs_file(hlcvs) as (filename, offset):
         fills, equities, analysis = pbr.run_backtest(
-            shared_memory_file,
+            filename,
             hlcvs.shape,
             hlcvs.dtype.str,
             bot_params,
             exchange_params,
             backtest_params,
+            hlcvs_offset=offset,
         )
 
     logging.info(f"seconds elapsed for backtest: {(utc_ms() - sts) / 1000:.4f}")
@@ -290,7 +514,7 @@ def run_backtest(hlcvs, mss, config: dict, exchange: str):
 def post_process(config, hlcvs, fills, equities, analysis, results_path, exchange):
     sts = utc_ms()
     fdf = process_forager_fills(fills)
-    equities = pd.Series(equities)
+    equities = process_equities(equities)
     analysis_py, bal_eq = analyze_fills_forager(
         config["backtest"]["coins"][exchange], hlcvs, fdf, equities
     )
@@ -1,5 +1,6 @@
 import argparse
 import asyncio
+import copy
 import datetime
 import gzip
 import json
@@ -16,7 +17,6 @@ from io import BytesIO
 from pathlib import Path
 from time import time
 from typing import List, Dict, Any, Tuple
-from uuid import uuid4
 from urllib.request import urlopen
 from collections import defaultdict
 
@@ -44,6 +44,8 @@ from procedures import (
     add_arguments_recursively,
     load_config,
 )
+from hlcvs_cache import refill_hlcvs
+from ohlcv_utils import ensure_millis, ensure_millis_array, deduplicate_rows, merge_ohlcv_arrays
 
 # ========================= CONFIGURABLES & GLOBALS =========================
 
@@ -54,6 +56,7 @@ logging.basicConfig(
 )
 
 MAX_REQUESTS_PER_MINUTE = 120
+MAX_CONCURRENT_COIN_LOADS = 8  # coins whose data is being downloaded or loaded at once
 REQUEST_TIMESTAMPS = deque(maxlen=1000)  # for rate-limiting checks
 
 # ========================= HELPER FUNCTIONS =========================
@@ -82,41 +85,25 @@ def dump_ohlcv_data(data, filepath):
     np.save(filepath, deduplicate_rows(data))
 
 
-def deduplicate_rows(arr):
+def load_ohlcv_array(filepath: str) -> np.ndarray:
     """
-    Remove duplicate rows from a 2D NumPy array while preserving order.
-
-    Parameters:
-    arr (numpy.ndarray): Input 2D array of shape (x, y)
-
-    Returns:
-    numpy.ndarray: Array with duplicate rows removed, maintaining original order
+    Loads an ohlcv .npy file with columns timestamp, open, high, low, close, volume as a
+    float array with millisecond timestamps. Files with duplicate rows are overwritten with
+    the deduplicated version.
     """
-    # Convert rows to tuples for hashing
-    rows_as_tuples = map(tuple, arr)
-
-    # Keep track of seen rows while preserving order
-    seen = set()
-    unique_indices = [
-        i
-        for i, row_tuple in enumerate(rows_as_tuples)
-        if not (row_tuple in seen or seen.add(row_tuple))
-    ]
-
-    # Return array with only unique rows
-    return arr[unique_indices]
-
-
-def load_ohlcv_data(filepath: str) -> pd.DataFrame:
     arr = np.load(filepath, allow_pickle=True)
-    columns = ["timestamp", "open", "high", "low", "close", "volume"]
     arr_deduplicated = deduplicate_rows(arr)
     if len(arr) != len(arr_deduplicated):
         dump_ohlcv_data(arr_deduplicated, filepath)
         print(
             f"Caught .npy file with duplicate rows: {filepath} Overwrote with deduplicated version."
         )
-    return ensure_millis(pd.DataFrame(arr_deduplicated, columns=columns))
+    return ensure_millis_array(arr_deduplicated.astype(float))
+
+
+def load_ohlcv_data(filepath: str) -> pd.DataFrame:
+    columns = ["timestamp", "open", "high", "low", "close", "volume"]
+    return ensure_millis(pd.DataFrame(load_ohlcv_array(filepath), columns=columns))
 
 
 def get_days_in_between(start_day, end_day):
@@ -211,18 +198,6 @@ async def get_zip_bitget(url):
     return dfc[dfc.timestamp != "open_time"]
 
 
-def ensure_millis(df):
-    if "timestamp" not in df.columns:
-        return df
-    if df.timestamp.iloc[0] > 1e14:  # is microseconds
-        df.timestamp /= 1000
-    elif df.timestamp.iloc[0] > 1e11:  # is milliseconds
-        pass
-    else:  # is seconds
-        df.timestamp *= 1000
-    return df
-
-
 class OHLCVManager:
     """
     Manages OHLCVs for multiple exchanges.
@@ -326,15 +301,19 @@ class OHLCVManager:
         return True
 
     async def check_rate_limit(self):
-        current_time = time()
-        while self.request_timestamps and current_time - self.request_timestamps[0] > 60:
-            self.request_timestamps.popleft()
         mrpm = (
             self.max_requests_per_minute[self.exchange]
             if self.exchange in self.max_requests_per_minute
             else self.max_requests_per_minute[""]
         )
-        if len(self.request_timestamps) >= mrpm:
+        # loop, as concurrent downloads sharing request_timestamps may have used the budget
+        # while sleeping
+        while True:
+            current_time = time()
+            while self.request_timestamps and current_time - self.request_timestamps[0] > 60:
+                self.request_timestamps.popleft()
+            if len(self.request_timestamps) < mrpm:
+                break
             sleep_time = 60 - (current_time - self.request_timestamps[0])
             if sleep_time > 0:
                 if self.verbose:
@@ -480,7 +459,12 @@ class OHLCVManager:
         """
         Loads any cached ohlcv data for exchange, coin and date range from cache
         and *strictly* enforces no gaps. If any gap is found, return empty.
+        Files are read in a thread, so other coins can load or download meanwhile.
         """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.load_ohlcvs_from_cache_sync, coin)
+
+    def load_ohlcvs_from_cache_sync(self, coin):
         dirpath = os.path.join(self.cache_filepaths["ohlcvs"], coin, "")
         if not os.path.exists(dirpath):
             return pd.DataFrame()
@@ -496,25 +480,20 @@ class OHLCVManager:
             x for x in all_files if x.replace(".npy", "") in all_days and x not in files_to_load
         ]
 
-        dfs = []
+        arrs = []
         for f in files_to_load:
             try:
                 filepath = os.path.join(dirpath, f)
-                df_part = load_ohlcv_data(filepath)
-                dfs.append(df_part)
+                arrs.append(load_ohlcv_array(filepath))
             except Exception as e:
                 logging.error(f"Error loading file {f}: {e}")
 
-        if not dfs:
+        if not arrs:
             return pd.DataFrame()
 
         # Concatenate, drop duplicates, sort by timestamp
-        df = (
-            pd.concat(dfs)
-            .drop_duplicates("timestamp")
-            .sort_values("timestamp")
-            .reset_index(drop=True)
-        )
+        columns = ["timestamp", "open", "high", "low", "close", "volume"]
+        df = pd.DataFrame(merge_ohlcv_arrays(arrs), columns=columns)
         # ----------------------------------------------------------------------
         # 1) Clip to [start_ts, end_ts] and return
         # ----------------------------------------------------------------------
@@ -924,131 +903,281 @@ async def prepare_hlcvs(config: dict, exchange: str):
             await om.cc.close()
 
 
-async def prepare_hlcvs_internal(config, coins, exchange, start_date, end_date, om):
-    end_ts = date_to_ts(end_date)
-    minimum_coin_age_days = config["live"]["minimum_coin_age_days"]
-    interval_ms = 60000
-
-    first_timestamps_unified = await get_first_timestamps_unified(coins)
-
-    # Create cache directory if it doesn't exist
-    cache_dir = Path(f"./caches/hlcvs_data/{uuid4().hex[:16]}")
-    cache_dir.mkdir(parents=True, exist_ok=True)
-
-    # First pass: Download data and store metadata
-    coin_metadata = {}
-
-    valid_coins = {}
-    global_start_time = float("inf")
-    global_end_time = float("-inf")
-    await om.load_markets()
+async def get_coin_hlcvs_start_ts(
+    om, coin, start_date, end_ts, minimum_coin_age_days, first_timestamps_unified
+):
+    """
+    Returns the timestamp from which to load the coin's 1m data: start_date, or when the coin
+    reaches minimum_coin_age_days if later. Returns None if the coin is missing or too young.
+    """
+    exchange = om.exchange
     min_coin_age_ms = 1000 * 60 * 60 * 24 * minimum_coin_age_days
+    adjusted_start_ts = date_to_ts(start_date)
+    if not om.has_coin(coin):
+        logging.info(f"{exchange} coin {coin} missing, skipping")
+        return None
+    if coin not in first_timestamps_unified:
+        logging.info(f"coin {coin} missing from first_timestamps_unified, skipping")
+        return None
+    if minimum_coin_age_days > 0.0:
+        first_ts = await om.get_first_timestamp(coin)
+        if first_ts >= end_ts:
+            logging.info(
+                f"{exchange} Coin {coin} too young, start date {ts_to_date_utc(first_ts)}. Skipping"
+            )
+            return None
+        first_ts_plus_min_coin_age = first_timestamps_unified[coin] + min_coin_age_ms
+        if first_ts_plus_min_coin_age >= end_ts:
+            logging.info(
+                f"{exchange} Coin {coin}: Not traded due to min_coin_age {int(minimum_coin_age_days)} days"
+                f"{ts_to_date_utc(first_ts_plus_min_coin_age)}. Skipping"
+            )
+            return None
+        new_adjusted_start_ts = max(first_timestamps_unified[coin] + min_coin_age_ms, first_ts)
+        if new_adjusted_start_ts > adjusted_start_ts:
+            logging.info(
+                f"{exchange} Coin {coin}: Adjusting start date from {start_date} "
+                f"to {ts_to_date_utc(new_adjusted_start_ts)}"
+            )
+            adjusted_start_ts = new_adjusted_start_ts
+    return adjusted_start_ts
 
-    # First pass: Download and save data, collect metadata
-    for coin in coins:
-        adjusted_start_ts = date_to_ts(start_date)
-        if not om.has_coin(coin):
-            logging.info(f"{exchange} coin {coin} missing, skipping")
-            continue
-        if coin not in first_timestamps_unified:
-            logging.info(f"coin {coin} missing from first_timestamps_unified, skipping")
-            continue
-        if minimum_coin_age_days > 0.0:
-            first_ts = await om.get_first_timestamp(coin)
-            if first_ts >= end_ts:
-                logging.info(
-                    f"{exchange} Coin {coin} too young, start date {ts_to_date_utc(first_ts)}. Skipping"
-                )
-                continue
-            first_ts_plus_min_coin_age = first_timestamps_unified[coin] + min_coin_age_ms
-            if first_ts_plus_min_coin_age >= end_ts:
-                logging.info(
-                    f"{exchange} Coin {coin}: Not traded due to min_coin_age {int(minimum_coin_age_days)} days"
-                    f"{ts_to_date_utc(first_ts_plus_min_coin_age)}. Skipping"
-                )
-                continue
-            new_adjusted_start_ts = max(first_timestamps_unified[coin] + min_coin_age_ms, first_ts)
-            if new_adjusted_start_ts > adjusted_start_ts:
-                logging.info(
-                    f"{exchange} Coin {coin}: Adjusting start date from {start_date} "
-                    f"to {ts_to_date_utc(new_adjusted_start_ts)}"
-                )
-                adjusted_start_ts = new_adjusted_start_ts
-        try:
-            om.update_date_range(adjusted_start_ts)
-            df = await om.get_ohlcvs(coin)
-            data = df[["timestamp", "high", "low", "close", "volume"]].values
-        except Exception as e:
-            logging.error(f"error with get_ohlcvs for {coin} {e}. Skipping")
-            traceback.print_exc()
-            continue
-        if len(data) == 0:
-            continue
-
-        assert (np.diff(data[:, 0]) == interval_ms).all(), f"gaps in hlcv data {coin}"
 
-        # Save data to disk
-        file_path = cache_dir / f"{coin}.npy"
-        dump_ohlcv_data(data, file_path)
+async def load_coin_hlcvs_data(om, coin, start_ts):
+    """
+    Returns the coin's 1m data from start_ts to om's end date with columns timestamp, high, low,
+    close, volume, downloading missing days. Returns None if there is no data.
+    """
+    interval_ms = 60000
+    try:
+        om.update_date_range(start_ts)
+        df = await om.get_ohlcvs(coin)
+        data = df[["timestamp", "high", "low", "close", "volume"]].values
+    except Exception as e:
+        logging.error(f"error with get_ohlcvs for {coin} {e}. Skipping")
+        traceback.print_exc()
+        return None
+    if len(data) == 0:
+        return None
 
-        # Update metadata
-        coin_metadata[coin] = {
-            "start_time": int(data[0, 0]),
-            "end_time": int(data[-1, 0]),
-            "length": len(data),
-        }
+    assert (np.diff(data[:, 0]) == interval_ms).all(), f"gaps in hlcv data {coin}"
+    return data
 
-        valid_coins[coin] = file_path
-        global_start_time = min(global_start_time, data[0, 0])
-        global_end_time = max(global_end_time, data[-1, 0])
 
-    if not valid_coins:
-        raise ValueError("No valid coins found with data")
+async def get_coin_hlcvs_data(
+    om, coin, start_date, end_ts, minimum_coin_age_days, first_timestamps_unified
+):
+    """
+    Returns the coin's 1m data from start_date, or from when it reaches minimum_coin_age_days if
+    later, with columns timestamp, high, low, close, volume.
+    Returns None if the coin is missing, too young or has no data.
+    """
+    start_ts = await get_coin_hlcvs_start_ts(
+        om, coin, start_date, end_ts, minimum_coin_age_days, first_timestamps_unified
+    )
+    if start_ts is None:
+        return None
+    return await load_coin_hlcvs_data(om, coin, start_ts)
 
-    # Calculate dimensions for the unified array
-    n_timesteps = int((global_end_time - global_start_time) / interval_ms) + 1
-    n_coins = len(valid_coins)
 
-    # Create the timestamp array
-    timestamps = np.arange(global_start_time, global_end_time + interval_ms, interval_ms)
+def compact_hlcvs_inplace(unified_array, row_start, row_end, coin_idxs, n_rows_per_chunk=2**14):
+    """
+    Returns unified_array[row_start:row_end, coin_idxs] as a C contiguous array sharing
+    unified_array's buffer, without a second full size array. Chunks of rows are moved
+    towards the start of the buffer; a chunk's destination never overlaps rows not yet moved.
+    """
+    n_coins = len(coin_idxs)
+    n_fields = unified_array.shape[2]
+    flat = unified_array.reshape(-1)
+    for chunk_start in range(row_start, row_end, n_rows_per_chunk):
+        chunk_end = min(chunk_start + n_rows_per_chunk, row_end)
+        chunk = unified_array[chunk_start:chunk_end, coin_idxs]
+        dest_start = (chunk_start - row_start) * n_coins * n_fields
+        flat[dest_start : dest_start + chunk.size] = chunk.reshape(-1)
+    return flat[: (row_end - row_start) * n_coins * n_fields].reshape(
+        row_end - row_start, n_coins, n_fields
+    )
 
-    # Pre-allocate the unified array
-    unified_array = np.zeros((n_timesteps, n_coins, 4))
 
-    # Second pass: Load data from disk and populate the unified array
-    logging.info(f"{exchange} Unifying data for {len(valid_coins)} coins into single numpy array...")
-    for i, coin in enumerate(tqdm(valid_coins, desc="Processing coins", unit="coin")):
-        file_path = valid_coins[coin]
-        ohlcv = np.load(file_path)
+async def prepare_hlcvs_internal(config, coins, exchange, start_date, end_date, om):
+    end_ts = date_to_ts(end_date)
+    minimum_coin_age_days = config["live"]["minimum_coin_age_days"]
+    interval_ms = 60000
 
-        # Calculate indices
-        start_idx = int((ohlcv[0, 0] - global_start_time) / interval_ms)
-        end_idx = start_idx + len(ohlcv)
+    first_timestamps_unified = await get_first_timestamps_unified(coins)
+    await om.load_markets()
 
-        # Extract and process data
-        coin_data = ohlcv[:, 1:]
+    # First pass: find each coin's start, skipping missing and too young coins
+    start_tss = await asyncio.gather(
+        *[
+            get_coin_hlcvs_start_ts(
+                om, coin, start_date, end_ts, minimum_coin_age_days, first_timestamps_unified
+            )
+            for coin in coins
+        ]
+    )
+    start_tss = {coin: ts for coin, ts in zip(coins, start_tss) if ts is not None}
+    if not start_tss:
+        raise ValueError("No valid coins found with data")
+    candidate_coins = sorted(start_tss)
+
+    # Pre-allocate the unified array for the widest possible date range, so coins can be written
+    # as soon as they're loaded, before the final range is known
+    min_start_ts = min(start_tss.values())
+    n_max_timesteps = int((end_ts - min_start_ts) // interval_ms) + 1
+    unified_array = np.zeros(
+        (n_max_timesteps, len(candidate_coins), 4), dtype=config["backtest"]["hlcvs_dtype"]
+    )
 
-        # Place the data in the unified array
+    def place_coin_data(i, data):
+        start_idx = int((data[0, 0] - min_start_ts) // interval_ms)
+        end_idx = start_idx + len(data)
+        coin_data = data[:, 1:]
         unified_array[start_idx:end_idx, i, :] = coin_data
-
         # Front-fill
         if start_idx > 0:
             unified_array[:start_idx, i, :3] = coin_data[0, 2]
-
         # Back-fill
-        if end_idx < n_timesteps:
+        if end_idx < n_max_timesteps:
             unified_array[end_idx:, i, :3] = coin_data[-1, 2]
 
-        # Clean up temporary file
-        os.remove(file_path)
+    # Second pass: load coins concurrently, writing each into its column as soon as it's loaded.
+    # Each load uses a shallow copy of om with its own date range, sharing the ccxt client,
+    # markets and request rate limit budget.
+    coin_metadata = {}
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_COIN_LOADS)
+    loop = asyncio.get_running_loop()
+    logging.info(f"{exchange} Loading data for {len(candidate_coins)} coins into numpy array...")
+    pbar = tqdm(total=len(candidate_coins), desc="Processing coins", unit="coin")
+
+    async def load_coin(i, coin):
+        async with semaphore:
+            data = await load_coin_hlcvs_data(copy.copy(om), coin, start_tss[coin])
+            if data is not None:
+                await loop.run_in_executor(None, place_coin_data, i, data)
+                coin_metadata[coin] = {
+                    "start_time": int(data[0, 0]),
+                    "end_time": int(data[-1, 0]),
+                    "length": len(data),
+                }
+        pbar.update(1)
+
+    await asyncio.gather(*[load_coin(i, coin) for i, coin in enumerate(candidate_coins)])
+    pbar.close()
+
+    valid_coins = [coin for coin in candidate_coins if coin in coin_metadata]
+    if not valid_coins:
+        raise ValueError("No valid coins found with data")
+    global_start_time = min(coin_metadata[coin]["start_time"] for coin in valid_coins)
+    global_end_time = max(coin_metadata[coin]["end_time"] for coin in valid_coins)
+    timestamps = np.arange(global_start_time, global_end_time + interval_ms, interval_ms)
+    row_start = int((global_start_time - min_start_ts) // interval_ms)
+    row_end = row_start + len(timestamps)
+    if len(valid_coins) == len(candidate_coins):
+        unified_array = unified_array[row_start:row_end]
+    else:
+        unified_array = compact_hlcvs_inplace(
+            unified_array,
+            row_start,
+            row_end,
+            [candidate_coins.index(coin) for coin in valid_coins],
+        )
 
-    # Clean up cache directory if empty
+    mss = {coin: om.get_market_specific_settings(coin) for coin in valid_coins}
+    coin_ranges = {
+        coin: [coin_metadata[coin]["start_time"], coin_metadata[coin]["end_time"]]
+        for coin in valid_coins
+    }
+    return mss, timestamps, unified_array, coin_ranges
+
+
+async def prepare_hlcvs_appended(
+    config: dict, exchange: str, coins, timestamps, hlcvs, coin_ranges
+):
+    """
+    Extends hlcvs prepared by prepare_hlcvs for the same approved coins and start date, but an
+    earlier end date, to the end date of config. Only days after each coin's last cached minute
+    are loaded; approved coins missing from hlcvs are prepared in full, as they may have come
+    of age since. Raises if a coin's new data doesn't continue its cached data, so the caller
+    can prepare everything from scratch instead.
+    Returns mss, timestamps, unified_array and coin_ranges like prepare_hlcvs.
+    """
+    approved_coins = sorted(
+        set([symbol_to_coin(c) for c in config["live"]["approved_coins"]["long"]])
+        | set([symbol_to_coin(c) for c in config["live"]["approved_coins"]["short"]])
+    )
+    if exchange == "binance":
+        exchange = "binanceusdm"
+    start_date = config["backtest"]["start_date"]
+    end_date = format_end_date(config["backtest"]["end_date"])
+    end_ts = date_to_ts(end_date)
+    cached_end_ts = int(timestamps[-1])
+    interval_ms = 60000
+    om = OHLCVManager(
+        exchange,
+        start_date,
+        end_date,
+        gap_tolerance_ohlcvs_minutes=config["backtest"]["gap_tolerance_ohlcvs_minutes"],
+    )
     try:
-        os.rmdir(cache_dir)
-    except OSError:
-        pass
-    mss = {coin: om.get_market_specific_settings(coin) for coin in sorted(valid_coins)}
-    return mss, timestamps, unified_array
+        await om.load_markets()
+        first_timestamps_unified = await get_first_timestamps_unified(approved_coins)
+        new_data = {}
+        for coin in approved_coins:
+            if coin in coin_ranges:
+                last_ts = coin_ranges[coin][1]
+                om.update_date_range(last_ts + interval_ms)
+                df = await om.get_ohlcvs(coin)
+                data = df[["timestamp", "high", "low", "close", "volume"]].values
+                if len(data) == 0:
+                    if last_ts >= cached_end_ts:
+                        raise Exception(f"no data for {coin} after {ts_to_date_utc(last_ts)}")
+                    continue  # delisted before the cached end date
+                if data[0, 0] != last_ts + interval_ms:
+                    raise Exception(f"gap in {coin} data after {ts_to_date_utc(last_ts)}")
+            else:
+                data = await get_coin_hlcvs_data(
+                    om,
+                    coin,
+                    start_date,
+                    end_ts,
+                    config["live"]["minimum_coin_age_days"],
+                    first_timestamps_unified,
+                )
+                if data is None:
+                    continue
+            assert (np.diff(data[:, 0]) == interval_ms).all(), f"gaps in hlcv data {coin}"
+            new_data[coin] = data
+            logging.info(
+                f"{exchange} {coin}: {len(data)} new minutes from {ts_to_date_utc(data[0, 0])}"
+            )
+        coin_ranges = {coin: list(coin_ranges[coin]) for coin in coins}
+        for coin, data in new_data.items():
+            if coin in coin_ranges:
+                coin_ranges[coin][1] = int(data[-1, 0])
+            else:
+                coin_ranges[coin] = [int(data[0, 0]), int(data[-1, 0])]
+        global_start_time = min(first_ts for first_ts, _ in coin_ranges.values())
+        global_end_time = max(last_ts for _, last_ts in coin_ranges.values())
+        new_timestamps = np.arange(global_start_time, global_end_time + interval_ms, interval_ms)
+        valid_coins = sorted(coin_ranges)
+        unified_array = np.zeros(
+            (len(new_timestamps), len(valid_coins), 4), dtype=config["backtest"]["hlcvs_dtype"]
+        )
+        offset = int((timestamps[0] - global_start_time) // interval_ms)
+        for i, coin in enumerate(valid_coins):
+            if coin in coins:
+                unified_array[offset : offset + len(hlcvs), i] = hlcvs[:, coins.index(coin)]
+            if coin in new_data:
+                data = new_data[coin]
+                start_idx = int((data[0, 0] - global_start_time) // interval_ms)
+                unified_array[start_idx : start_idx + len(data), i] = data[:, 1:]
+        refill_hlcvs(unified_array, new_timestamps, valid_coins, coin_ranges)
+        mss = {coin: om.get_market_specific_settings(coin) for coin in valid_coins}
+        return mss, new_timestamps, unified_array, coin_ranges
+    finally:
+        if om.cc:
+            await om.cc.close()
 
 
 async def prepare_hlcvs_combined(config):
@@ -1096,6 +1225,7 @@ async def _prepare_hlcvs_combined_impl(config, om_dict):
         unified_array: 3D numpy array with shape (len(timestamps), n_coins, 4),
                        where the last dimension is [high, low, close, volume].
                        Price fields are forward-filled; volume is 0-filled for missing data.
+        coin_ranges: dict of coin -> [first timestamp, last timestamp] of the chosen data
     """
     # ---------------------------------------------------------------
     # 0) Define or load relevant info from config
@@ -1239,7 +1369,7 @@ async def _prepare_hlcvs_combined_impl(config, om_dict):
     pprint.pprint(dict(exchange_volume_ratios_mapped))
 
     # We'll store [high, low, close, volume] in the last dimension
-    unified_array = np.zeros((n_timesteps, n_coins, 4), dtype=np.float64)
+    unified_array = np.zeros((n_timesteps, n_coins, 4), dtype=config["backtest"]["hlcvs_dtype"])
 
     # For each coin i, reindex its DataFrame onto the full timestamps
     for i, coin in enumerate(valid_coins):
@@ -1278,8 +1408,13 @@ async def _prepare_hlcvs_combined_impl(config, om_dict):
     #   - chosen_mss_per_coin: dict coin-> market settings from the chosen exchange
     #   - timestamps: 1D array of all unified timestamps
     #   - unified_array: shape (n_timestamps, n_coins, 4) => [H, L, C, V]
+    #   - coin_ranges: dict coin -> [first, last] timestamp of the chosen data
     # ---------------------------------------------------------------
-    return chosen_mss_per_coin, timestamps, unified_array
+    coin_ranges = {
+        coin: [int(df.timestamp.iloc[0]), int(df.timestamp.iloc[-1])]
+        for coin, df in chosen_data_per_coin.items()
+    }
+    return chosen_mss_per_coin, timestamps, unified_array, coin_ranges
 
 
 async def fetch_data_for_coin_and_exchange(
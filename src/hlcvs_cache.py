@@ -0,0 +1,393 @@
+"""
+Block compressed, seekable storage of hlcvs arrays.
+
+An hlcvs array of shape (n_timesteps, n_coins, 4) is split into blocks of one coin and
+chunk_minutes timesteps. Each field of a block is encoded on its own: exchange prices are
+multiples of a decimal price step, so a field whose values are all exactly k / 10**decimals is
+stored as the zigzag encoded deltas of the integers k, byte shuffled, i.e. the bytes of the
+deltas are grouped by significance as in blosc, which leaves long runs of zero high bytes.
+Fields which are not exact decimals, e.g. quote volumes, are stored as is, which compresses
+better than shuffled for them. The encoded fields of a block are compressed together with zstd
+(zlib if zstandard is not installed). All blocks are concatenated in one file; the index file
+holds shape, dtype, codec, first timestamp, coins and the offset, length and field decimals of
+every block. Blocks are compressed and decompressed in parallel threads, and any coin subset
+and timestamp range can be read without touching the other blocks.
+
+Each cache directory also holds a meta file, so a cache built for a superset of the coins and
+date range of a request can serve it as a slice instead of rebuilding from daily ohlcv files.
+"""
+
+import json
+import os
+import shutil
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import zstandard
+except:
+    print("zstandard not found, trying without...")
+    zstandard = None
+
+INDEX_FNAME = "hlcvs_index.json"
+BLOCKS_FNAME = "hlcvs.blocks"
+META_FNAME = "cache_meta.json"
+INTERVAL_MS = 60_000
+DEFAULT_CHUNK_MINUTES = 60 * 24 * 7
+DEFAULT_LEVEL = 3
+FORMAT = 2
+# fields with more decimals are stored as is
+MAX_DECIMALS = 12
+# cache inputs which must match for a cache to serve another request
+CACHE_SETTINGS_KEYS = [
+    "exchange",
+    "minimum_coin_age_days",
+    "gap_tolerance_ohlcvs_minutes",
+    "hlcvs_dtype",
+]
+
+
+def default_n_threads():
+    return min(32, os.cpu_count() or 1)
+
+
+def shuffle_bytes(arr: np.ndarray) -> bytes:
+    """Byte i of every value is stored before byte i + 1 of any value."""
+    arr = np.ascontiguousarray(arr)
+    return arr.view(np.uint8).reshape(-1, arr.dtype.itemsize).T.tobytes()
+
+
+def unshuffle_bytes(buf: bytes, dtype, shape) -> np.ndarray:
+    itemsize = np.dtype(dtype).itemsize
+    shuffled = np.frombuffer(buf, dtype=np.uint8).reshape(itemsize, -1)
+    return np.ascontiguousarray(shuffled.T).view(dtype).reshape(shape)
+
+
+def bitwise_equal(a: np.ndarray, b: np.ndarray) -> bool:
+    """Unlike ==, tells -0.0 from 0.0 and matches NaN with identical NaN."""
+    return a.dtype == b.dtype and np.array_equal(a.view(np.uint8), b.view(np.uint8))
+
+
+def find_decimals(values: np.ndarray):
+    """
+    Returns the fewest decimals d such that values are exactly round(values * 10**d) / 10**d
+    in values' dtype, or None.
+    """
+
+    def is_exact(values, decimals):
+        ints = np.round(values.astype(np.float64) * 10.0**decimals)
+        if not np.all(np.abs(ints) < 2**53):
+            return False
+        # decoded the way decode_field does, which also rules out -0.0
+        decoded = (ints.astype(np.int64) / 10.0**decimals).astype(values.dtype)
+        return bitwise_equal(decoded, values)
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        for decimals in range(MAX_DECIMALS + 1):
+            # a few values rule out most decimals cheaply
+            if is_exact(values[:64], decimals) and is_exact(values, decimals):
+                return decimals
+    return None
+
+
+def encode_field(values: np.ndarray, decimals) -> bytes:
+    if decimals is None:
+        return values.tobytes()
+    ints = np.round(values.astype(np.float64) * 10.0**decimals).astype(np.int64)
+    deltas = np.diff(ints, prepend=0)
+    return shuffle_bytes((deltas << 1) ^ (deltas >> 63))
+
+
+def decode_field(buf: bytes, decimals, dtype, n_values: int) -> np.ndarray:
+    if decimals is None:
+        return np.frombuffer(buf, dtype=dtype, count=n_values)
+    zigzag = unshuffle_bytes(buf, np.uint64, (n_values,))
+    deltas = (zigzag >> np.uint64(1)).view(np.int64) ^ -(zigzag & np.uint64(1)).view(np.int64)
+    return (np.cumsum(deltas) / 10.0**decimals).astype(dtype)
+
+
+def encode_block(block: np.ndarray):
+    """
+    Encodes a block of shape (n_timesteps, n_fields) field by field.
+    Returns (bytes, decimals per field).
+    """
+    fields = np.ascontiguousarray(block.T)
+    decimals = [find_decimals(values) for values in fields]
+    return b"".join(encode_field(values, d) for values, d in zip(fields, decimals)), decimals
+
+
+def decode_block(buf: bytes, decimals: list, dtype, shape) -> np.ndarray:
+    n_values = shape[0]
+    buf = memoryview(buf)
+    block = np.empty(shape, dtype=dtype)
+    offset = 0
+    for j, d in enumerate(decimals):
+        nbytes = n_values * (8 if d is not None else np.dtype(dtype).itemsize)
+        block[:, j] = decode_field(buf[offset : offset + nbytes], d, dtype, n_values)
+        offset += nbytes
+    return block
+
+
+def compress_block(data: bytes, codec: str, level: int) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, level)
+    raise ValueError(f"unknown hlcvs cache codec {codec}")
+
+
+def decompress_block(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"unknown hlcvs cache codec {codec}")
+
+
+def hlcvs_blocks_exist(cache_dir) -> bool:
+    cache_dir = Path(cache_dir)
+    return (cache_dir / INDEX_FNAME).exists() and (cache_dir / BLOCKS_FNAME).exists()
+
+
+def load_hlcvs_index(cache_dir) -> dict:
+    return json.load(open(Path(cache_dir) / INDEX_FNAME))
+
+
+def save_hlcvs_blocks(
+    cache_dir,
+    hlcvs: np.ndarray,
+    coins: list,
+    first_timestamp: int,
+    chunk_minutes: int = DEFAULT_CHUNK_MINUTES,
+    level: int = DEFAULT_LEVEL,
+    n_threads: int = None,
+):
+    """
+    Writes hlcvs of shape (n_timesteps, n_coins, 4) as compressed blocks. The index is written
+    last, so an interrupted save leaves no readable cache behind.
+    """
+    cache_dir = Path(cache_dir)
+    n_timesteps, n_coins = hlcvs.shape[:2]
+    assert len(coins) == n_coins, f"{len(coins)} coins for hlcvs of shape {hlcvs.shape}"
+    codec = "zstd" if zstandard is not None else "zlib"
+    chunk_starts = list(range(0, n_timesteps, chunk_minutes))
+
+    def compress(key):
+        coin_idx, start = key
+        data, decimals = encode_block(hlcvs[start : start + chunk_minutes, coin_idx])
+        return compress_block(data, codec, level), decimals
+
+    keys = [(coin_idx, start) for coin_idx in range(n_coins) for start in chunk_starts]
+    blocks = [[None] * len(chunk_starts) for _ in range(n_coins)]
+    offset = 0
+    with open(cache_dir / BLOCKS_FNAME, "wb") as f, ThreadPoolExecutor(
+        n_threads or default_n_threads()
+    ) as executor:
+        # map yields in order, so blocks are written sequentially while others compress
+        for (coin_idx, start), (data, decimals) in zip(keys, executor.map(compress, keys)):
+            f.write(data)
+            blocks[coin_idx][start // chunk_minutes] = [offset, len(data), decimals]
+            offset += len(data)
+    index = {
+        "format": FORMAT,
+        "shape": list(hlcvs.shape),
+        "dtype": hlcvs.dtype.str,
+        "codec": codec,
+        "chunk_minutes": chunk_minutes,
+        "first_timestamp": int(first_timestamp),
+        "interval_ms": INTERVAL_MS,
+        "coins": list(coins),
+        "blocks": blocks,
+    }
+    tmp_fpath = cache_dir / (INDEX_FNAME + ".tmp")
+    json.dump(index, open(tmp_fpath, "w"))
+    os.replace(tmp_fpath, cache_dir / INDEX_FNAME)
+    return offset
+
+
+def load_hlcvs_blocks(
+    cache_dir,
+    coins: list = None,
+    start_ts: int = None,
+    end_ts: int = None,
+    n_threads: int = None,
+    index: dict = None,
+):
+    """
+    Reads hlcvs from compressed blocks, optionally only the given coins (in the given order)
+    and the timesteps from start_ts up to and including end_ts.
+    Returns (coins, timestamps, hlcvs).
+    """
+    cache_dir = Path(cache_dir)
+    if index is None:
+        index = load_hlcvs_index(cache_dir)
+    n_timesteps, n_coins, n_fields = index["shape"]
+    dtype = np.dtype(index["dtype"])
+    chunk_minutes = index["chunk_minutes"]
+    first_timestamp = index["first_timestamp"]
+    interval_ms = index["interval_ms"]
+
+    if coins is None:
+        coins = index["coins"]
+    coin_idxs = {coin: i for i, coin in enumerate(index["coins"])}
+    missing = [coin for coin in coins if coin not in coin_idxs]
+    if missing:
+        raise KeyError(f"coins missing from hlcvs cache {cache_dir}: {missing}")
+    start_idx, end_idx = 0, n_timesteps
+    if start_ts is not None:
+        start_idx = max(0, -((first_timestamp - start_ts) // interval_ms))
+    if end_ts is not None:
+        end_idx = min(n_timesteps, (end_ts - first_timestamp) // interval_ms + 1)
+    if start_idx >= end_idx:
+        raise ValueError(f"no timesteps in hlcvs cache {cache_dir} between {start_ts} and {end_ts}")
+
+    hlcvs = np.empty((end_idx - start_idx, len(coins), n_fields), dtype=dtype)
+    jobs = []
+    for i, coin in enumerate(coins):
+        for chunk_idx in range(start_idx // chunk_minutes, (end_idx - 1) // chunk_minutes + 1):
+            jobs.append((i, coin_idxs[coin], chunk_idx))
+
+    fd = os.open(cache_dir / BLOCKS_FNAME, os.O_RDONLY)
+
+    def decompress(job):
+        i, coin_idx, chunk_idx = job
+        offset, length, *decimals = index["blocks"][coin_idx][chunk_idx]
+        chunk_start = chunk_idx * chunk_minutes
+        chunk_len = min(chunk_minutes, n_timesteps - chunk_start)
+        data = decompress_block(os.pread(fd, length, offset), index["codec"])
+        if decimals:
+            block = decode_block(data, decimals[0], dtype, (chunk_len, n_fields))
+        else:
+            # format 1: the whole block byte shuffled
+            block = unshuffle_bytes(data, dtype, (chunk_len, n_fields))
+        lo, hi = max(start_idx, chunk_start), min(end_idx, chunk_start + chunk_len)
+        hlcvs[lo - start_idx : hi - start_idx, i] = block[lo - chunk_start : hi - chunk_start]
+
+    try:
+        with ThreadPoolExecutor(n_threads or default_n_threads()) as executor:
+            list(executor.map(decompress, jobs))
+    finally:
+        os.close(fd)
+    timestamps = first_timestamp + np.arange(start_idx, end_idx, dtype=np.int64) * interval_ms
+    return list(coins), timestamps, hlcvs
+
+
+def save_cache_meta(cache_dir, meta: dict):
+    """
+    Meta of a cache: the inputs it was built from, the timestamp of its first row and the
+    first and last timestamp of each coin's data, which lets it serve subsets of itself.
+    """
+    json.dump(meta, open(Path(cache_dir) / META_FNAME, "w"))
+
+
+def load_cache_meta(cache_dir):
+    fpath = Path(cache_dir) / META_FNAME
+    return json.load(open(fpath)) if fpath.exists() else None
+
+
+def iter_cache_metas(caches_dir):
+    caches_dir = Path(caches_dir)
+    if not caches_dir.exists():
+        return
+    for cache_dir in caches_dir.iterdir():
+        try:
+            meta = load_cache_meta(cache_dir)
+        except Exception:
+            continue
+        if meta is not None:
+            yield cache_dir, meta
+
+
+def cache_covers(meta: dict, request: dict) -> bool:
+    """
+    True if the cache described by meta was built from a superset of the coins and a superset of
+    the date range of request, with otherwise identical inputs. Both are dicts as built by
+    backtest.get_cache_meta_request.
+    """
+    if any(meta.get(key) != request[key] for key in CACHE_SETTINGS_KEYS):
+        return False
+    return (
+        meta["start_ts"] <= request["start_ts"]
+        and meta["end_ts"] >= request["end_ts"]
+        and set(request["approved_coins"]) <= set(meta["approved_coins"])
+    )
+
+
+def find_covering_cache(caches_dir, request: dict):
+    """
+    Returns (cache_dir, meta) of the smallest cache in caches_dir covering request, or None.
+    """
+    best = None
+    for cache_dir, meta in iter_cache_metas(caches_dir):
+        if not cache_covers(meta, request):
+            continue
+        size = meta["n_timesteps"] * len(meta["coin_ranges"])
+        if best is None or size < best[0]:
+            best = (size, cache_dir, meta)
+    return None if best is None else best[1:]
+
+
+def find_appendable_cache(caches_dir, request: dict):
+    """
+    Returns (cache_dir, meta) of the most recent cache built from the same inputs as request
+    except for an earlier end date, or None.
+    """
+    best = None
+    for cache_dir, meta in iter_cache_metas(caches_dir):
+        if (
+            all(meta.get(key) == request[key] for key in CACHE_SETTINGS_KEYS)
+            and meta["start_ts"] == request["start_ts"]
+            and meta["end_ts"] < request["end_ts"]
+            and meta["approved_coins"] == request["approved_coins"]
+        ):
+            if best is None or meta["end_ts"] > best[1]["end_ts"]:
+                best = (cache_dir, meta)
+    return best
+
+
+def remove_superseded_caches(caches_dir, cache_dir, meta: dict):
+    """
+    Deletes the caches in caches_dir which the cache in cache_dir covers and can serve instead.
+    Returns the deleted cache dirs.
+    """
+    removed = []
+    for other_dir, other_meta in list(iter_cache_metas(caches_dir)):
+        if Path(other_dir).resolve() == Path(cache_dir).resolve():
+            continue
+        if cache_covers(meta, other_meta):
+            shutil.rmtree(other_dir, ignore_errors=True)
+            removed.append(other_dir)
+    return removed
+
+
+def slice_coin_ranges(coin_ranges: dict, coins: list, start_ts: int, end_ts: int, strict: bool):
+    """
+    Clips the data ranges of coins to [start_ts, end_ts], dropping coins without data in it.
+    With strict, coins whose data starts at end_ts are dropped too, as the downloader drops
+    coins too young to trade before the end date when a minimum coin age is set.
+    """
+    sliced = {}
+    for coin in coins:
+        first_ts, last_ts = max(coin_ranges[coin][0], start_ts), min(coin_ranges[coin][1], end_ts)
+        if first_ts < last_ts or (first_ts == last_ts and not strict):
+            sliced[coin] = [first_ts, last_ts]
+    return sliced
+
+
+def refill_hlcvs(hlcvs: np.ndarray, timestamps: np.ndarray, coins: list, coin_ranges: dict):
+    """
+    Front and back fills each coin's prices outside its data range with its first and last
+    close and zero volume, in place, the same way the downloader fills the unified array.
+    """
+    for i, coin in enumerate(coins):
+        start_idx = int(np.searchsorted(timestamps, coin_ranges[coin][0]))
+        end_idx = int(np.searchsorted(timestamps, coin_ranges[coin][1], side="right"))
+        if start_idx > 0:
+            hlcvs[:start_idx, i, :3] = hlcvs[start_idx, i, 2]
+            hlcvs[:start_idx, i, 3] = 0.0
+        if end_idx < len(hlcvs):
+            hlcvs[end_idx:, i, :3] = hlcvs[end_idx - 1, i, 2]
+            hlcvs[end_idx:, i, 3] = 0.0
@@ -0,0 +1,94 @@
+"""
+Helpers for ohlcv arrays and frames with columns timestamp, open, high, low, close, volume.
+
+Kept free of passivbot_rust and exchange imports, so tools can use them without the compiled
+extension.
+"""
+
+import numpy as np
+
+
+def ensure_millis(df):
+    if "timestamp" not in df.columns:
+        return df
+    if df.timestamp.iloc[0] > 1e14:  # is microseconds
+        df.timestamp /= 1000
+    elif df.timestamp.iloc[0] > 1e11:  # is milliseconds
+        pass
+    else:  # is seconds
+        df.timestamp *= 1000
+    return df
+
+
+def deduplicate_rows(arr):
+    """
+    Remove duplicate rows from a 2D NumPy array while preserving order.
+    Rows compare like tuples of their values: 0.0 and -0.0 are equal, and a row containing
+    NaN equals no other row, so it is always kept.
+
+    Parameters:
+    arr (numpy.ndarray): Input 2D array of shape (x, y)
+
+    Returns:
+    numpy.ndarray: Array with duplicate rows removed, maintaining original order
+    """
+    if len(arr) < 2:
+        return arr
+    if arr.dtype.hasobject:
+        # Keep track of seen rows while preserving order
+        seen = set()
+        unique_indices = [
+            i
+            for i, row_tuple in enumerate(map(tuple, arr))
+            if not (row_tuple in seen or seen.add(row_tuple))
+        ]
+        return arr[unique_indices]
+    # Rows with strictly increasing first column, e.g. timestamps, can't be duplicates
+    if (np.diff(arr[:, 0]) > 0).all():
+        return arr
+    # Compare rows bytewise as single void values; np.unique returns first occurrences
+    arr_contiguous = np.ascontiguousarray(arr)
+    is_float = arr.dtype.kind in "fc"
+    if is_float:
+        # -0.0 + 0.0 is 0.0, so signed zeros compare equal
+        arr_contiguous = arr_contiguous + 0.0
+    rows = arr_contiguous.view(np.dtype((np.void, arr.dtype.itemsize * arr.shape[1])))
+    _, unique_indices = np.unique(rows.ravel(), return_index=True)
+    if is_float and np.isnan(arr_contiguous).any():
+        # as in tuples, NaN equals nothing, so rows with NaN are never duplicates
+        nan_rows = np.flatnonzero(np.isnan(arr_contiguous).any(axis=1))
+        unique_indices = np.union1d(unique_indices, nan_rows)
+    if len(unique_indices) == len(arr):
+        return arr
+    return arr[np.sort(unique_indices)]
+
+
+def ensure_millis_array(arr):
+    """
+    Array version of ensure_millis for ohlcv arrays with timestamps in the first column.
+    """
+    if len(arr) == 0:
+        return arr
+    if arr[0, 0] > 1e14:  # is microseconds
+        arr[:, 0] /= 1000
+    elif arr[0, 0] > 1e11:  # is milliseconds
+        pass
+    else:  # is seconds
+        arr[:, 0] *= 1000
+    return arr
+
+
+def merge_ohlcv_arrays(arrs) -> np.ndarray:
+    """
+    Concatenates ohlcv arrays, keeping the first row of each timestamp, sorted by timestamp.
+    """
+    arr = np.concatenate(arrs) if len(arrs) > 1 else arrs[0]
+    timestamps = arr[:, 0]
+    if (np.diff(timestamps) > 0).all():
+        return arr
+    # stable sort, so the first row of equal timestamps comes first
+    arr = arr[np.argsort(timestamps, kind="stable")]
+    keep = np.empty(len(arr), dtype=bool)
+    keep[:1] = True
+    keep[1:] = arr[1:, 0] != arr[:-1, 0]
+    return arr[keep]
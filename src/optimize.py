@@ -7,12 +7,20 @@ import argparse
 import multiprocessing
 import subprocess
 import mmap
+import math
+from functools import partial
+import queue
+import random
+import pickle
 from multiprocessing import Queue, Process
 from collections import defaultdict
 from backtest import (
     prepare_hlcvs_mss,
     prep_backtest_args,
     expand_analysis,
+    get_mapped_hlcvs_file,
+    get_shared_memory_dir,
+    write_shared_memory_file,
 )
 from pure_funcs import (
     get_template_live_config,
@@ -47,7 +55,6 @@ from contextlib import contextmanager
 import tempfile
 import time
 import fcntl
-from tqdm import tqdm
 import dictdiffer
 
 
@@ -102,25 +109,16 @@ def results_writer_process(queue: Queue, results_filename: str, compress=True):
 
 
 def create_shared_memory_file(hlcvs):
-    temp_file = tempfile.NamedTemporaryFile(delete=False)
+    required_space = hlcvs.nbytes * 1.1  # Add 10% buffer
+    shared_memory_dir = get_shared_memory_dir(required_space)
+    check_disk_space(shared_memory_dir, required_space)
+    temp_file = tempfile.NamedTemporaryFile(delete=False, dir=shared_memory_dir, prefix="hlcvs_")
     logging.info(f"Creating shared memory file: {temp_file.name}...")
     shared_memory_file = temp_file.name
     temp_file.close()
 
     try:
-        total_size = hlcvs.nbytes
-        chunk_size = 1024 * 1024  # 1 MB chunks
-        hlcvs_bytes = hlcvs.tobytes()
-
-        with open(shared_memory_file, "wb") as f:
-            with tqdm(
-                total=total_size, unit="B", unit_scale=True, desc="Writing to shared memory"
-            ) as pbar:
-                for i in range(0, len(hlcvs_bytes), chunk_size):
-                    chunk = hlcvs_bytes[i : i + chunk_size]
-                    f.write(chunk)
-                    pbar.update(len(chunk))
-
+        write_shared_memory_file(hlcvs, shared_memory_file)
     except IOError as e:
         logging.error(f"Error writing to shared memory file: {e}")
         raise
@@ -128,6 +126,22 @@ def create_shared_memory_file(hlcvs):
     return shared_memory_file
 
 
+def setup_hlcvs_file(hlcvs, exchange):
+    """
+    Returns the path and byte offset of the file the backtester maps hlcvs from, and whether the
+    file is a cache mapped in place (see backtest.get_mapped_hlcvs_file), which must not be
+    removed. Otherwise a new shared memory file is created.
+    """
+    mapped = get_mapped_hlcvs_file(hlcvs)
+    if mapped is not None:
+        logging.info(f"Mapping cache file for {exchange} in place: {mapped[0]}")
+        return mapped[0], mapped[1], True
+    logging.info(f"Starting to create shared memory file for {exchange}...")
+    shared_memory_file = create_shared_memory_file(hlcvs)
+    logging.info(f"Finished creating shared memory file for {exchange}: {shared_memory_file}")
+    return shared_memory_file, 0, False
+
+
 def check_disk_space(path, required_space):
     total, used, free = shutil.disk_usage(path)
     logging.info(
@@ -265,10 +279,13 @@ def config_to_individual(config, param_bounds):
 
 
 @contextmanager
-def managed_mmap(filename, dtype, shape):
+def managed_mmap(filename, dtype, shape, offset=0):
+    """
+    Maps hlcvs of the given shape, starting offset bytes into the file.
+    """
     mmap = None
     try:
-        mmap = np.memmap(filename, dtype=dtype, mode="r", shape=shape)
+        mmap = np.memmap(filename, dtype=dtype, mode="r", shape=shape, offset=offset)
         yield mmap
     except FileNotFoundError:
         if shutdown_event.is_set():
@@ -280,14 +297,112 @@ def managed_mmap(filename, dtype, shape):
             del mmap
 
 
+def round_half_away(x):
+    # like rust's f64::round, which the backtester uses for integer params
+    return math.floor(x + 0.5) if x >= 0.0 else -math.floor(-x + 0.5)
+
+
+def canonicalize_bot_params(bot_params, sig_digits=10):
+    """
+    Bot params as the Rust backtester sees them: n_positions and filter_rolling_window rounded
+    to integers and other values rounded to sig_digits significant digits. A side which is
+    disabled in the backtest is collapsed to None, as none of its params have any effect.
+    """
+    canonical = {}
+    for pside in sorted(bot_params):
+        params = bot_params[pside]
+        if round_half_away(params["n_positions"]) <= 0 or params["wallet_exposure_limit"] == 0.0:
+            canonical[pside] = None
+            continue
+        canonical[pside] = {}
+        for key, value in sorted(params.items()):
+            if isinstance(value, bool):
+                canonical[pside][key] = value
+            elif key in ["n_positions", "filter_rolling_window"]:
+                canonical[pside][key] = round_half_away(value)
+            else:
+                canonical[pside][key] = float(f"{value:.{sig_digits}g}")
+    return canonical
+
+
+class FitnessCache:
+    """
+    Analyses of backtested configs, shared by all pool workers through manager dicts and keyed
+    by a hash of the data and backtest settings and the canonicalized bot params. Individuals
+    which differ only in params without effect on the backtest, e.g. those of a disabled side,
+    are backtested once.
+    """
+
+    def __init__(self, manager, context, sig_digits=10):
+        self.entries = manager.dict()
+        self.counts = manager.dict()  # pid -> (hits, misses), each written only by its process
+        self.context_hash = calc_hash(context)
+        self.sig_digits = sig_digits
+        self.reported = (0, 0)
+
+    def key(self, bot_params, fidelity=1.0):
+        return calc_hash(
+            [self.context_hash, canonicalize_bot_params(bot_params, self.sig_digits), fidelity]
+        )
+
+    def get(self, key):
+        analyses = self.entries.get(key)
+        hits, misses = self.counts.get(os.getpid(), (0, 0))
+        if analyses is None:
+            self.counts[os.getpid()] = (hits, misses + 1)
+        else:
+            self.counts[os.getpid()] = (hits + 1, misses)
+        return analyses
+
+    def put(self, key, analyses):
+        self.entries[key] = analyses
+
+    def report(self, *args):
+        """Hits/lookups since the previous report. Registered as a logbook statistic."""
+        counts = list(self.counts.values())
+        hits, misses = sum(x[0] for x in counts), sum(x[1] for x in counts)
+        new_hits, new_misses = hits - self.reported[0], misses - self.reported[1]
+        self.reported = (hits, misses)
+        return f"{new_hits}/{new_hits + new_misses}"
+
+    def load(self, path):
+        entries = json.load(open(path))
+        self.entries.update(entries)
+        return len(entries)
+
+    def dump(self, path):
+        """Writes the entries as json, replacing the previous file atomically."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(dict(self.entries), f)
+        os.replace(tmp_path, path)
+
+
 class Evaluator:
-    def __init__(self, shared_memory_files, hlcvs_shapes, hlcvs_dtypes, config, msss, results_queue):
+    def __init__(
+        self,
+        shared_memory_files,
+        hlcvs_shapes,
+        hlcvs_dtypes,
+        config,
+        msss,
+        results_queue,
+        hlcvs_offsets=None,
+        hlcvs_windows=None,
+    ):
         logging.info("Initializing Evaluator...")
+        self.fitness_cache = None
         self.shared_memory_files = shared_memory_files
+        # byte offsets of the data in the files; nonzero for .npy caches mapped in place
+        self.hlcvs_offsets = hlcvs_offsets or {exchange: 0 for exchange in shared_memory_files}
+        # {fidelity: {exchange: (path, shape)}} of the most recent fractions of the hlcvs,
+        # for multi fidelity evaluation
+        self.hlcvs_windows = hlcvs_windows or {}
         self.hlcvs_shapes = hlcvs_shapes
         self.hlcvs_dtypes = hlcvs_dtypes
         self.msss = msss
         self.exchanges = list(shared_memory_files.keys())
+        self.config = config
 
         self.mmap_contexts = {}
         self.shared_hlcvs_np = {}
@@ -299,19 +414,66 @@ class Evaluator:
                 self.shared_memory_files[exchange],
                 self.hlcvs_dtypes[exchange],
                 self.hlcvs_shapes[exchange],
+                self.hlcvs_offsets[exchange],
             )
             self.shared_hlcvs_np[exchange] = self.mmap_contexts[exchange].__enter__()
             _, self.exchange_params[exchange], self.backtest_params[exchange] = prep_backtest_args(
                 config, self.msss[exchange], exchange
             )
+            # backtests breaching these are stopped early; see calc_fitness
+            for key in [
+                "abort_drawdown_worst",
+                "abort_equity_balance_diff_neg_max",
+                "abort_equity_floor",
+            ]:
+                self.backtest_params[exchange][key] = self.config["optimize"][key]
             logging.info(f"mmap_context entered successfully for {exchange}.")
 
-        self.config = config
         logging.info("Evaluator initialization complete.")
         self.results_queue = results_queue
 
-    def evaluate(self, individual):
+    def evaluate(self, individual, fidelity=1.0):
+        """
+        Backtests the individual on the full hlcvs, or with fidelity < 1.0 on the most recent
+        fraction of them, which must be one of self.hlcvs_windows.
+        """
         config = individual_to_config(individual, template=self.config)
+        key, analyses = self.get_cached_analyses(config, fidelity)
+        if analyses is None:
+            analyses = self.backtest(config, fidelity)
+            if key is not None:
+                self.fitness_cache.put(key, analyses)
+        return self.process_analyses(config, analyses, fidelity)
+
+    def hlcvs_args(self, exchange, fidelity=1.0):
+        """Path, shape, dtype and byte offset of the hlcvs of the given fidelity."""
+        if fidelity == 1.0:
+            return (
+                self.shared_memory_files[exchange],
+                self.shared_hlcvs_np[exchange].shape,
+                self.shared_hlcvs_np[exchange].dtype.str,
+                self.hlcvs_offsets[exchange],
+            )
+        path, shape = self.hlcvs_windows[fidelity][exchange]
+        return path, shape, self.shared_hlcvs_np[exchange].dtype.str, 0
+
+    def get_cached_analyses(self, config, fidelity=1.0):
+        """Returns (key, analyses) from the fitness cache; analyses is None on a miss."""
+        if self.fitness_cache is None:
+            return None, None
+        bot_params, _, _ = prep_backtest_args(
+            config,
+            [],
+            self.exchanges[0],
+            exchange_params=self.exchange_params[self.exchanges[0]],
+            backtest_params=self.backtest_params[self.exchanges[0]],
+        )
+        key = self.fitness_cache.key(bot_params, fidelity)
+        return key, self.fitness_cache.get(key)
+
+    def backtest(self, config, fidelity=1.0):
+        if self.config["optimize"]["parallel_exchanges"] and len(self.exchanges) > 1:
+            return self.backtest_exchanges_parallel(config, fidelity)
         analyses = {}
         for exchange in self.exchanges:
             bot_params, _, _ = prep_backtest_args(
@@ -321,16 +483,102 @@ class Evaluator:
                 exchange_params=self.exchange_params[exchange],
                 backtest_params=self.backtest_params[exchange],
             )
-            fills, equities, analysis = pbr.run_backtest(
-                self.shared_memory_files[exchange],
-                self.shared_hlcvs_np[exchange].shape,
-                self.shared_hlcvs_np[exchange].dtype.str,
+            path, shape, dtype, offset = self.hlcvs_args(exchange, fidelity)
+            # fills and equities are not needed by the optimizer; only compute the analysis
+            analysis = pbr.run_backtest_analysis(
+                path,
+                shape,
+                dtype,
                 bot_params,
                 self.exchange_params[exchange],
                 self.backtest_params[exchange],
+                hlcvs_offset=offset,
             )
-            analyses[exchange] = expand_analysis(analysis, fills, config)
+            analyses[exchange] = expand_analysis(analysis, [], config)
+        return analyses
+
+    def backtest_exchanges_parallel(self, config, fidelity=1.0):
+        """
+        Evaluate one config on all exchanges with a single call to the Rust backtester,
+        which runs the per-exchange backtests concurrently on its own thread pool.
+        """
+        bot_params_list = [
+            prep_backtest_args(
+                config,
+                [],
+                exchange,
+                exchange_params=self.exchange_params[exchange],
+                backtest_params=self.backtest_params[exchange],
+            )[0]
+            for exchange in self.exchanges
+        ]
+        paths, shapes, dtypes, offsets = zip(
+            *[self.hlcvs_args(exchange, fidelity) for exchange in self.exchanges]
+        )
+        analyses_list = pbr.run_backtest_analyses_parallel(
+            list(paths),
+            list(shapes),
+            list(dtypes),
+            bot_params_list,
+            [self.exchange_params[exchange] for exchange in self.exchanges],
+            [self.backtest_params[exchange] for exchange in self.exchanges],
+            hlcvs_offsets=list(offsets),
+        )
+        return {
+            exchange: expand_analysis(analysis, [], config)
+            for exchange, analysis in zip(self.exchanges, analyses_list)
+        }
 
+    def evaluate_batch(self, individuals, fidelity=1.0):
+        """
+        Evaluate several individuals with one backtest call per exchange.
+        The hlcvs mmap and exchange params are set up once per batch on the rust side.
+        Individuals found in the fitness cache are left out of the batch.
+        """
+        all_configs = [
+            individual_to_config(individual, template=self.config) for individual in individuals
+        ]
+        keys, all_analyses = zip(
+            *[self.get_cached_analyses(config, fidelity) for config in all_configs]
+        )
+        all_analyses = list(all_analyses)
+        misses = [i for i, analyses in enumerate(all_analyses) if analyses is None]
+        configs = [all_configs[i] for i in misses]
+        analyses_list = [{} for _ in configs]
+        for exchange in self.exchanges if configs else []:
+            bot_params_list = [
+                prep_backtest_args(
+                    config,
+                    [],
+                    exchange,
+                    exchange_params=self.exchange_params[exchange],
+                    backtest_params=self.backtest_params[exchange],
+                )[0]
+                for config in configs
+            ]
+            path, shape, dtype, offset = self.hlcvs_args(exchange, fidelity)
+            batch_analyses = pbr.run_backtests_batch(
+                path,
+                shape,
+                dtype,
+                bot_params_list,
+                self.exchange_params[exchange],
+                self.backtest_params[exchange],
+                parallel=False,  # parallelism is already provided by the process pool
+                hlcvs_offset=offset,
+            )
+            for config, analyses, analysis in zip(configs, analyses_list, batch_analyses):
+                analyses[exchange] = expand_analysis(analysis, [], config)
+        for i, analyses in zip(misses, analyses_list):
+            all_analyses[i] = analyses
+            if keys[i] is not None:
+                self.fitness_cache.put(keys[i], analyses)
+        return [
+            self.process_analyses(config, analyses, fidelity)
+            for config, analyses in zip(all_configs, all_analyses)
+        ]
+
+    def process_analyses(self, config, analyses, fidelity=1.0):
         analyses_combined = self.combine_analyses(analyses)
         w_0, w_1 = self.calc_fitness(analyses_combined)
         analyses_combined.update({"w_0": w_0, "w_1": w_1})
@@ -342,6 +590,9 @@ class Evaluator:
                 "analyses": analyses,
             },
         }
+        if fidelity != 1.0:
+            # backtested on the most recent fraction of the data only; see multi_fidelity_windows
+            data["fidelity"] = fidelity
         self.results_queue.put(data)
         return w_0, w_1
 
@@ -391,7 +642,11 @@ class Evaluator:
                 - self.config["optimize"]["limits"][f"lower_bound_{key}"]
             ) * 10**i
             i -= 1
-        if (
+        if analyses_combined["aborted_max"]:
+            # abort thresholds may be below the limits, so the partial analysis may be within
+            # them; the penalty of at least a complete loss ranks it below configs within them
+            w_0 = w_1 = modifier + 10 ** (len(keys) + 1)
+        elif (
             analyses_combined["drawdown_worst_max"] >= 1.0
             or analyses_combined["equity_balance_diff_neg_max_max"] >= 1.0
         ):
@@ -424,6 +679,7 @@ class Evaluator:
                 self.shared_memory_files[exchange],
                 self.hlcvs_dtypes[exchange],
                 self.hlcvs_shapes[exchange],
+                self.hlcvs_offsets[exchange],
             )
             self.shared_hlcvs_np[exchange] = self.mmap_contexts[exchange].__enter__()
             if self.shared_hlcvs_np[exchange] is None:
@@ -432,6 +688,268 @@ class Evaluator:
                 )
 
 
+# the Evaluator of a pool worker process, set once by init_pool_worker
+pool_evaluator = None
+
+
+def init_pool_worker(evaluator):
+    """
+    Pool initializer. The evaluator, with its config, market settings and backtest params, is
+    sent to each worker once, and tasks send only the individuals to evaluate.
+    """
+    global pool_evaluator
+    pool_evaluator = evaluator
+
+
+def evaluate_in_pool_worker(individual, **kwargs):
+    return pool_evaluator.evaluate(individual, **kwargs)
+
+
+def evaluate_batch_in_pool_worker(individuals, **kwargs):
+    return pool_evaluator.evaluate_batch(individuals, **kwargs)
+
+
+def make_batched_map(pool, batch_size):
+    """
+    Returns a map function for the toolbox which sends individuals to the pool in batches.
+    Other functions passed to the map (not evaluate_in_pool_worker) are mapped as usual.
+    """
+
+    def batched_map(func, iterable):
+        # toolbox.register wraps the registered function in a functools.partial
+        if getattr(func, "func", func) != evaluate_in_pool_worker:
+            return pool.map(func, iterable)
+        individuals = list(iterable)
+        batches = [individuals[i : i + batch_size] for i in range(0, len(individuals), batch_size)]
+        # keyword arguments, e.g. fidelity, are passed on to evaluate_batch
+        evaluate_batch = partial(evaluate_batch_in_pool_worker, **getattr(func, "keywords", {}))
+        return [w for ws in pool.map(evaluate_batch, batches) for w in ws]
+
+    return batched_map
+
+
+def save_checkpoint(path, state):
+    """Pickles the optimizer state, replacing the previous checkpoint atomically."""
+    state = {
+        **state,
+        "random_state": random.getstate(),
+        "np_random_state": np.random.get_state(),
+        "timestamp": utc_ms(),
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Loads a checkpoint written by save_checkpoint. creator.Individual and creator.FitnessMulti
+    must already exist. Random states are restored with restore_random_states.
+    """
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def restore_random_states(checkpoint):
+    random.setstate(checkpoint["random_state"])
+    np.random.set_state(checkpoint["np_random_state"])
+
+
+def ea_mu_plus_lambda(
+    population,
+    toolbox,
+    mu,
+    lambda_,
+    cxpb,
+    mutpb,
+    ngen,
+    stats=None,
+    halloffame=None,
+    verbose=True,
+    start_gen=0,
+    logbook=None,
+    checkpoint=None,
+    fidelities=(),
+    keep_fraction=1.0,
+):
+    """
+    Same as algorithms.eaMuPlusLambda, but may continue from generation start_gen with a
+    restored population and logbook, and calls checkpoint(gen, population, logbook) after
+    each generation.
+    With fidelities, a list of ascending fractions < 1.0 of the data to backtest on (see
+    Evaluator.evaluate), offspring are evaluated by successive halving: all new offspring
+    are evaluated at the lowest fidelity, the best keep_fraction of them by toolbox.select
+    are evaluated at the next fidelity, and so on. Only those surviving the highest
+    fidelity are evaluated on the full data and may join the population.
+    nevals counts the evaluations at all fidelities.
+    """
+    if logbook is None:
+        logbook = tools.Logbook()
+        logbook.header = ["gen", "nevals"] + (stats.fields if stats else [])
+
+    def evaluate_invalid(individuals, fidelity=1.0):
+        invalid_ind = [ind for ind in individuals if not ind.fitness.valid]
+        evaluate = toolbox.evaluate
+        if fidelity != 1.0:
+            evaluate = partial(toolbox.evaluate, fidelity=fidelity)
+        fitnesses = toolbox.map(evaluate, invalid_ind)
+        for ind, fit in zip(invalid_ind, fitnesses):
+            ind.fitness.values = fit
+        return len(invalid_ind)
+
+    def successive_halving(offspring):
+        # offspring reproduced unchanged keep their full fidelity fitness
+        reproduced = [ind for ind in offspring if ind.fitness.valid]
+        candidates = [ind for ind in offspring if not ind.fitness.valid]
+        nevals = 0
+        for fidelity in fidelities:
+            if len(candidates) <= 1:
+                break
+            nevals += evaluate_invalid(candidates, fidelity)
+            n_keep = max(1, math.ceil(len(candidates) * keep_fraction))
+            candidates = toolbox.select(candidates, n_keep)
+            for ind in candidates:
+                del ind.fitness.values
+        nevals += evaluate_invalid(candidates)
+        return reproduced + candidates, nevals
+
+    def record(gen, nevals):
+        record = stats.compile(population) if stats is not None else {}
+        logbook.record(gen=gen, nevals=nevals, **record)
+        if verbose:
+            print(logbook.stream)
+        if checkpoint is not None:
+            checkpoint(gen, population, logbook)
+
+    if start_gen == 0:
+        nevals = evaluate_invalid(population)
+        if halloffame is not None:
+            halloffame.update(population)
+        record(0, nevals)
+
+    for gen in range(start_gen + 1, ngen + 1):
+        offspring = algorithms.varOr(population, toolbox, lambda_, cxpb, mutpb)
+        offspring, nevals = successive_halving(offspring)
+        if halloffame is not None:
+            halloffame.update(offspring)
+        population[:] = toolbox.select(population + offspring, mu)
+        record(gen, nevals)
+
+    return population, logbook
+
+
+def steady_state_nsga2(
+    population,
+    toolbox,
+    pool,
+    mu,
+    cxpb,
+    mutpb,
+    n_evals,
+    n_in_flight,
+    batch_size=1,
+    stats=None,
+    halloffame=None,
+    verbose=True,
+    n_done_start=0,
+    logbook=None,
+    checkpoint=None,
+):
+    """
+    Asynchronous steady state counterpart of algorithms.eaMuPlusLambda with NSGA-II selection.
+    Instead of evaluating a whole generation before varying the next, up to n_in_flight
+    individuals (in batches of batch_size) are kept queued on the pool. Whenever results
+    arrive, the evaluated individuals join the population, which is reduced back to mu with
+    toolbox.select, and as many new offspring are varied from the current population and
+    dispatched. Workers thus never wait for the slowest backtest of a generation.
+    A logbook row is recorded every mu evaluations, i.e. once per equivalent generation, after
+    which checkpoint(n_done, population, logbook) is called. To continue from a checkpoint,
+    pass its population, logbook and n_done as n_done_start; evaluations which were in flight
+    when it was written are redone as new offspring.
+    The pool's workers must have been initialized with init_pool_worker.
+    Returns population and logbook like eaMuPlusLambda.
+    """
+    if logbook is None:
+        logbook = tools.Logbook()
+        logbook.header = ["gen", "nevals"] + (stats.fields if stats else [])
+    completed = queue.Queue()
+    pending = [ind for ind in population if not ind.fitness.valid]
+    evaluated = [ind for ind in population if ind.fitness.valid]
+    n_dispatched = n_done = n_done_logged = n_done_start
+    n_running = 0
+
+    def dispatch(individuals):
+        nonlocal n_running
+        n_running += len(individuals)
+        callback = lambda fitnesses: completed.put((individuals, fitnesses))
+        error_callback = lambda e: completed.put((individuals, e))
+        if batch_size > 1:
+            pool.apply_async(
+                evaluate_batch_in_pool_worker,
+                (individuals,),
+                callback=callback,
+                error_callback=error_callback,
+            )
+        else:
+            pool.apply_async(
+                evaluate_in_pool_worker,
+                (individuals[0],),
+                callback=lambda fitness: callback([fitness]),
+                error_callback=error_callback,
+            )
+
+    def refill():
+        # dispatch the initial individuals first, then offspring of the evaluated population
+        nonlocal n_dispatched
+        while n_running < n_in_flight and n_dispatched < n_evals:
+            n = min(batch_size, n_in_flight - n_running, n_evals - n_dispatched)
+            if pending:
+                batch, pending[:] = pending[:n], pending[n:]
+            elif len(evaluated) >= 2:
+                batch = algorithms.varOr(evaluated, toolbox, n, cxpb, mutpb)
+                # offspring reproduced unchanged keep their fitness, as in eaMuPlusLambda
+                evaluated.extend([ind for ind in batch if ind.fitness.valid])
+                batch = [ind for ind in batch if not ind.fitness.valid]
+            else:
+                break
+            n_dispatched += n
+            if batch:
+                dispatch(batch)
+
+    refill()
+    while n_running > 0:
+        # wait for one result, then take all others which arrived meanwhile
+        results = [completed.get()]
+        while True:
+            try:
+                results.append(completed.get_nowait())
+            except queue.Empty:
+                break
+        for individuals, fitnesses in results:
+            if isinstance(fitnesses, Exception):
+                raise fitnesses
+            n_running -= len(individuals)
+            n_done += len(individuals)
+            for ind, fit in zip(individuals, fitnesses):
+                ind.fitness.values = fit
+            evaluated.extend(individuals)
+            if halloffame is not None:
+                halloffame.update(individuals)
+        if len(evaluated) > mu:
+            evaluated[:] = toolbox.select(evaluated, mu)
+        if n_done - n_done_logged >= mu or (n_running == 0 and n_done > n_done_logged):
+            record = stats.compile(evaluated) if stats else {}
+            logbook.record(gen=n_done // mu, nevals=n_done - n_done_logged, **record)
+            n_done_logged = n_done
+            if verbose:
+                print(logbook.stream)
+            if checkpoint is not None:
+                checkpoint(n_done, evaluated, logbook)
+        refill()
+    return evaluated, logbook
+
+
 def add_extra_options(parser):
     parser.add_argument(
         "-t",
@@ -442,6 +960,25 @@ def add_extra_options(parser):
         default=None,
         help="Start with given live configs. Single json file or dir with multiple json files",
     )
+    parser.add_argument(
+        "--fitness_cache",
+        type=str,
+        required=False,
+        dest="fitness_cache",
+        default=None,
+        help="Preload the fitness cache with a _fitness_cache.json file of a previous run "
+        "with the same data and backtest settings. Requires optimize.fitness_cache",
+    )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        required=False,
+        dest="resume",
+        default=None,
+        help="Continue an interrupted optimization from its _checkpoint.pkl file. "
+        "The interrupted run's config is used instead of config_path and config options, "
+        "and its _fitness_cache.json file is loaded unless --fitness_cache is given",
+    )
 
 
 def extract_configs(path):
@@ -523,16 +1060,25 @@ async def main():
         level=logging.INFO,
         datefmt="%Y-%m-%dT%H:%M:%S",
     )
-    if args.config_path is None:
-        logging.info(f"loading default template config configs/template.json")
-        config = load_config("configs/template.json", verbose=False)
+    # created before loading a checkpoint, whose individuals are instances of these
+    creator.create("FitnessMulti", base.Fitness, weights=(-1.0, -1.0))  # Minimize both objectives
+    creator.create("Individual", list, fitness=creator.FitnessMulti)
+    checkpoint = None
+    if args.resume is not None:
+        logging.info(f"resuming from checkpoint {args.resume}")
+        checkpoint = load_checkpoint(args.resume)
+        config = checkpoint["config"]
     else:
-        logging.info(f"loading config {args.config_path}")
-        config = load_config(args.config_path, verbose=False)
-    old_config = deepcopy(config)
-    update_config_with_args(config, args)
-    config = format_config(config, verbose=False)
-    await add_all_eligible_coins_to_config(config)
+        if args.config_path is None:
+            logging.info(f"loading default template config configs/template.json")
+            config = load_config("configs/template.json", verbose=False)
+        else:
+            logging.info(f"loading config {args.config_path}")
+            config = load_config(args.config_path, verbose=False)
+        old_config = deepcopy(config)
+        update_config_with_args(config, args)
+        config = format_config(config, verbose=False)
+        await add_all_eligible_coins_to_config(config)
 
     try:
         # Prepare data for each exchange
@@ -540,6 +1086,9 @@ async def main():
         shared_memory_files = {}
         hlcvs_shapes = {}
         hlcvs_dtypes = {}
+        hlcvs_offsets = {}
+        mapped_cache_files = set()
+        hlcvs_windows = {}
         msss = {}
         config["backtest"]["coins"] = {}
         if config["backtest"]["combine_ohlcvs"]:
@@ -555,12 +1104,11 @@ async def main():
             hlcvs_shapes[exchange] = hlcvs.shape
             hlcvs_dtypes[exchange] = hlcvs.dtype
             msss[exchange] = mss
-            required_space = hlcvs.nbytes * 1.1  # Add 10% buffer
-            check_disk_space(tempfile.gettempdir(), required_space)
-            logging.info(f"Starting to create shared memory file for {exchange}...")
-            shared_memory_file = create_shared_memory_file(hlcvs)
-            shared_memory_files[exchange] = shared_memory_file
-            logging.info(f"Finished creating shared memory file for {exchange}: {shared_memory_file}")
+            shared_memory_files[exchange], hlcvs_offsets[exchange], is_cache = setup_hlcvs_file(
+                hlcvs, exchange
+            )
+            if is_cache:
+                mapped_cache_files.add(shared_memory_files[exchange])
         else:
             tasks = {}
             for exchange in config["backtest"]["exchanges"]:
@@ -572,14 +1120,11 @@ async def main():
                 hlcvs_shapes[exchange] = hlcvs.shape
                 hlcvs_dtypes[exchange] = hlcvs.dtype
                 msss[exchange] = mss
-                required_space = hlcvs.nbytes * 1.1  # Add 10% buffer
-                check_disk_space(tempfile.gettempdir(), required_space)
-                logging.info(f"Starting to create shared memory file for {exchange}...")
-                shared_memory_file = create_shared_memory_file(hlcvs)
-                shared_memory_files[exchange] = shared_memory_file
-                logging.info(
-                    f"Finished creating shared memory file for {exchange}: {shared_memory_file}"
+                shared_memory_files[exchange], hlcvs_offsets[exchange], is_cache = (
+                    setup_hlcvs_file(hlcvs, exchange)
                 )
+                if is_cache:
+                    mapped_cache_files.add(shared_memory_files[exchange])
 
         exchanges = config["backtest"]["exchanges"]
         exchanges_fname = "combined" if config["backtest"]["combine_ohlcvs"] else "_".join(exchanges)
@@ -596,9 +1141,12 @@ async def main():
                 / (1000 * 60 * 60 * 24)
             )
         )
-        config["results_filename"] = make_get_filepath(
-            f"optimize_results/{date_fname}_{exchanges_fname}_{n_days}days_{coins_fname}_{hash_snippet}_all_results.txt"
-        )
+        if checkpoint is None:
+            config["results_filename"] = make_get_filepath(
+                f"optimize_results/{date_fname}_{exchanges_fname}_{n_days}days_{coins_fname}_{hash_snippet}_all_results.txt"
+            )
+        else:
+            logging.info(f"appending results to {config['results_filename']}")
         # Create results queue and start manager process
         manager = multiprocessing.Manager()
         results_queue = manager.Queue()
@@ -609,14 +1157,74 @@ async def main():
         )
         writer_process.start()
 
+        # Write the most recent fractions of the hlcvs for multi fidelity evaluation
+        fidelities = sorted(set(config["optimize"]["multi_fidelity_windows"]))
+        if any(not 0.0 < fidelity < 1.0 for fidelity in fidelities):
+            raise ValueError(f"multi_fidelity_windows must be between 0.0 and 1.0: {fidelities}")
+        if fidelities and config["optimize"]["steady_state"]:
+            logging.warning(f"multi_fidelity_windows is not used with steady_state")
+            fidelities = []
+        for fidelity in fidelities:
+            hlcvs_windows[fidelity] = {}
+            for exchange, hlcvs in hlcvs_dict.items():
+                window = hlcvs[-max(1, int(round(len(hlcvs) * fidelity))) :]
+                logging.info(f"Creating {fidelity} fidelity hlcvs for {exchange}: {window.shape}")
+                hlcvs_windows[fidelity][exchange] = (
+                    create_shared_memory_file(window),
+                    window.shape,
+                )
+
         # Initialize evaluator with results queue
         evaluator = Evaluator(
-            shared_memory_files, hlcvs_shapes, hlcvs_dtypes, config, msss, results_queue
+            shared_memory_files,
+            hlcvs_shapes,
+            hlcvs_dtypes,
+            config,
+            msss,
+            results_queue,
+            hlcvs_offsets,
+            hlcvs_windows,
         )
 
+        if config["optimize"]["fitness_cache"]:
+            fitness_cache_context = {
+                "backtest": {
+                    k: config["backtest"][k]
+                    for k in [
+                        "start_date",
+                        "end_date",
+                        "exchanges",
+                        "combine_ohlcvs",
+                        "gap_tolerance_ohlcvs_minutes",
+                    ]
+                },
+                "minimum_coin_age_days": config["live"]["minimum_coin_age_days"],
+                "exchanges": {
+                    exchange: {
+                        "backtest_params": evaluator.backtest_params[exchange],
+                        "exchange_params": evaluator.exchange_params[exchange],
+                        "hlcvs_shape": list(hlcvs_shapes[exchange]),
+                        "hlcvs_dtype": str(hlcvs_dtypes[exchange]),
+                    }
+                    for exchange in evaluator.exchanges
+                },
+            }
+            evaluator.fitness_cache = FitnessCache(manager, fitness_cache_context)
+            fitness_cache_load_path = args.fitness_cache
+            if fitness_cache_load_path is None and checkpoint is not None:
+                # written next to the checkpoint by the interrupted run
+                fitness_cache_load_path = args.resume.replace(
+                    "_checkpoint.pkl", "_fitness_cache.json"
+                )
+                if not os.path.exists(fitness_cache_load_path):
+                    fitness_cache_load_path = None
+            if fitness_cache_load_path is not None:
+                n_loaded = evaluator.fitness_cache.load(fitness_cache_load_path)
+                logging.info(
+                    f"Loaded {n_loaded} fitness cache entries from {fitness_cache_load_path}"
+                )
+
         logging.info(f"Finished initializing evaluator...")
-        creator.create("FitnessMulti", base.Fitness, weights=(-1.0, -1.0))  # Minimize both objectives
-        creator.create("Individual", list, fitness=creator.FitnessMulti)
 
         toolbox = base.Toolbox()
 
@@ -638,8 +1246,8 @@ async def main():
         toolbox.register("individual", create_individual)
         toolbox.register("population", tools.initRepeat, list, toolbox.individual)
 
-        # Register the evaluation function
-        toolbox.register("evaluate", evaluator.evaluate)
+        # Register the evaluation function, run by the pool workers' evaluator
+        toolbox.register("evaluate", evaluate_in_pool_worker)
 
         # Register genetic operators
         toolbox.register(
@@ -661,16 +1269,26 @@ async def main():
 
         # Parallelization setup
         logging.info(f"Initializing multiprocessing pool. N cpus: {config['optimize']['n_cpus']}")
-        pool = multiprocessing.Pool(processes=config["optimize"]["n_cpus"])
-        toolbox.register("map", pool.map)
+        pool = multiprocessing.Pool(
+            processes=config["optimize"]["n_cpus"],
+            initializer=init_pool_worker,
+            initargs=(evaluator,),
+        )
+        if (batch_size := int(config["optimize"]["backtest_batch_size"])) > 1:
+            logging.info(f"Evaluating individuals in batches of {batch_size}")
+            toolbox.register("map", make_batched_map(pool, batch_size))
+        else:
+            toolbox.register("map", pool.map)
         logging.info(f"Finished initializing multiprocessing pool.")
 
         # Create initial population
         logging.info(f"Creating initial population...")
 
         bounds = [(low, high) for low, high in param_bounds.values()]
-        starting_individuals = configs_to_individuals(
-            get_starting_configs(args.starting_configs), param_bounds
+        starting_individuals = (
+            []
+            if checkpoint is not None
+            else configs_to_individuals(get_starting_configs(args.starting_configs), param_bounds)
         )
         if (nstart := len(starting_individuals)) > (popsize := config["optimize"]["population_size"]):
             logging.info(f"Number of starting configs greater than population size.")
@@ -700,26 +1318,104 @@ async def main():
         stats.register("std", np.std, axis=0)
         stats.register("min", np.min, axis=0)
         stats.register("max", np.max, axis=0)
+        if evaluator.fitness_cache is not None:
+            stats.register("cache_hits", evaluator.fitness_cache.report)
 
         logbook = tools.Logbook()
         logbook.header = "gen", "evals", "std", "min", "avg", "max"
 
         hof = tools.ParetoFront()
 
+        checkpoint_path = config["results_filename"].replace("_all_results.txt", "_checkpoint.pkl")
+        checkpoint_interval = int(config["optimize"]["checkpoint_interval"])
+        fitness_cache_path = config["results_filename"].replace(
+            "_all_results.txt", "_fitness_cache.json"
+        )
+
+        def write_checkpoint(progress, population, logbook):
+            # progress is the generation, or the number of evaluations if steady state
+            if checkpoint_interval <= 0 or len(logbook) % checkpoint_interval != 0:
+                return
+            try:
+                save_checkpoint(
+                    checkpoint_path,
+                    {
+                        "config": config,
+                        "progress": progress,
+                        "population": population,
+                        "halloffame": hof,
+                        "logbook": logbook,
+                    },
+                )
+            except Exception as e:
+                logging.error(f"Error writing checkpoint: {e}")
+            if evaluator.fitness_cache is not None:
+                # written with each checkpoint, so a resumed run starts with it
+                try:
+                    evaluator.fitness_cache.dump(fitness_cache_path)
+                except Exception as e:
+                    logging.error(f"Error writing fitness cache: {e}")
+
         # Run the optimization
         logging.info(f"Starting optimize...")
-        population, logbook = algorithms.eaMuPlusLambda(
-            population,
-            toolbox,
-            mu=config["optimize"]["population_size"],
-            lambda_=config["optimize"]["population_size"],
-            cxpb=config["optimize"]["crossover_probability"],
-            mutpb=config["optimize"]["mutation_probability"],
-            ngen=max(1, int(config["optimize"]["iters"] / len(population))),
-            stats=stats,
-            halloffame=hof,
-            verbose=True,
-        )
+        ngen = max(1, int(config["optimize"]["iters"] / len(population)))
+        resume_kwargs = {}
+        if checkpoint is not None:
+            population = checkpoint["population"]
+            hof = checkpoint["halloffame"]
+            resume_kwargs["logbook"] = checkpoint["logbook"]
+            progress_key = "n_done_start" if config["optimize"]["steady_state"] else "start_gen"
+            resume_kwargs[progress_key] = checkpoint["progress"]
+            restore_random_states(checkpoint)
+            logging.info(
+                f"Resuming with population of {len(population)} and Pareto front of {len(hof)} "
+                f"after {'evaluation' if config['optimize']['steady_state'] else 'generation'} "
+                f"{checkpoint['progress']}"
+            )
+        if checkpoint_interval > 0:
+            logging.info(f"Writing checkpoints to {checkpoint_path}")
+        if config["optimize"]["steady_state"]:
+            logging.info(f"Using asynchronous steady state evolution")
+            population, logbook = steady_state_nsga2(
+                population,
+                toolbox,
+                pool,
+                mu=config["optimize"]["population_size"],
+                cxpb=config["optimize"]["crossover_probability"],
+                mutpb=config["optimize"]["mutation_probability"],
+                # same number of evaluations as eaMuPlusLambda
+                n_evals=len(population) + ngen * config["optimize"]["population_size"],
+                # keep every worker busy while the main process varies new offspring
+                n_in_flight=2 * config["optimize"]["n_cpus"] * max(1, batch_size),
+                batch_size=max(1, batch_size),
+                stats=stats,
+                halloffame=hof,
+                verbose=True,
+                checkpoint=write_checkpoint,
+                **resume_kwargs,
+            )
+        else:
+            if fidelities:
+                logging.info(
+                    f"Evaluating offspring by successive halving on the most recent "
+                    f"{', '.join(map(str, fidelities))} of the data"
+                )
+            population, logbook = ea_mu_plus_lambda(
+                population,
+                toolbox,
+                mu=config["optimize"]["population_size"],
+                lambda_=config["optimize"]["population_size"],
+                cxpb=config["optimize"]["crossover_probability"],
+                mutpb=config["optimize"]["mutation_probability"],
+                ngen=ngen,
+                stats=stats,
+                halloffame=hof,
+                verbose=True,
+                checkpoint=write_checkpoint,
+                fidelities=fidelities,
+                keep_fraction=config["optimize"]["multi_fidelity_keep"],
+                **resume_kwargs,
+            )
 
         # Print statistics
         print(logbook)
@@ -741,6 +1437,13 @@ async def main():
         logging.error(f"An error occurred: {e}")
         traceback.print_exc()
     finally:
+        # written first, while the manager holding the entries is still up
+        if "fitness_cache_path" in locals() and evaluator.fitness_cache is not None:
+            logging.info(f"Writing fitness cache to {fitness_cache_path}")
+            try:
+                evaluator.fitness_cache.dump(fitness_cache_path)
+            except Exception as e:
+                logging.error(f"Error writing fitness cache: {e}")
         # Signal the writer process to shut down and wait for it
         if "results_queue" in locals():
             results_queue.put("DONE")
@@ -751,8 +1454,11 @@ async def main():
             pool.terminate()
             pool.join()
 
-        # Remove shared memory files
-        for shared_memory_file in shared_memory_files.values():
+        # Remove shared memory files, leaving caches mapped in place
+        window_files = [path for windows in hlcvs_windows.values() for path, _ in windows.values()]
+        for shared_memory_file in list(shared_memory_files.values()) + window_files:
+            if shared_memory_file in mapped_cache_files:
+                continue
             if shared_memory_file and os.path.exists(shared_memory_file):
                 logging.info(f"Removing shared memory file: {shared_memory_file}")
                 try:
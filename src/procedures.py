@@ -1573,6 +1573,9 @@ def add_arguments_recursively(parser, config, prefix="", acronyms=set()):
             type_ = type(value)
             if "bounds" in full_name:
                 type_ = comma_separated_values_float
+            elif "multi_fidelity_windows" in full_name:
+                type_ = comma_separated_values_float
+                appendix = "Example: 0.1,0.3"
             elif "approved_coins" in full_name:
                 acronym = "s"
                 type_ = comma_separated_values
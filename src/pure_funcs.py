@@ -509,8 +509,11 @@ def get_template_live_config(passivbot_mode="v7"):
                 "combine_ohlcvs": True,
                 "compress_cache": True,
                 "end_date": "now",
+                "equity_sampling": "minute",
                 "exchanges": ["binance", "bybit", "gateio", "bitget"],
                 "gap_tolerance_ohlcvs_minutes": 120.0,
+                "hlcvs_dtype": "float64",
+                "mmap_cache": False,
                 "start_date": "2021-04-01",
                 "starting_balance": 100000.0,
             },
@@ -648,8 +651,14 @@ def get_template_live_config(passivbot_mode="v7"):
                     "short_unstuck_loss_allowance_pct": [0.001, 0.05],
                     "short_unstuck_threshold": [0.4, 0.95],
                 },
+                "abort_drawdown_worst": 0.0,
+                "abort_equity_balance_diff_neg_max": 0.0,
+                "abort_equity_floor": 0.0,
+                "backtest_batch_size": 1,
+                "checkpoint_interval": 1,
                 "compress_results_file": True,
                 "crossover_probability": 0.7,
+                "fitness_cache": False,
                 "iters": 30000,
                 "limits": {
                     "lower_bound_drawdown_worst": 0.25,
@@ -661,10 +670,14 @@ def get_template_live_config(passivbot_mode="v7"):
                     "lower_bound_loss_profit_ratio": 0.6,
                     "lower_bound_position_held_hours_max": 336.0,
                 },
+                "multi_fidelity_keep": 0.33,
+                "multi_fidelity_windows": [],
                 "mutation_probability": 0.2,
                 "n_cpus": 5,
+                "parallel_exchanges": False,
                 "population_size": 500,
                 "scoring": ["adg", "sharpe_ratio"],
+                "steady_state": False,
             },
         }
     elif passivbot_mode == "multi_hjson":
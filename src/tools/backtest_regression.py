@@ -0,0 +1,333 @@
+"""
+Checks that the Rust backtester reproduces reference fills, equities and analyses bit for bit.
+
+A fixed set of backtests on deterministic synthetic data, chosen to exercise coin selection,
+grid and trailing orders, unstucking and coins listed late or delisted early, is run with the
+installed passivbot_rust. Every fill column and the equity curve are reduced to sha256 digests of
+their bytes, and analysis values are kept exactly.
+
+To write the reference from an engine built at another commit, e.g. 90dfca5, the last commit
+before position and order state moved to dense coin indexed arrays:
+
+    git worktree add /tmp/passivbot_ref 90dfca5
+    (cd /tmp/passivbot_ref/passivbot-rust && maturin develop --release)
+    python3 src/tools/backtest_regression.py --write
+
+then rebuild the engine of this tree and compare with
+
+    python3 src/tools/backtest_regression.py
+
+Exits with status 1 if any backtest differs from the reference. Analysis keys missing from
+either side, e.g. added by a later version, are listed but not counted as differences.
+
+Analyses are compared value by value, so a reference written from an engine that computed the
+analysis from collected fills and equities, e.g. ebdc514, the commit before analyses were
+accumulated while the backtest runs, checks that no analysis value changed with the
+accumulators. When comparing, every case's analysis from run_backtest_analysis, which keeps no
+fills or equities, must also equal the one from run_backtest.
+
+Comparing also runs a backtest with abort_equity_floor at the starting balance, which any loss
+breaches, and checks that it stops at the first minute of equity below the floor with aborted
+set, and that the optimizer gives it the aborted fitness penalty. It is not part of the
+reference, as engines older than the abort thresholds ignore them.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from copy import deepcopy
+
+import numpy as np
+
+# Ensure modules from the parent directory are discoverable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import passivbot_rust as pbr
+from pure_funcs import get_template_live_config
+from backtest import prep_backtest_args, create_shared_memory_file
+from optimize import Evaluator
+from tools.synthetic_data import make_synthetic_hlcvs
+
+DEFAULT_REFERENCE_PATH = os.path.join(
+    os.path.dirname(__file__), "backtest_regression_reference.json"
+)
+N_COINS = 12
+N_DAYS = 60
+PRICE_STEP = 0.001
+QTY_STEP = 0.001
+
+
+def make_hlcvs():
+    """
+    Synthetic hlcvs rounded to price and qty steps. Two coins are listed late and one is delisted
+    early; outside their data range they are filled with their first or last close and zero
+    volume, the way the downloader fills the unified array.
+    """
+    hlcvs = make_synthetic_hlcvs(N_COINS, N_DAYS, seed=42)
+    hlcvs[:, :, :3] = np.round(hlcvs[:, :, :3] / PRICE_STEP) * PRICE_STEP
+    hlcvs[:, :, 3] = np.round(hlcvs[:, :, 3] / QTY_STEP) * QTY_STEP
+    n_minutes = len(hlcvs)
+    for coin_idx, start_idx in [(3, n_minutes // 4), (7, n_minutes // 2)]:
+        hlcvs[:start_idx, coin_idx, :3] = hlcvs[start_idx, coin_idx, 2]
+        hlcvs[:start_idx, coin_idx, 3] = 0.0
+    end_idx = n_minutes * 2 // 3
+    hlcvs[end_idx:, 5, :3] = hlcvs[end_idx - 1, 5, 2]
+    hlcvs[end_idx:, 5, 3] = 0.0
+    return hlcvs
+
+
+def make_cases():
+    """Returns {name: config} of the backtests to compare."""
+    template = get_template_live_config("v7")
+    template["backtest"]["coins"] = {"synthetic": [f"COIN{i}" for i in range(N_COINS)]}
+    template["backtest"]["starting_balance"] = 10000.0
+    cases = {}
+
+    # forager: fewer positions than coins, both sides
+    config = deepcopy(template)
+    for pside in ["long", "short"]:
+        config["bot"][pside]["n_positions"] = 4.0
+        config["bot"][pside]["filter_rolling_window"] = 1440.0
+    cases["forager"] = config
+
+    # every coin traded, grid orders only
+    config = deepcopy(template)
+    for pside in ["long", "short"]:
+        config["bot"][pside]["n_positions"] = float(N_COINS)
+        config["bot"][pside]["entry_trailing_grid_ratio"] = 0.0
+        config["bot"][pside]["close_trailing_grid_ratio"] = 0.0
+    cases["grid_all_coins"] = config
+
+    # trailing orders only
+    config = deepcopy(template)
+    for pside in ["long", "short"]:
+        config["bot"][pside]["n_positions"] = 6.0
+        config["bot"][pside]["entry_trailing_grid_ratio"] = 1.0
+        config["bot"][pside]["close_trailing_grid_ratio"] = 1.0
+        config["bot"][pside]["entry_trailing_threshold_pct"] = 0.005
+        config["bot"][pside]["close_trailing_threshold_pct"] = 0.005
+    cases["trailing"] = config
+
+    # long only, quickly stuck and unstucking
+    config = deepcopy(template)
+    config["bot"]["short"]["total_wallet_exposure_limit"] = 0.0
+    config["bot"]["long"]["n_positions"] = 3.0
+    config["bot"]["long"]["total_wallet_exposure_limit"] = 0.9
+    config["bot"]["long"]["entry_initial_qty_pct"] = 0.05
+    config["bot"]["long"]["entry_grid_spacing_pct"] = 0.01
+    config["bot"]["long"]["unstuck_threshold"] = 0.4
+    config["bot"]["long"]["unstuck_close_pct"] = 0.01
+    config["bot"]["long"]["unstuck_loss_allowance_pct"] = 0.05
+    cases["long_unstuck"] = config
+    return cases
+
+
+def digest(arr) -> str:
+    arr = np.ascontiguousarray(arr)
+    return hashlib.sha256(arr.dtype.str.encode() + arr.tobytes()).hexdigest()
+
+
+def equal_values(value, other) -> bool:
+    return value == other or (np.isnan(value) and np.isnan(other))
+
+
+def prep_args(shared_memory_file, hlcvs, mss, config) -> tuple:
+    """Positional args of pbr.run_backtest and pbr.run_backtest_analysis."""
+    bot_params, exchange_params, backtest_params = prep_backtest_args(config, mss, "synthetic")
+    # as in optimize.Evaluator; 0.0 disables them
+    for key in ["abort_drawdown_worst", "abort_equity_balance_diff_neg_max", "abort_equity_floor"]:
+        backtest_params[key] = config["optimize"][key]
+    return (
+        shared_memory_file,
+        hlcvs.shape,
+        hlcvs.dtype.str,
+        bot_params,
+        exchange_params,
+        backtest_params,
+    )
+
+
+def run_backtest(shared_memory_file, hlcvs, mss, config):
+    """Returns fills, per minute equities and analysis."""
+    fills, equities, analysis = pbr.run_backtest(*prep_args(shared_memory_file, hlcvs, mss, config))
+    # a dict of sampled columns since equity_sampling, a plain array of per minute equities before
+    equity = equities["equity"] if isinstance(equities, dict) else equities
+    return fills, np.asarray(equity, dtype=np.float64), analysis
+
+
+def run_case(shared_memory_file, hlcvs, mss, config) -> dict:
+    fills, equity, analysis = run_backtest(shared_memory_file, hlcvs, mss, config)
+    return {
+        "n_fills": len(next(iter(fills.values()))) if fills else 0,
+        "fills": {key: digest(values) for key, values in sorted(fills.items())},
+        "equity": digest(equity),
+        "analysis": {key: float(value) for key, value in sorted(analysis.items())},
+    }
+
+
+def check_analysis_only(shared_memory_file, hlcvs, mss, name, config, analysis) -> bool:
+    """
+    Prints whether run_backtest_analysis gives the same analysis as run_backtest, given as
+    analysis. Returns True if it does.
+    """
+    analysis_only = pbr.run_backtest_analysis(*prep_args(shared_memory_file, hlcvs, mss, config))
+    diffs = []
+    for key in sorted(set(analysis) | set(analysis_only)):
+        if key not in analysis or key not in analysis_only:
+            diffs.append(
+                f"analysis {key} only in run_backtest{'' if key in analysis else '_analysis'}"
+            )
+        elif not equal_values(analysis[key], float(analysis_only[key])):
+            diffs.append(f"analysis {key} {analysis[key]!r} -> {float(analysis_only[key])!r}")
+    if diffs:
+        print(f"{name}: run_backtest_analysis differs from run_backtest")
+        for line in diffs:
+            print(f"    {line}")
+    return not diffs
+
+
+def make_abort_case():
+    """A config whose backtest is aborted as soon as equity is below the starting balance."""
+    config = get_template_live_config("v7")
+    config["backtest"]["coins"] = {"synthetic": [f"COIN{i}" for i in range(N_COINS)]}
+    config["backtest"]["starting_balance"] = 10000.0
+    config["backtest"]["equity_sampling"] = "minute"
+    config["bot"]["short"]["total_wallet_exposure_limit"] = 0.0
+    config["bot"]["long"]["n_positions"] = 3.0
+    config["bot"]["long"]["total_wallet_exposure_limit"] = 1.5
+    config["optimize"]["abort_equity_floor"] = 1.0
+    return config
+
+
+def check_abort(shared_memory_file, hlcvs, mss) -> bool:
+    """
+    Runs the abort case and prints whether it stopped at its first breach of the equity floor
+    with aborted set and got the aborted fitness penalty. Returns True if it did.
+    """
+    config = make_abort_case()
+    fills, equity, analysis = run_backtest(shared_memory_file, hlcvs, mss, config)
+    floor = config["optimize"]["abort_equity_floor"] * config["backtest"]["starting_balance"]
+    errors = []
+    if not analysis["aborted"]:
+        errors.append("analysis aborted is not set")
+    # a complete backtest has an equity for each minute but the last
+    if len(equity) >= len(hlcvs) - 1:
+        errors.append(f"ran to the end, {len(equity)} equities")
+    if not equity[-1] < floor:
+        errors.append(f"last equity {equity[-1]} is not below the floor {floor}")
+    if (equity[:-1] < floor).any():
+        errors.append(f"equity was below the floor {floor} before the last minute")
+    # combine_analyses and calc_fitness only read the config
+    evaluator = Evaluator.__new__(Evaluator)
+    evaluator.config = config
+    analyses_combined = evaluator.combine_analyses({"synthetic": analysis})
+    w_0, w_1 = evaluator.calc_fitness(analyses_combined)
+    if not analyses_combined["aborted_max"]:
+        errors.append("aborted_max is not set")
+    # the penalty of an aborted backtest exceeds the modifier of any completed one
+    penalty = 10 ** (len(config["optimize"]["limits"]) + 1)
+    if not (w_0 >= penalty and w_1 >= penalty):
+        errors.append(f"fitness {w_0}, {w_1} lacks the aborted penalty")
+    print(
+        f"abort_equity_floor: {'aborted' if not errors else 'failed'} at minute "
+        f"{len(equity) - 1} of {len(hlcvs) - 1} ({len(next(iter(fills.values()), []))} fills)"
+    )
+    for line in errors:
+        print(f"    {line}")
+    return not errors
+
+
+def compare(name, reference, result) -> bool:
+    """Prints the differences of one backtest. Returns True if it matches the reference."""
+    diffs = []
+    if result["n_fills"] != reference["n_fills"]:
+        diffs.append(f"n_fills {reference['n_fills']} -> {result['n_fills']}")
+    for key in sorted(set(reference["fills"]) | set(result["fills"])):
+        if reference["fills"].get(key) != result["fills"].get(key):
+            diffs.append(f"fills column {key} differs")
+    if result["equity"] != reference["equity"]:
+        diffs.append("equity differs")
+    notes = []
+    for key in sorted(set(reference["analysis"]) | set(result["analysis"])):
+        if key not in result["analysis"] or key not in reference["analysis"]:
+            notes.append(key)
+            continue
+        ref_value, value = reference["analysis"][key], result["analysis"][key]
+        if not equal_values(ref_value, value):
+            diffs.append(f"analysis {key} {ref_value!r} -> {value!r}")
+    print(f"{name}: {'differs' if diffs else 'identical'} ({result['n_fills']} fills)")
+    for line in diffs:
+        print(f"    {line}")
+    if notes:
+        print(f"    analysis keys in only one of reference and result: {', '.join(notes)}")
+    return not diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="backtest_regression",
+        description="compare backtest fills, equities and analyses with a reference",
+    )
+    parser.add_argument(
+        "reference",
+        type=str,
+        nargs="?",
+        default=DEFAULT_REFERENCE_PATH,
+        help=f"reference json file. Default: {DEFAULT_REFERENCE_PATH}",
+    )
+    parser.add_argument(
+        "--write",
+        action="store_true",
+        help="write the results of the installed engine as the reference instead of comparing",
+    )
+    args = parser.parse_args()
+
+    hlcvs = make_hlcvs()
+    coins = [f"COIN{i}" for i in range(N_COINS)]
+    mss = {
+        coin: {
+            "qty_step": QTY_STEP,
+            "price_step": PRICE_STEP,
+            "min_qty": QTY_STEP,
+            "min_cost": 5.0,
+            "c_mult": 1.0,
+            "maker": 0.0002,
+        }
+        for coin in coins
+    }
+    results = {}
+    with create_shared_memory_file(hlcvs) as shared_memory_file:
+        for name, config in make_cases().items():
+            results[name] = run_case(shared_memory_file, hlcvs, mss, config)
+        consistent = args.write or all(
+            [
+                check_analysis_only(
+                    shared_memory_file, hlcvs, mss, name, config, results[name]["analysis"]
+                )
+                for name, config in make_cases().items()
+            ]
+        )
+        aborted_correctly = args.write or check_abort(shared_memory_file, hlcvs, mss)
+
+    if args.write:
+        json.dump(results, open(args.reference, "w"), indent=4, sort_keys=True)
+        print(f"wrote reference of {len(results)} backtests to {args.reference}")
+        return
+    if not os.path.exists(args.reference):
+        print(f"reference {args.reference} not found; write it with --write, see {__file__}")
+        sys.exit(2)
+    reference = json.load(open(args.reference))
+    identical = consistent and aborted_correctly
+    for name in sorted(set(reference) | set(results)):
+        if name not in reference or name not in results:
+            print(f"{name}: missing from {'reference' if name not in reference else 'results'}")
+            identical = False
+            continue
+        identical &= compare(name, reference[name], results[name])
+    sys.exit(0 if identical else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import sys
+import gzip
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+# Ensure modules from the parent directory are discoverable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from hlcvs_cache import BLOCKS_FNAME, save_hlcvs_blocks, load_hlcvs_blocks
+from tools.synthetic_data import make_synthetic_hlcvs
+
+
+def timed(func):
+    sts = time.time()
+    result = func()
+    return time.time() - sts, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="benchmark_hlcvs_cache",
+        description="compare the gzip and block compressed hlcvs cache formats",
+    )
+    parser.add_argument("--n_coins", type=int, default=100, help="number of synthetic coins")
+    parser.add_argument("--n_days", type=int, default=365, help="number of days of 1m data")
+    parser.add_argument("--n_threads", type=int, default=None, help="block (de)compress threads")
+    args = parser.parse_args()
+
+    print(f"generating {args.n_days} days of synthetic data for {args.n_coins} coins...")
+    hlcvs = make_synthetic_hlcvs(args.n_coins, args.n_days)
+    # exchange prices and base volumes are rounded to price and qty steps, and the downloader
+    # converts volumes to quote volumes
+    hlcvs[:, :, :3] = np.round(hlcvs[:, :, :3], 3)
+    hlcvs[:, :, 3] = np.round(hlcvs[:, :, 3] / hlcvs[:, :, 2]) * hlcvs[:, :, 2]
+    coins = [f"COIN{i}" for i in range(args.n_coins)]
+    first_timestamp = 1_600_000_000_000
+    print(f"uncompressed: {hlcvs.nbytes / 1024**2:.1f} MB")
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        gz_fpath = os.path.join(tmpdir, "hlcvs.npy.gz")
+
+        def save_gzip():
+            with gzip.open(gz_fpath, "wb", compresslevel=1) as f:
+                np.save(f, hlcvs)
+
+        def load_gzip():
+            with gzip.open(gz_fpath, "rb") as f:
+                return np.load(f)
+
+        save_secs, _ = timed(save_gzip)
+        load_secs, loaded = timed(load_gzip)
+        assert np.array_equal(loaded, hlcvs)
+        size = os.path.getsize(gz_fpath)
+        print(
+            f"  gzip: {size / 1024**2:8.1f} MB ({size / hlcvs.nbytes:.1%}), "
+            f"save {save_secs:.3f}s, load {load_secs:.3f}s"
+        )
+
+        save_secs, _ = timed(
+            lambda: save_hlcvs_blocks(
+                tmpdir, hlcvs, coins, first_timestamp, n_threads=args.n_threads
+            )
+        )
+        load_secs, (_, _, loaded) = timed(
+            lambda: load_hlcvs_blocks(tmpdir, n_threads=args.n_threads)
+        )
+        assert np.array_equal(loaded, hlcvs)
+        size = os.path.getsize(os.path.join(tmpdir, BLOCKS_FNAME))
+        print(
+            f"blocks: {size / 1024**2:8.1f} MB ({size / hlcvs.nbytes:.1%}), "
+            f"save {save_secs:.3f}s, load {load_secs:.3f}s"
+        )
+
+        # last 90 days of a tenth of the coins
+        subset = coins[:: max(1, args.n_coins // 10)]
+        start_ts = first_timestamp + max(0, len(hlcvs) - 90 * 1440) * 60_000
+        partial_secs, (_, timestamps, partial) = timed(
+            lambda: load_hlcvs_blocks(
+                tmpdir, coins=subset, start_ts=start_ts, n_threads=args.n_threads
+            )
+        )
+        idxs = [coins.index(coin) for coin in subset]
+        assert np.array_equal(partial, hlcvs[-len(timestamps) :, idxs])
+        print(f"blocks: load {len(subset)} coins x 90 days {partial_secs:.3f}s")
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Ensure modules from the parent directory are discoverable
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ohlcv_utils import ensure_millis, ensure_millis_array, deduplicate_rows, merge_ohlcv_arrays
+
+COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+
+def deduplicate_rows_tuples(arr):
+    """The previous deduplicate_rows, for reference."""
+    seen = set()
+    unique_indices = [
+        i
+        for i, row_tuple in enumerate(map(tuple, arr))
+        if not (row_tuple in seen or seen.add(row_tuple))
+    ]
+    return arr[unique_indices]
+
+
+def load_dir_pandas(fpaths):
+    """The previous per file loading and pandas concat, drop_duplicates and sort."""
+    dfs = []
+    for fpath in fpaths:
+        arr = deduplicate_rows_tuples(np.load(fpath, allow_pickle=True))
+        dfs.append(ensure_millis(pd.DataFrame(arr, columns=COLUMNS)))
+    return (
+        pd.concat(dfs).drop_duplicates("timestamp").sort_values("timestamp").reset_index(drop=True)
+    )
+
+
+def load_ohlcv_array_readonly(fpath):
+    """load_ohlcv_array without overwriting files with duplicate rows, so every repeat dedups."""
+    return ensure_millis_array(deduplicate_rows(np.load(fpath, allow_pickle=True)).astype(float))
+
+
+def load_dir_numpy(fpaths):
+    arr = merge_ohlcv_arrays([load_ohlcv_array_readonly(fpath) for fpath in fpaths])
+    return pd.DataFrame(arr, columns=COLUMNS)
+
+
+def make_synthetic_coin_dir(dirpath, n_days, n_duplicates=0, seed=0):
+    """
+    One .npy file of 1440 1m ohlcvs per day, like historical_data/ohlcvs_{exchange}/{coin}.
+    With n_duplicates, that many random rows of each day are appended again out of order, so
+    deduplication and merging can't take their already sorted shortcuts.
+    """
+    rng = np.random.default_rng(seed)
+    start_ts = 1_577_836_800_000  # 2020-01-01
+    close = 100.0
+    for day in range(n_days):
+        timestamps = start_ts + (day * 1440 + np.arange(1440)) * 60_000
+        closes = close * np.exp(np.cumsum(rng.normal(0.0, 0.001, 1440)))
+        close = closes[-1]
+        arr = np.column_stack(
+            [
+                timestamps,
+                closes,
+                closes * 1.001,
+                closes * 0.999,
+                closes,
+                rng.lognormal(10.0, 1.0, 1440),
+            ]
+        ).astype(float)
+        if n_duplicates:
+            arr = np.concatenate([arr, arr[rng.integers(0, 1440, n_duplicates)]])
+        date = pd.Timestamp(timestamps[0], unit="ms").strftime("%Y-%m-%d")
+        np.save(os.path.join(dirpath, date + ".npy"), arr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="benchmark_ohlcv_loading",
+        description="compare loading a coin's daily ohlcv files with pandas and with numpy",
+    )
+    parser.add_argument(
+        "coin_dir",
+        type=str,
+        nargs="?",
+        default=None,
+        help="dir of daily .npy files, e.g. historical_data/ohlcvs_binanceusdm/BTC. "
+        "Default: synthetic dir",
+    )
+    parser.add_argument("--n_days", type=int, default=5 * 365, help="days of synthetic data")
+    parser.add_argument(
+        "--n_duplicates",
+        type=int,
+        default=0,
+        help="rows of each synthetic day repeated out of order",
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="loads per method")
+    args = parser.parse_args()
+
+    tmpdir = None
+    coin_dir = args.coin_dir
+    if coin_dir is None:
+        tmpdir = coin_dir = tempfile.mkdtemp()
+        print(f"generating {args.n_days} daily files of synthetic data...")
+        make_synthetic_coin_dir(tmpdir, args.n_days, args.n_duplicates)
+    try:
+        fpaths = sorted(
+            os.path.join(coin_dir, f) for f in os.listdir(coin_dir) if f.endswith(".npy")
+        )
+        print(f"{len(fpaths)} files in {coin_dir}")
+        results, best_secs = {}, {}
+        for label, func in [("pandas", load_dir_pandas), ("numpy", load_dir_numpy)]:
+            secs = []
+            for _ in range(args.repeats):
+                sts = time.time()
+                results[label] = func(fpaths)
+                secs.append(time.time() - sts)
+            best_secs[label] = min(secs)
+            print(
+                f"{label:>6}: best of {args.repeats} {best_secs[label]:.3f}s, "
+                f"{len(results[label])} rows"
+            )
+        print(f"speedup: {best_secs['pandas'] / best_secs['numpy']:.2f}x")
+        if not np.array_equal(results["pandas"].values, results["numpy"].values):
+            print("warning: results differ")
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -186,6 +186,10 @@ def process_single(file_location: str, verbose: bool = False):
         if not x:
             continue
 
+        # Skip entries backtested on part of the data only (multi fidelity optimization)
+        if x.get("fidelity", 1.0) < 1.0:
+            continue
+
         # Determine the analysis key/prefix if not yet known
         if analysis_prefix is None:
             if "analyses_combined" in x:
@@ -0,0 +1,22 @@
+"""
+Synthetic market data for the benchmarks in src/tools. Depends on numpy only, so benchmarks of
+pure python code can run without the compiled passivbot_rust extension.
+"""
+
+import numpy as np
+
+
+def make_synthetic_hlcvs(n_coins: int, n_days: int, seed: int = 0):
+    """
+    Random walk 1m OHLCVs with shape (timesteps, coins, 4), columns high, low, close, volume.
+    """
+    rng = np.random.default_rng(seed)
+    n_minutes = n_days * 1440
+    closes = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.001, (n_minutes, n_coins)), axis=0))
+    spreads = np.abs(rng.normal(0.0, 0.0015, (n_minutes, n_coins, 2)))
+    hlcvs = np.empty((n_minutes, n_coins, 4), dtype=np.float64)
+    hlcvs[:, :, 0] = closes * (1.0 + spreads[:, :, 0])
+    hlcvs[:, :, 1] = closes * (1.0 - spreads[:, :, 1])
+    hlcvs[:, :, 2] = closes
+    hlcvs[:, :, 3] = rng.lognormal(10.0, 1.0, (n_minutes, n_coins))
+    return hlcvs